@@ -0,0 +1,139 @@
+import bisect
+import re
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.utils import timezone
+
+from .changes import ANNOTATION, record_changes, recording_changes
+from .models import Annotation
+from .recogito import RECOGITO_FIELDS, compact_recogito
+from .versions import bumping_versions
+
+# The edited part of a text is diffed by words, punctuation and whitespace runs
+_RE_TOKEN = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+def _common_prefix(a, b, limit):
+    # binary search over slice comparisons, which run in C
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a, b, limit):
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle :] == b[len(b) - middle :]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _token_offsets(text, start, end):
+    tokens, offsets = [], []
+    for match in _RE_TOKEN.finditer(text, start, end):
+        tokens.append(match.group())
+        offsets.append(match.start())
+    offsets.append(end)
+    return tokens, offsets
+
+
+def text_edits(old, new):
+    """
+    Regions of `old` kept unchanged in `new`, as (start, end, shift) blocks
+    ordered by start: old[start:end] == new[start + shift:end + shift].
+    Only what lies between the common prefix and suffix is diffed, so the
+    cost follows the size of the edit rather than of the text.
+    """
+    prefix = _common_prefix(old, new, min(len(old), len(new)))
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_tokens, old_offsets = _token_offsets(old, prefix, len(old) - suffix)
+    new_tokens, new_offsets = _token_offsets(new, prefix, len(new) - suffix)
+
+    candidates = [(0, prefix, 0)]
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for i, j, size in matcher.get_matching_blocks():
+        start = old_offsets[i]
+        candidates.append((start, old_offsets[i + size], new_offsets[j] - start))
+    candidates.append((len(old) - suffix, len(old), len(new) - len(old)))
+
+    blocks = []
+    for start, end, shift in candidates:
+        if start == end:
+            continue
+        if blocks and blocks[-1][1] == start and blocks[-1][2] == shift:
+            # contiguous in both texts, an annotation may span them
+            blocks[-1] = (blocks[-1][0], end, shift)
+        else:
+            blocks.append((start, end, shift))
+    return blocks
+
+
+def _range_shift(blocks, starts, start, end):
+    i = bisect.bisect_right(starts, start) - 1
+    if i >= 0 and end <= blocks[i][1]:
+        return blocks[i][2]
+    return None
+
+
+def _shift_selectors(payload, shift):
+    target = payload.get("target") if isinstance(payload, dict) else None
+    selectors = target.get("selector") if isinstance(target, dict) else None
+    for selector in selectors if isinstance(selectors, list) else []:
+        if (
+            isinstance(selector, dict)
+            and selector.get("type") == "TextPositionSelector"
+        ):
+            for key in ("start", "end"):
+                if isinstance(selector.get(key), int):
+                    selector[key] += shift
+
+
+def reanchor_annotations(document_id, old_text, new_text):
+    """
+    Move the annotations of a document whose text changed from `old_text` to
+    `new_text`: annotations inside unchanged regions get their offsets and
+    Recogito selectors shifted, those overlapping an edit are deleted.
+    Annotations before the first edit are not read. Returns (shifted, deleted).
+    """
+    blocks = text_edits(old_text, new_text)
+    starts = [block[0] for block in blocks]
+    # end of the unchanged start of the text
+    unchanged = blocks[0][1] if blocks and blocks[0][0] == blocks[0][2] == 0 else 0
+
+    shifted, deleted = [], []
+    now = timezone.now()
+    annotations = Annotation.objects.filter(
+        document_id=document_id, end__gt=unchanged
+    ).only(*RECOGITO_FIELDS, "json_data", "document")
+    for annotation in annotations:
+        shift = _range_shift(blocks, starts, annotation.start, annotation.end)
+        if shift is None:
+            deleted.append(annotation.pk)
+        elif shift:
+            payload = annotation.to_recogito()
+            _shift_selectors(payload, shift)
+            annotation.start += shift
+            annotation.end += shift
+            annotation.json_data = compact_recogito(
+                annotation.recogito_fields(), payload
+            )
+            annotation.updated_at = now
+            shifted.append(annotation)
+
+    # bulk_update does not log the change, the deletions are logged by the signals
+    with transaction.atomic(savepoint=False), recording_changes(), bumping_versions():
+        Annotation.objects.bulk_update(
+            shifted, ["start", "end", "json_data", "updated_at"]
+        )
+        record_changes(ANNOTATION, [annotation.pk for annotation in shifted])
+        Annotation.objects.filter(pk__in=deleted).delete()
+    return len(shifted), len(deleted)
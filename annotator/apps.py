@@ -1,6 +1,36 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
 
 
 class AnnotatorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "annotator"
+
+    def ready(self):
+        from .search import install_search_index
+        from .signals import (
+            bump_annotation_version,
+            bump_document_version,
+            record_annotation_change,
+            record_document_change,
+            remember_document_statistics,
+            remove_document_statistics,
+            update_document_statistics,
+        )
+
+        post_migrate.connect(install_search_index, sender=self)
+
+        Document = self.get_model("Document")
+        pre_save.connect(remember_document_statistics, sender=Document)
+        post_save.connect(update_document_statistics, sender=Document)
+        post_delete.connect(remove_document_statistics, sender=Document)
+        post_save.connect(bump_document_version, sender=Document)
+        post_delete.connect(bump_document_version, sender=Document)
+        post_save.connect(record_document_change, sender=Document)
+        post_delete.connect(record_document_change, sender=Document)
+
+        Annotation = self.get_model("Annotation")
+        post_save.connect(bump_annotation_version, sender=Annotation)
+        post_delete.connect(bump_annotation_version, sender=Annotation)
+        post_save.connect(record_annotation_change, sender=Annotation)
+        post_delete.connect(record_annotation_change, sender=Annotation)
@@ -0,0 +1,63 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .changes import ANNOTATION, DOCUMENT, record_changes, recording_changes
+from .models import Annotation, Document, normalize_text
+from .statistics import STATISTICS_FIELDS, apply_statistic_deltas, statistic_deltas
+from .versions import DOCUMENTS_VERSION, bump_versions
+
+BULK_BATCH_SIZE = 1000
+
+
+def bulk_create_documents(documents, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert documents with bulk_create, doing what Document.save and the save
+    signals would do for every document: normalize the text, compute the
+    dominant justification, update the statistics counters, log the change
+    and invalidate the cached statistics. A created_at set on the documents
+    is kept, e.g. for generated corpora.
+    """
+    for document in documents:
+        document.text = normalize_text(document.text)
+        document.dominant_justification = document.calculate_dominant_justification()
+    # auto_now_add replaces the value on insert, it is written back afterwards
+    explicit = [
+        (document, document.created_at)
+        for document in documents
+        if document.created_at is not None
+    ]
+
+    with transaction.atomic(), recording_changes():
+        created = Document.objects.bulk_create(documents, batch_size=batch_size)
+        if explicit:
+            for document, created_at in explicit:
+                document.created_at = created_at
+            Document.objects.bulk_update(
+                [document for document, _ in explicit],
+                ["created_at"],
+                batch_size=batch_size,
+            )
+        record_changes(DOCUMENT, [document.pk for document in created])
+        deltas = Counter()
+        for document in created:
+            deltas.update(
+                statistic_deltas(
+                    None,
+                    {field: getattr(document, field) for field in STATISTICS_FIELDS},
+                )
+            )
+        apply_statistic_deltas(deltas)
+        bump_versions([DOCUMENTS_VERSION])
+    return created
+
+
+def bulk_create_annotations(annotations, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert annotations with bulk_create and log the change, which the save
+    signals would do. The annotated documents' cached responses are left to the caller.
+    """
+    with transaction.atomic(savepoint=False), recording_changes():
+        created = Annotation.objects.bulk_create(annotations, batch_size=batch_size)
+        record_changes(ANNOTATION, [annotation.pk for annotation in created])
+    return created
@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Change
+
+DOCUMENT = "document"
+ANNOTATION = "annotation"
+
+CHANGES_BATCH_SIZE = 1000
+
+# Change log entries collected by recording_changes()
+_pending = ContextVar("pending_changes", default=None)
+
+
+def _write_on_commit(changes):
+    # entries are numbered once the transaction has committed: numbered inside
+    # it, a long transaction would commit numbers below a cursor a client has
+    # already moved past. Rolled back transactions leave no entries.
+    if changes:
+        transaction.on_commit(
+            lambda: Change.objects.bulk_create(changes, batch_size=CHANGES_BATCH_SIZE)
+        )
+
+
+def record_changes(kind, object_ids, deleted=False):
+    """
+    Add the objects to the change log once the current transaction commits.
+    Inside recording_changes() the entries are written together.
+    """
+    changes = [
+        Change(kind=kind, object_id=str(pk), deleted=deleted) for pk in object_ids
+    ]
+    pending = _pending.get()
+    if pending is not None:
+        pending.extend(changes)
+    else:
+        _write_on_commit(changes)
+
+
+@contextmanager
+def recording_changes():
+    """
+    Write the change log entries of the block, including those of the save and
+    delete signals, with one query per CHANGES_BATCH_SIZE entries after the
+    transaction commits. Used by the bulk writes.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    token = _pending.set([])
+    try:
+        yield
+        pending = _pending.get()
+    finally:
+        _pending.reset(token)
+    _write_on_commit(pending)
+
+
+def current_cursor():
+    """
+    Cursor of the latest change, a delta export from it starts after everything
+    that is already visible.
+    """
+    return Change.objects.aggregate(cursor=Max("pk"))["cursor"] or 0
+
+
+def cursor_at(moment):
+    """
+    Cursor of the last change made before `moment`.
+    """
+    return (
+        Change.objects.filter(created_at__lt=moment).aggregate(cursor=Max("pk"))[
+            "cursor"
+        ]
+        or 0
+    )
+
+
+def changes_since(cursor, limit):
+    """
+    Changes logged after `cursor`, at most `limit` log entries.
+    Returns ({kind: {object_id: deleted}} with the latest change of every object,
+    the cursor to continue from, whether more changes follow).
+
+    Entries are written after the changes commit, each by a short transaction,
+    which could still commit a number below the cursor after a later one.
+    Entries younger than CHANGES_SETTLE_SECONDS are left for the next request.
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    entries = list(
+        Change.objects.filter(pk__gt=cursor, created_at__lt=horizon)
+        .order_by("pk")
+        .values_list("pk", "kind", "object_id", "deleted")[: limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changes = {DOCUMENT: {}, ANNOTATION: {}}
+    for _, kind, object_id, deleted in entries:
+        changes[kind][object_id] = deleted
+    return changes, entries[-1][0] if entries else cursor, has_more
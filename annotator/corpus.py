@@ -0,0 +1,161 @@
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .bulk import bulk_create_annotations, bulk_create_documents
+from .models import Annotation, Document
+
+# Generated documents are spread over the period before CORPUS_END; the end is
+# fixed so that the same seed always gives the same corpus
+CORPUS_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+CORPUS_PERIOD = timedelta(days=730)
+
+CORPUS_BATCH_SIZE = 5000
+
+# Relative frequencies, roughly as in the annotated dataset
+STATUS_WEIGHTS = {"UNMARKED": 50, "MARKED": 25, "CHECKED": 15, "GENERATED": 10}
+NPA_WEIGHTS = {code: 1 for code, _ in Document.NPA_CHOICES}
+NPA_WEIGHTS.update({"ГК_1_2": 12, "ГК_3_4": 6, "УК": 10, "ТК": 8, "КАП": 8})
+
+# Phrases a norm of each type is built around
+LAW_TYPE_PHRASES = {
+    "DUTY": ["обязан", "обязаны", "должен"],
+    "ALLOW": ["вправе", "может", "имеет право"],
+    "BAN": ["не допускается", "запрещается", "не вправе"],
+    "DEF": ["понимается", "признается", "является"],
+    "DEC": ["гарантируется", "признается и защищается"],
+    "GOAL": ["в целях", "направлено на"],
+    "OTHER": ["осуществляется", "устанавливается"],
+}
+# Words marking the moral foundation a norm appeals to
+JUSTIFICATION_WORDS = {
+    "AUTH": ["закона", "органа власти", "суда", "полномочий"],
+    "CARE": ["здоровья", "безопасности", "жизни", "помощи"],
+    "LOYAL": ["гражданства", "семьи", "государственной службы"],
+    "FAIR": ["равенства", "возмещения вреда", "справедливости"],
+    "PUR": ["достоинства", "нравственности", "чести"],
+    "NON": ["документов", "сроков", "реквизитов"],
+}
+SUBJECTS = [
+    "Работодатель",
+    "Гражданин",
+    "Лицо",
+    "Орган местного самоуправления",
+    "Собственник",
+    "Оператор",
+    "Должностное лицо",
+]
+ACTIONS = [
+    "обеспечить соблюдение",
+    "предоставить сведения в отношении",
+    "принимать меры для защиты",
+    "осуществлять деятельность с учетом",
+    "требовать соблюдения",
+]
+
+_POINTS_FIELDS = {
+    justification: "{}_points".format(justification)
+    for justification in JUSTIFICATION_WORDS
+}
+_LAW_TYPES = list(LAW_TYPE_PHRASES)
+
+
+def _weighted_choice(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def generate_document(rng, users, end=CORPUS_END):
+    """
+    Unsaved document with a plausible norm text and classification.
+    Returns the document and the (keyword, law_type, justification) of its text.
+    """
+    law_type = rng.choice(_LAW_TYPES)
+    justifications = rng.sample(list(JUSTIFICATION_WORDS), rng.randint(1, 2))
+    phrase = rng.choice(LAW_TYPE_PHRASES[law_type])
+    words = [rng.choice(JUSTIFICATION_WORDS[j]) for j in justifications]
+    text = "{} {} {} {}.".format(
+        rng.choice(SUBJECTS), phrase, rng.choice(ACTIONS), " и ".join(words)
+    )
+
+    status = _weighted_choice(rng, STATUS_WEIGHTS)
+    document = Document(
+        user=rng.choice(users),
+        title="ч. {} ст. {}".format(rng.randint(1, 9), rng.randint(1, 400)),
+        text=text,
+        NPA=_weighted_choice(rng, NPA_WEIGHTS),
+        status=status,
+        law_type="UNCHECKED" if status == "UNMARKED" else law_type,
+        created_at=end - CORPUS_PERIOD * rng.random(),
+    )
+    if status != "UNMARKED":
+        for justification in justifications:
+            setattr(document, _POINTS_FIELDS[justification], rng.randint(3, 10))
+
+    keywords = [(phrase, law_type, "UNCHECKED")]
+    keywords.extend(
+        (word, "UNCHECKED", justification)
+        for word, justification in zip(words, justifications)
+    )
+    return document, keywords
+
+
+def corpus_annotation(document, keyword, law_type, law_justification):
+    start = document.text.index(keyword)
+    end = start + len(keyword)
+    # the Recogito annotation is rebuilt from the columns, see annotator.recogito
+    return Annotation(
+        document=document,
+        start=start,
+        end=end,
+        orig_text=keyword,
+        comment="",
+        law_type=law_type,
+        law_justification=law_justification,
+    )
+
+
+def corpus_users(count):
+    return [
+        User.objects.get_or_create(username="corpus{}".format(i))[0]
+        for i in range(count)
+    ]
+
+
+def generate_corpus(
+    users,
+    count,
+    seed=0,
+    annotations=True,
+    end=CORPUS_END,
+    batch_size=CORPUS_BATCH_SIZE,
+    progress=None,
+):
+    """
+    Insert `count` generated documents with keyword annotations on all of them
+    except unmarked ones. The same seed gives the same corpus.
+    Returns the numbers of inserted documents and annotations.
+    """
+    rng = random.Random(seed)
+    created = annotations_created = 0
+    while created < count:
+        batch = [
+            generate_document(rng, users, end)
+            for _ in range(min(batch_size, count - created))
+        ]
+        with transaction.atomic():
+            documents = bulk_create_documents([document for document, _ in batch])
+            if annotations:
+                batch_annotations = [
+                    corpus_annotation(document, *keyword)
+                    for document, keywords in batch
+                    if document.status != "UNMARKED"
+                    for keyword in keywords
+                ]
+                bulk_create_annotations(batch_annotations)
+                annotations_created += len(batch_annotations)
+        created += len(documents)
+        if progress is not None:
+            progress(created, annotations_created)
+    return created, annotations_created
@@ -0,0 +1,111 @@
+import re
+import time
+
+from django.db import transaction
+
+from .bulk import BULK_BATCH_SIZE, bulk_create_documents
+from .models import Document
+
+# "Статья 12.1. Название статьи"
+_RE_ARTICLE = re.compile(r"^Статья\s+(\d+(?:\.\d+)*)\.(?:\s|$)")
+# "1. Текст части", "2.1. Текст части"; "1) пункт" stays in its part
+_RE_PART = re.compile(r"^(\d+(?:\.\d+)*)\.\s+")
+# structure above the articles, it ends the current article
+_RE_HEADER = re.compile(
+    r"^(?:(?:раздел|подраздел|глава|параграф|§)\s*[\dIVXLC]"
+    r"|часть\s+(?:первая|вторая|третья|четвертая|пятая|шестая)\s*$)",
+    re.IGNORECASE,
+)
+# editorial notes of the consolidated texts: "(в ред. Федерального закона ...)",
+# "(введена Федеральным законом ...)", "(п. 3 утратил силу ...)"; other
+# parenthesised lines are norm text
+_RE_NOTE = re.compile(
+    r"^\((?:(?:абзац|пункт|подпункт|часть|п|пп|ч)\.?(?:\s+[^\s()]+)?\s+)?"
+    r"(?:в\s+ред\.|в\s+редакции|введен[аоы]?|утратил[аиоы]?\s+силу)[\s.,].*\)$",
+    re.IGNORECASE,
+)
+
+TITLE_MAX_LENGTH = Document._meta.get_field("title").max_length
+
+
+def _article_norms(article, preamble, parts):
+    # text before the first numbered part, or the whole article without parts
+    if preamble:
+        yield "ст. {}".format(article), "\n".join(preamble)
+    for part, lines in parts:
+        yield "ч. {} ст. {}".format(part, article), "\n".join(lines)
+
+
+def segment_act(lines):
+    """
+    Split the text of a legal act, given as an iterable of lines, into norms:
+    yields (title, text) for every numbered part of an article ("ч. 2 ст. 5"),
+    or for the whole article if it has no numbered parts ("ст. 5").
+    Headings, editorial notes and the text before the first article are
+    skipped. Only the current article is held in memory.
+    """
+    article, preamble, parts = None, [], []
+    for line in lines:
+        line = line.strip()
+        if not line or _RE_NOTE.match(line):
+            continue
+
+        match = _RE_ARTICLE.match(line)
+        if match or _RE_HEADER.match(line):
+            if article is not None:
+                yield from _article_norms(article, preamble, parts)
+            article, preamble, parts = None, [], []
+            if match:
+                article = match.group(1)
+            continue
+        if article is None:
+            continue
+
+        match = _RE_PART.match(line)
+        if match:
+            parts.append((match.group(1), [line[match.end() :]]))
+        elif parts:
+            parts[-1][1].append(line)
+        else:
+            preamble.append(line)
+
+    if article is not None:
+        yield from _article_norms(article, preamble, parts)
+
+
+def import_legal_act(
+    user, npa, lines, batch_size=BULK_BATCH_SIZE, dry_run=False, progress=None
+):
+    """
+    Segment a legal act and insert its norms as documents, `batch_size` at a
+    time, in one transaction. Returns the import statistics.
+    """
+    started = time.perf_counter()
+    created = 0
+    batch = []
+
+    def flush():
+        nonlocal created
+        if not dry_run:
+            bulk_create_documents(batch, batch_size=batch_size)
+        created += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(created)
+
+    with transaction.atomic():
+        for title, text in segment_act(lines):
+            batch.append(
+                Document(user=user, title=title[:TITLE_MAX_LENGTH], text=text, NPA=npa)
+            )
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "norms": created,
+        "elapsed": round(elapsed, 3),
+        "norms_per_second": round(created / elapsed, 1) if elapsed else None,
+    }
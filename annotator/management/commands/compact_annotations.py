@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from annotator.models import Annotation
+from annotator.recogito import COMPACT_BATCH_SIZE, compact_stored_annotations
+
+
+def _stored_size():
+    # bytes the json_data values take on disk, after TOAST compression
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT coalesce(sum(pg_column_size(json_data)), 0) FROM {}".format(
+                connection.ops.quote_name(Annotation._meta.db_table)
+            )
+        )
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the Recogito annotations of existing rows compactly, keeping only "
+        "what the annotation columns cannot rebuild. The freed space is reused "
+        "by new rows, VACUUM FULL returns it to the system"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=COMPACT_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the savings, do not rewrite the rows",
+        )
+
+    def handle(self, *args, **options):
+        stored_before = _stored_size()
+        total, rewritten, size_before, size_after = compact_stored_annotations(
+            options["batch_size"], options["dry_run"]
+        )
+        self.stdout.write(
+            "{} annotations, {} {}".format(
+                total, rewritten, "to rewrite" if options["dry_run"] else "rewritten"
+            )
+        )
+        self.stdout.write(
+            "json_data: {} KB -> {} KB".format(size_before // 1024, size_after // 1024)
+        )
+        if stored_before is not None and not options["dry_run"]:
+            self.stdout.write(
+                "json_data on disk: {} KB -> {} KB".format(
+                    stored_before // 1024, _stored_size() // 1024
+                )
+            )
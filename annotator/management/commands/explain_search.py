@@ -0,0 +1,128 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from annotator.corpus import corpus_users, generate_corpus
+from annotator.models import Document
+
+PAGE_SIZE = 25
+
+
+def search_query_shapes():
+    """
+    Queries issued by the document search, by the filters they use.
+    """
+    documents = Document.objects.select_related("user").order_by("-created_at")
+    # the last month of the data, or of today on an empty table
+    latest = Document.objects.aggregate(latest=Max("created_at"))["latest"]
+    month_ago = (latest or timezone.now()) - timedelta(days=30)
+    return {
+        "law_type": documents.filter(law_type__in=["BAN"]),
+        "dominant_justification": documents.filter(dominant_justification__in=["CARE"]),
+        "NPA": documents.filter(NPA__in=["УК"]),
+        "status": documents.filter(status__in=["CHECKED"]),
+        "created_at range": documents.filter(created_at__gte=month_ago),
+        "law_type + NPA + status": documents.filter(
+            law_type__in=["DUTY", "BAN"], NPA__in=["ТК"], status__in=["MARKED"]
+        ),
+        "username": documents.filter(user__username__icontains="corpus"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the plans and latency of the document search queries with and "
+        "without the Document indexes. Run it on a development database: "
+        "dropping the indexes locks the table until the command ends. The "
+        "indexes and the generated documents are removed in a rollback."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--documents",
+            type=int,
+            default=0,
+            help="Generate documents until the table has at least this many, "
+            "requires --generate",
+        )
+        parser.add_argument(
+            "--generate",
+            action="store_true",
+            help="Allow generating documents for the measurement",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        if settings.PROD:
+            raise CommandError(
+                "The command locks the document table, not in production"
+            )
+        missing = options["documents"] - Document.objects.count()
+        if missing > 0 and not options["generate"]:
+            raise CommandError(
+                "The table has {} documents less than --documents, "
+                "pass --generate to generate them".format(missing)
+            )
+
+        with transaction.atomic():
+            if missing > 0:
+                self.stdout.write("Generating {} documents...".format(missing))
+                generate_corpus(
+                    corpus_users(10), missing, seed=options["seed"], annotations=False
+                )
+            # fresh planner statistics for the generated rows
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE annotator_document")
+
+            shapes = search_query_shapes()
+            after = self.measure(shapes, options["repeat"], "with indexes")
+            with connection.cursor() as cursor:
+                for index in Document._meta.indexes:
+                    cursor.execute(
+                        "DROP INDEX {}".format(connection.ops.quote_name(index.name))
+                    )
+            before = self.measure(shapes, options["repeat"], "without indexes")
+            transaction.set_rollback(True)
+
+        for name in shapes:
+            (plan_before, ms_before), (plan_after, ms_after) = before[name], after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write("  without indexes: {:.2f} ms".format(ms_before))
+            self.stdout.write("    " + "\n    ".join(plan_before))
+            self.stdout.write("  with indexes:    {:.2f} ms".format(ms_after))
+            self.stdout.write("    " + "\n    ".join(plan_after))
+
+    def measure(self, shapes, repeat, label):
+        """
+        {name: (plan lines, median latency in ms)} of the first page of every query.
+        """
+        explain = (
+            "EXPLAIN" if connection.vendor == "postgresql" else "EXPLAIN QUERY PLAN"
+        )
+        results = {}
+        with connection.cursor() as cursor:
+            for name, queryset in shapes.items():
+                sql, params = queryset[:PAGE_SIZE].query.sql_with_params()
+                # the label keeps statements prepared in the other run out of the
+                # sqlite statement cache, they would keep the plan of that run
+                sql = "{} /* {} */".format(sql, label)
+                cursor.execute("{} {}".format(explain, sql), params)
+                plan = [
+                    " ".join(str(column) for column in row) for row in cursor.fetchall()
+                ]
+
+                timings = []
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                    timings.append((time.perf_counter() - started) * 1000)
+                results[name] = (plan, statistics.median(timings))
+        return results
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from annotator.corpus import corpus_users, generate_corpus
+
+MAX_DOCUMENTS = 5_000_000
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic corpus of documents and annotations for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--documents", type=int, default=10_000)
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="The same seed generates the same corpus",
+        )
+        parser.add_argument(
+            "--no-annotations",
+            action="store_true",
+            help="Generate documents only",
+        )
+
+    def handle(self, *args, **options):
+        if not 1 <= options["documents"] <= MAX_DOCUMENTS:
+            raise CommandError(
+                "--documents must be between 1 and {}".format(MAX_DOCUMENTS)
+            )
+
+        def progress(documents, annotations):
+            self.stdout.write(
+                "{} documents, {} annotations".format(documents, annotations)
+            )
+
+        documents, annotations = generate_corpus(
+            corpus_users(options["users"]),
+            options["documents"],
+            seed=options["seed"],
+            annotations=not options["no_annotations"],
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Generated {} documents and {} annotations".format(
+                    documents, annotations
+                )
+            )
+        )
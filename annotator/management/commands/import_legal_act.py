@@ -0,0 +1,61 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from annotator.bulk import BULK_BATCH_SIZE
+from annotator.legal_acts import import_legal_act
+from annotator.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Split a legal act (a text file, one paragraph per line) into articles "
+        "and parts and import them as documents"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--npa",
+            required=True,
+            choices=[code for code, _ in Document.NPA_CHOICES],
+        )
+        parser.add_argument(
+            "--user", required=True, help="Username the documents are created for"
+        )
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the norms, do not create documents",
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options["user"]).first()
+        if user is None:
+            raise CommandError("User {} does not exist".format(options["user"]))
+
+        def progress(norms):
+            self.stdout.write("{} norms".format(norms))
+
+        try:
+            with open(options["path"], encoding=options["encoding"]) as lines:
+                stats = import_legal_act(
+                    user,
+                    options["npa"],
+                    lines,
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                    progress=progress,
+                )
+        except (OSError, UnicodeDecodeError) as error:
+            raise CommandError(error)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "{} {} norms in {} s".format(
+                    "Found" if options["dry_run"] else "Imported",
+                    stats["norms"],
+                    stats["elapsed"],
+                )
+            )
+        )
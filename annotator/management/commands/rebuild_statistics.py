@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from annotator.statistics import find_statistics_drift, rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = "Rebuild the document statistics counters from scratch and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the drift, do not rewrite the counters",
+        )
+
+    def handle(self, *args, **options):
+        drift = find_statistics_drift()
+        for (dimension, value), (stored, actual) in sorted(drift.items()):
+            self.stdout.write(
+                "{}={}: stored {}, actual {}".format(dimension, value, stored, actual)
+            )
+
+        if options["check"]:
+            if drift:
+                self.stdout.write(
+                    self.style.WARNING("{} counters drifted".format(len(drift)))
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS("No drift"))
+            return
+
+        rebuild_statistics()
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Statistics rebuilt, {} counters were fixed".format(len(drift))
+            )
+        )
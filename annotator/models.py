@@ -2,13 +2,19 @@ import re
 import uuid
 
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 
 from app_config.npa import NPA
+from .recogito import RECOGITO_FIELDS, recogito_annotation
 
 _RE_NEWLINE = re.compile(r"\n+")
 
 
+def normalize_text(text):
+    text = text.strip().replace("\r", "\n")
+    return _RE_NEWLINE.sub("\n", text)
+
+
 class Document(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, verbose_name="Пользователь"
@@ -16,6 +22,7 @@ class Document(models.Model):
     title = models.CharField(max_length=255, verbose_name="Название")
     text = models.TextField(verbose_name="Текст")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     JUSTIFICATION_CHOICES = [
         ("AUTH", "Авторитет"),
@@ -96,16 +103,103 @@ class Document(models.Model):
             return "UNCHECKED"
         return max(justifications_points, key=justifications_points.get)
 
-    def save(self, *args, **kwargs):
-        self.text = self.text.strip().replace("\r", "\n")
-        self.text = _RE_NEWLINE.sub("\n", self.text)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # values as loaded from the database, used to track changes on save
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    def _remember_values(self, fields=None):
+        """
+        Treat the current values of `fields` (all loaded fields by default)
+        as the values stored in the database.
+        """
+        loaded_values = getattr(self, "_loaded_values", {})
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (
+                fields is None or field.name in fields or field.attname in fields
+            ):
+                loaded_values[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded_values
 
-        if self.pk:
-            old_doc = Document.objects.get(pk=self.pk)
-            if old_doc.text != self.text:
-                Annotation.objects.filter(document_id=self.pk).delete()
+    def get_dirty_fields(self):
+        """
+        Attnames of the fields changed since the document was loaded or saved.
+        """
+        loaded_values = getattr(self, "_loaded_values", {})
+        return {
+            field.attname
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+            and not field.primary_key
+            and (
+                field.attname not in loaded_values
+                or self.__dict__[field.attname] != loaded_values[field.attname]
+            )
+        }
+
+    def _replaced_text(self):
+        """
+        The stored text if the text was changed, otherwise None.
+        """
+        if "text" in self.get_deferred_fields():
+            # the text was neither loaded nor assigned
+            return None
+        loaded_values = getattr(self, "_loaded_values", {})
+        if "text" in loaded_values:
+            stored_text = loaded_values["text"]
+        else:
+            stored_text = (
+                Document.objects.filter(pk=self.pk)
+                .values_list("text", flat=True)
+                .first()
+            )
+        return stored_text if stored_text != self.text else None
+
+    def save(self, *args, **kwargs):
+        if "text" not in self.get_deferred_fields():
+            self.text = normalize_text(self.text)
         self.dominant_justification = self.calculate_dominant_justification()
-        super().save(*args, **kwargs)
+
+        stored_text = None
+        if not self._state.adding and self.pk:
+            stored_text = self._replaced_text()
+            if "update_fields" not in kwargs and hasattr(self, "_loaded_values"):
+                # write only the changed columns, nothing at all if none changed
+                kwargs["update_fields"] = self.get_dirty_fields()
+            if kwargs.get("update_fields"):
+                # auto_now is only written when the field is saved
+                kwargs["update_fields"] = set(kwargs["update_fields"]) | {"updated_at"}
+
+        from .versions import bumping_versions
+
+        # the statistics signals lock the stored row until the counters are
+        # updated, see annotator.signals
+        with transaction.atomic(savepoint=False), bumping_versions():
+            if stored_text is not None:
+                # annotations point into the old text; they are moved in the
+                # transaction writing the new text, so they never disagree
+                from .anchoring import reanchor_annotations
+
+                reanchor_annotations(self.pk, stored_text, self.text)
+            super().save(*args, **kwargs)
+        self._remember_values(kwargs.get("update_fields"))
+
+    def delete(self, *args, **kwargs):
+        from .versions import bumping_versions
+
+        # the annotations deleted with the document bump its version once
+        with transaction.atomic(savepoint=False), bumping_versions():
+            return super().delete(*args, **kwargs)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._remember_values(fields)
 
     def __str__(self):
         return self.title
@@ -117,6 +211,20 @@ class Document(models.Model):
             ("can_mark_as_marked", "Can mark document as marked"),
             ("can_mark_as_checked", "Can mark document as checked"),
         ]
+        indexes = [
+            # keyset pagination order, see api.pagination
+            models.Index(fields=["-created_at", "-id"], name="document_keyset_idx"),
+            # search filters, each followed by the newest-first order of the results
+            models.Index(
+                fields=["law_type", "-created_at"], name="document_law_type_idx"
+            ),
+            models.Index(
+                fields=["dominant_justification", "-created_at"],
+                name="document_justification_idx",
+            ),
+            models.Index(fields=["NPA", "-created_at"], name="document_npa_idx"),
+            models.Index(fields=["status", "-created_at"], name="document_status_idx"),
+        ]
 
 
 class Annotation(models.Model):
@@ -140,5 +248,151 @@ class Annotation(models.Model):
         verbose_name="Обоснование закона",
     )
 
-    json_data = models.JSONField()
+    # only what the columns cannot rebuild of the Recogito annotation, see annotator.recogito
+    json_data = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def recogito_fields(self):
+        return {name: getattr(self, name) for name in RECOGITO_FIELDS + ("json_data",)}
+
+    def to_recogito(self):
+        return recogito_annotation(self.recogito_fields())
+
+
+class Change(models.Model):
+    """
+    Change log of documents and annotations, read by the delta export.
+    The id is the change sequence, see annotator.changes.
+    """
+
+    KIND_CHOICES = [
+        ("document", "Документ"),
+        ("annotation", "Аннотация"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Тип")
+    object_id = models.CharField(max_length=64, verbose_name="Объект")
+    deleted = models.BooleanField(default=False, verbose_name="Удалён")
+    created_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name="Дата изменения"
+    )
+
+    def __str__(self):
+        return "{} {} {}".format(self.id, self.kind, self.object_id)
+
+    class Meta:
+        verbose_name = "Изменение"
+        verbose_name_plural = "Изменения"
+
+
+class CacheVersion(models.Model):
+    """
+    Version of the data cached under a key, replaced in the transaction of
+    every write of the data, see annotator.versions.
+    """
+
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.CharField(max_length=64)
+
+    def __str__(self):
+        return "{}={}".format(self.key, self.version)
+
+
+class DocumentStatistic(models.Model):
+    """
+    Number of documents per value of a statistics dimension
+    (status, NPA, user, month, ...), maintained on every document write.
+    """
+
+    dimension = models.CharField(max_length=50, verbose_name="Измерение")
+    value = models.CharField(max_length=255, verbose_name="Значение")
+    total = models.IntegerField(default=0, verbose_name="Количество документов")
+
+    def __str__(self):
+        return "{}={}: {}".format(self.dimension, self.value, self.total)
+
+    class Meta:
+        verbose_name = "Статистика документов"
+        verbose_name_plural = "Статистика документов"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "value"], name="unique_document_statistic"
+            )
+        ]
+
+
+class DailyDocumentStatistic(models.Model):
+    """
+    Number of documents created on a day by a user with a status, maintained
+    on every document write like DocumentStatistic. Date range statistics are
+    summed from these rows instead of scanning the documents.
+    """
+
+    day = models.DateField(verbose_name="День")
+    # not a foreign key: the counters of deleted users' documents are
+    # decremented after the user is gone
+    user_id = models.IntegerField(verbose_name="Пользователь")
+    status = models.CharField(
+        max_length=50, choices=Document.STATUS_CHOICES, verbose_name="Статус"
+    )
+    total = models.IntegerField(default=0, verbose_name="Количество документов")
+
+    def __str__(self):
+        return "{} {} {}: {}".format(self.day, self.user_id, self.status, self.total)
+
+    class Meta:
+        verbose_name = "Статистика документов по дням"
+        verbose_name_plural = "Статистика документов по дням"
+        constraints = [
+            # also the index of the date range queries
+            models.UniqueConstraint(
+                fields=["day", "user_id", "status"],
+                name="unique_daily_document_statistic",
+            )
+        ]
+
+
+class ClassificationJob(models.Model):
+    """
+    A legal act submitted for automatic classification, processed in the background.
+    """
+
+    STATUS_CHOICES = [
+        ("QUEUED", "В очереди"),
+        ("RUNNING", "В процессе"),
+        ("DONE", "Выполнено"),
+        ("FAILED", "Ошибка"),
+    ]
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name="Пользователь"
+    )
+    title = models.CharField(max_length=255, verbose_name="Название")
+    NPA = models.CharField(
+        max_length=50,
+        choices=Document.NPA_CHOICES,
+        default="NOTSELECTED",
+        verbose_name="НПА",
+    )
+    text = models.TextField(verbose_name="Текст")
+    status = models.CharField(
+        max_length=50, choices=STATUS_CHOICES, default="QUEUED", verbose_name="Статус"
+    )
+    norms_total = models.PositiveIntegerField(default=0)
+    norms_done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # token of the worker running the job and the last time it reported
+    worker = models.CharField(max_length=32, blank=True, default="")
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = "Задача классификации"
+        verbose_name_plural = "Задачи классификации"
@@ -0,0 +1,167 @@
+import copy
+import json
+
+from django.db import transaction
+
+RECOGITO_CONTEXT = "http://www.w3.org/ns/anno.jsonld"
+
+# Annotation columns the Recogito annotation is rebuilt from
+RECOGITO_FIELDS = (
+    "id",
+    "start",
+    "end",
+    "orig_text",
+    "comment",
+    "law_type",
+    "law_justification",
+)
+
+# Payloads that cannot be rebuilt from the columns are stored whole under this key
+RAW_KEY = "_raw"
+
+COMPACT_BATCH_SIZE = 2000
+
+
+def _selector_values(fields):
+    return {
+        "TextQuoteSelector": {"exact": fields["orig_text"]},
+        "TextPositionSelector": {"start": fields["start"], "end": fields["end"]},
+    }
+
+
+def _body_values(fields):
+    return {
+        "classifying": {
+            "type": fields["law_type"],
+            "justification": fields["law_justification"],
+        },
+        "commenting": fields["comment"],
+    }
+
+
+def _skeleton(fields):
+    # what is left of an annotation made in the frontend once the column values are removed
+    body = [{"purpose": "classifying"}]
+    if fields["comment"]:
+        body.insert(0, {"type": "TextualBody", "purpose": "commenting"})
+    return {
+        "body": body,
+        "target": {
+            "selector": [
+                {"type": "TextQuoteSelector"},
+                {"type": "TextPositionSelector"},
+            ]
+        },
+    }
+
+
+def _strip(payload, fields):
+    residual = copy.deepcopy(payload)
+    for key, value in [
+        ("id", str(fields["id"])),
+        ("@context", RECOGITO_CONTEXT),
+        ("type", "Annotation"),
+    ]:
+        if residual.get(key) == value:
+            del residual[key]
+
+    selector_values = _selector_values(fields)
+    for selector in residual.get("target", {}).get("selector", []):
+        for key, value in selector_values.get(selector.get("type"), {}).items():
+            if key in selector and selector[key] == value:
+                del selector[key]
+
+    body_values = _body_values(fields)
+    for body in residual.get("body", []):
+        purpose = body.get("purpose")
+        if purpose in body_values and body.get("value") == body_values[purpose]:
+            del body["value"]
+    return residual
+
+
+def _fill(residual, fields):
+    annotation = copy.deepcopy(residual)
+    annotation.setdefault("@context", RECOGITO_CONTEXT)
+    annotation.setdefault("id", str(fields["id"]))
+    annotation.setdefault("type", "Annotation")
+
+    selector_values = _selector_values(fields)
+    for selector in annotation.get("target", {}).get("selector", []):
+        for key, value in selector_values.get(selector.get("type"), {}).items():
+            selector.setdefault(key, value)
+
+    body_values = _body_values(fields)
+    for body in annotation.get("body", []):
+        purpose = body.get("purpose")
+        if purpose in body_values:
+            body.setdefault("value", body_values[purpose])
+    return annotation
+
+
+def compact_recogito(fields, payload):
+    """
+    What has to be stored of the Recogito annotation `payload` of an annotation
+    with the column values `fields`: {} if the columns rebuild it entirely,
+    otherwise the parts they do not hold. Payloads that would not be rebuilt
+    exactly are kept whole.
+    """
+    try:
+        if RAW_KEY in payload:
+            raise ValueError("reserved key")
+        residual = _strip(payload, fields)
+        if _fill(residual, fields) != payload:
+            raise ValueError("not rebuilt exactly")
+    except (AttributeError, TypeError, ValueError):
+        return {RAW_KEY: payload}
+    if residual == _skeleton(fields):
+        return {}
+    return residual
+
+
+def recogito_annotation(fields):
+    """
+    The Recogito annotation (W3C Web Annotation) of an annotation, rebuilt from
+    its columns. `fields` holds RECOGITO_FIELDS and the stored json_data.
+    """
+    stored = fields["json_data"]
+    if RAW_KEY in stored:
+        return stored[RAW_KEY]
+    return _fill(stored or _skeleton(fields), fields)
+
+
+def compact_stored_annotations(batch_size=COMPACT_BATCH_SIZE, dry_run=False):
+    """
+    Rewrite the stored json_data of existing annotations in the compact form.
+    Returns (annotations, rewritten, json bytes before, json bytes after).
+    The served annotations do not change, so no cached data is invalidated.
+    """
+    from .models import Annotation
+
+    total = rewritten = size_before = size_after = 0
+    last_pk = None
+    while True:
+        batch = Annotation.objects.order_by("pk").only(*RECOGITO_FIELDS, "json_data")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        changed = []
+        for annotation in batch:
+            fields = annotation.recogito_fields()
+            # stored payloads may be whole (written before) or already compact
+            compact = compact_recogito(fields, recogito_annotation(fields))
+            size_before += len(json.dumps(annotation.json_data, ensure_ascii=False))
+            size_after += len(json.dumps(compact, ensure_ascii=False))
+            if compact != annotation.json_data:
+                annotation.json_data = compact
+                changed.append(annotation)
+
+        total += len(batch)
+        rewritten += len(changed)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Annotation.objects.bulk_update(changed, ["json_data"])
+    return total, rewritten, size_before, size_after
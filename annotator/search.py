@@ -0,0 +1,82 @@
+import re
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+
+# Text search configuration used both for the index and for the queries
+SEARCH_CONFIG = "russian"
+SEARCH_INDEX_NAME = "annotator_document_fts_idx"
+
+_RE_WORD = re.compile(r"\w+")
+
+
+def document_search_vector():
+    """
+    Search vector of a document: the title has a higher weight than the text.
+    The GIN index is built over exactly this expression, so queries using it
+    are answered from the index.
+    """
+    return SearchVector("title", weight="A", config=SEARCH_CONFIG) + SearchVector(
+        "text", weight="B", config=SEARCH_CONFIG
+    )
+
+
+def build_prefix_tsquery(search_query):
+    """
+    Build a raw tsquery matching all words of `search_query` as prefixes,
+    so that results are found while the user is still typing a word.
+    Returns None if the query has no words.
+    """
+    words = _RE_WORD.findall(search_query)
+    if not words:
+        return None
+    return " & ".join("{}:*".format(word) for word in words)
+
+
+def is_full_text_search_supported(using="default"):
+    return connections[using].vendor == "postgresql"
+
+
+def search_documents(queryset, search_query):
+    """
+    Filter documents by text and order them by relevance.
+
+    PostgreSQL uses the stemmed full text index, other databases (SQLite in tests)
+    fall back to a substring search over the text.
+    """
+    raw_query = build_prefix_tsquery(search_query)
+    if raw_query is None or not is_full_text_search_supported(queryset.db):
+        return queryset.filter(text__icontains=search_query).order_by("-created_at")
+
+    query = SearchQuery(raw_query, search_type="raw", config=SEARCH_CONFIG)
+    vector = document_search_vector()
+    return (
+        queryset.alias(search=vector)
+        .filter(search=query)
+        .annotate(rank=SearchRank(vector, query))
+        .order_by("-rank", "-created_at")
+    )
+
+
+def install_search_index(sender, using="default", **kwargs):
+    """
+    post_migrate handler creating the GIN index over the document search vector.
+    The index is PostgreSQL-specific, so it is not declared in Document.Meta.
+    """
+    if not is_full_text_search_supported(using):
+        return
+
+    from .models import Document
+
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(
+            cursor, Document._meta.db_table
+        )
+    if SEARCH_INDEX_NAME in constraints:
+        return
+
+    index = GinIndex(document_search_vector(), name=SEARCH_INDEX_NAME)
+    with connection.schema_editor() as schema_editor:
+        schema_editor.add_index(Document, index)
@@ -0,0 +1,89 @@
+from .changes import ANNOTATION, DOCUMENT, record_changes
+from .statistics import (
+    STATISTICS_FIELDS,
+    apply_statistic_deltas,
+    statistic_deltas,
+)
+from .versions import bump_annotation_versions, bump_document_versions
+
+
+def _statistics_values(document):
+    return {field: getattr(document, field) for field in STATISTICS_FIELDS}
+
+
+def remember_document_statistics(
+    sender, instance, raw=False, update_fields=None, **kwargs
+):
+    """
+    pre_save: keep the values the document is currently counted with.
+    """
+    if raw or instance._state.adding:
+        instance._statistics_values = None
+        return
+
+    if update_fields is not None:
+        written = {sender._meta.get_field(name).attname for name in update_fields}
+        if written.isdisjoint(STATISTICS_FIELDS):
+            # the counted values are not written
+            instance._statistics_values = _statistics_values(instance)
+            return
+    # read from the stored row, not from the values the instance was loaded
+    # with: the row stays locked until the save commits (see Document.save),
+    # so concurrent saves count the document from each other's values
+    instance._statistics_values = (
+        sender.objects.select_for_update()
+        .filter(pk=instance.pk)
+        .values(*STATISTICS_FIELDS)
+        .first()
+    )
+
+
+def update_document_statistics(sender, instance, raw=False, **kwargs):
+    """
+    post_save: move the document from its old counters to the new ones.
+    """
+    if raw:
+        return
+    old_values = getattr(instance, "_statistics_values", None)
+    apply_statistic_deltas(statistic_deltas(old_values, _statistics_values(instance)))
+
+
+def remove_document_statistics(sender, instance, **kwargs):
+    """
+    post_delete: also called for documents deleted by a cascade.
+    """
+    apply_statistic_deltas(statistic_deltas(_statistics_values(instance), None))
+
+
+def bump_document_version(sender, instance, raw=False, **kwargs):
+    """
+    post_save, post_delete: invalidate the cached responses built from the document.
+    """
+    if not raw:
+        bump_document_versions([instance.pk])
+
+
+def bump_annotation_version(sender, instance, raw=False, **kwargs):
+    """
+    post_save, post_delete: invalidate the cached responses of the annotated document.
+    """
+    if not raw:
+        bump_annotation_versions([instance.document_id])
+
+
+def record_document_change(sender, instance, raw=False, **kwargs):
+    """
+    post_save, post_delete: add the document to the change log.
+    """
+    # only post_save sends `created`
+    if not raw:
+        record_changes(DOCUMENT, [instance.pk], deleted="created" not in kwargs)
+
+
+def record_annotation_change(sender, instance, raw=False, **kwargs):
+    """
+    post_save, post_delete: add the annotation to the change log.
+    """
+    # only post_save sends `created`
+    if not raw:
+        record_changes(ANNOTATION, [instance.pk], deleted="created" not in kwargs)
@@ -0,0 +1,365 @@
+from collections import Counter
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailyDocumentStatistic, Document, DocumentStatistic
+from .versions import DOCUMENTS_VERSION, bump_versions
+
+POINTS_FIELDS = [
+    "AUTH_points",
+    "CARE_points",
+    "LOYAL_points",
+    "FAIR_points",
+    "PUR_points",
+    "NON_points",
+]
+
+# Single-field dimensions, counted by the field value
+FIELD_DIMENSIONS = [
+    "dominant_justification",
+    "law_type",
+    "NPA",
+    "status",
+] + POINTS_FIELDS
+
+# Document fields the statistics depend on
+STATISTICS_FIELDS = ["user_id", "created_at"] + FIELD_DIMENSIONS
+
+MONTH_FORMAT = "%Y-%m"
+
+# Counted in DailyDocumentStatistic, the value is "<day>:<user id>:<status>"
+DAILY_DIMENSION = "daily"
+
+GRANULARITIES = ("day", "week", "month")
+
+# Counters updated by one query, within the SQLite limit of query parameters
+UPDATE_CHUNK_SIZE = 1000
+
+
+def _daily_value(day, user_id, status):
+    return "{}:{}:{}".format(day.isoformat(), user_id, status)
+
+
+def statistic_keys(values):
+    """
+    (dimension, value) pairs a document with the given field values is counted in.
+    """
+    keys = [("user", str(values["user_id"]))]
+    keys.extend((field, str(values[field])) for field in FIELD_DIMENSIONS)
+    keys.append(
+        ("month", timezone.localtime(values["created_at"]).strftime(MONTH_FORMAT))
+    )
+    keys.append(
+        (
+            "justification_law_type",
+            "{}:{}".format(values["dominant_justification"], values["law_type"]),
+        )
+    )
+    keys.append(
+        (
+            DAILY_DIMENSION,
+            _daily_value(
+                timezone.localtime(values["created_at"]).date(),
+                values["user_id"],
+                values["status"],
+            ),
+        )
+    )
+    return keys
+
+
+def statistic_deltas(old_values=None, new_values=None):
+    """
+    Counter changes caused by a document changing from `old_values` to `new_values`.
+    None stands for a document that does not exist (created or deleted).
+    """
+    deltas = Counter()
+    if old_values is not None:
+        deltas.subtract(statistic_keys(old_values))
+    if new_values is not None:
+        deltas.update(statistic_keys(new_values))
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+def _counter_fields(dimension, value):
+    # the model of a counter and the fields identifying it
+    if dimension == DAILY_DIMENSION:
+        day, user_id, status = value.split(":", 2)
+        return DailyDocumentStatistic, {
+            "day": date.fromisoformat(day),
+            "user_id": int(user_id),
+            "status": status,
+        }
+    return DocumentStatistic, {"dimension": dimension, "value": value}
+
+
+def _counter_ids(model, keys):
+    """
+    {fields: pk} of the existing counters of `keys`, read with one query
+    over the values of every field, which is cheaper than matching the keys.
+    """
+    names = list(keys[0])
+    candidates = model.objects.filter(
+        **{"{}__in".format(name): {fields[name] for fields in keys} for name in names}
+    ).values_list("pk", *names)
+    wanted = {tuple(fields[name] for name in names) for fields in keys}
+    return {tuple(values): pk for pk, *values in candidates if tuple(values) in wanted}
+
+
+def apply_statistic_deltas(deltas):
+    if not deltas:
+        return
+
+    deltas_by_model = {}
+    for key, delta in deltas.items():
+        model, fields = _counter_fields(*key)
+        deltas_by_model.setdefault(model, []).append((fields, delta))
+
+    with transaction.atomic():
+        for model, model_deltas in deltas_by_model.items():
+            keys = [fields for fields, _ in model_deltas]
+            model.objects.bulk_create(
+                [model(**fields) for fields in keys], ignore_conflicts=True
+            )
+            counter_ids = _counter_ids(model, keys)
+            ids_by_delta = {}
+            for fields, delta in model_deltas:
+                ids_by_delta.setdefault(delta, []).append(
+                    counter_ids[tuple(fields.values())]
+                )
+            # one UPDATE per distinct delta value
+            for delta, ids in ids_by_delta.items():
+                for i in range(0, len(ids), UPDATE_CHUNK_SIZE):
+                    model.objects.filter(pk__in=ids[i : i + UPDATE_CHUNK_SIZE]).update(
+                        total=F("total") + delta
+                    )
+
+
+def count_statistics():
+    """
+    Compute all counters from scratch with GROUP BY queries over the documents.
+    """
+    counters = Counter()
+    for entry in Document.objects.values("user_id").annotate(total=Count("id")):
+        counters["user", str(entry["user_id"])] = entry["total"]
+    for field in FIELD_DIMENSIONS:
+        for entry in Document.objects.values(field).annotate(total=Count("id")):
+            counters[field, str(entry[field])] = entry["total"]
+    monthly_counts = (
+        Document.objects.annotate(month=TruncMonth("created_at"))
+        .values("month")
+        .annotate(total=Count("id"))
+    )
+    for entry in monthly_counts:
+        counters["month", entry["month"].strftime(MONTH_FORMAT)] = entry["total"]
+    justification_law_type_counts = Document.objects.values(
+        "dominant_justification", "law_type"
+    ).annotate(total=Count("id"))
+    for entry in justification_law_type_counts:
+        value = "{}:{}".format(entry["dominant_justification"], entry["law_type"])
+        counters["justification_law_type", value] = entry["total"]
+    daily_counts = (
+        Document.objects.annotate(day=TruncDate("created_at"))
+        .values("day", "user_id", "status")
+        .annotate(total=Count("id"))
+    )
+    for entry in daily_counts:
+        value = _daily_value(entry["day"], entry["user_id"], entry["status"])
+        counters[DAILY_DIMENSION, value] = entry["total"]
+    return counters
+
+
+def find_statistics_drift():
+    """
+    Compare the stored counters with the actual counts.
+    Returns {(dimension, value): (stored, actual)} for every mismatch.
+    """
+    actual = count_statistics()
+    stored = Counter(
+        {
+            (dimension, value): total
+            for dimension, value, total in DocumentStatistic.objects.values_list(
+                "dimension", "value", "total"
+            )
+        }
+    )
+    for day, user_id, status, total in DailyDocumentStatistic.objects.values_list(
+        "day", "user_id", "status", "total"
+    ):
+        stored[DAILY_DIMENSION, _daily_value(day, user_id, status)] = total
+    return {
+        key: (stored[key], actual[key])
+        for key in set(actual) | set(stored)
+        if stored[key] != actual[key]
+    }
+
+
+def rebuild_statistics():
+    counters = {}
+    for key, total in count_statistics().items():
+        model, fields = _counter_fields(*key)
+        counters.setdefault(model, []).append(model(total=total, **fields))
+
+    with transaction.atomic():
+        for model in (DocumentStatistic, DailyDocumentStatistic):
+            model.objects.all().delete()
+            model.objects.bulk_create(counters.get(model, []))
+        # the cached statistics are computed from the counters
+        bump_versions([DOCUMENTS_VERSION])
+
+
+def _sorted_counts(counts, name):
+    # same order as .order_by("-total")
+    return [
+        {name: value, "total": total}
+        for value, total in sorted(counts.items(), key=itemgetter(1), reverse=True)
+    ]
+
+
+def _points_value(item):
+    return int(item[0])
+
+
+def get_statistics_counts():
+    """
+    Stored counters grouped by dimension: {dimension: {value: total}}.
+    """
+    counts = {}
+    for dimension, value, total in DocumentStatistic.objects.filter(
+        total__gt=0
+    ).values_list("dimension", "value", "total"):
+        counts.setdefault(dimension, {})[value] = total
+    return counts
+
+
+def get_justification_law_type_counts(counts=None):
+    if counts is None:
+        counts = get_statistics_counts()
+    justification_law_type_counts = {
+        j: {t: 0 for t, _ in Document.TYPE_CHOICES}
+        for j, _ in Document.JUSTIFICATION_CHOICES
+    }
+    for value, total in counts.get("justification_law_type", {}).items():
+        justification, law_type = value.split(":", 1)
+        justification_law_type_counts[justification][law_type] = total
+    return justification_law_type_counts
+
+
+def get_document_statistics():
+    """
+    Data of the statistics page, read from the stored counters.
+    """
+    counts = get_statistics_counts()
+
+    user_counts = counts.get("user", {})
+    usernames = dict(
+        User.objects.filter(id__in=user_counts).values_list("id", "username")
+    )
+    data = {
+        "user_document_counts": [
+            {"user__username": usernames.get(int(user_id)), "total": total}
+            for user_id, total in sorted(
+                user_counts.items(), key=itemgetter(1), reverse=True
+            )
+        ],
+        "justification_counts": _sorted_counts(
+            counts.get("dominant_justification", {}), "dominant_justification"
+        ),
+        "law_type_counts": _sorted_counts(counts.get("law_type", {}), "law_type"),
+        "npa_counts": _sorted_counts(counts.get("NPA", {}), "NPA"),
+        "status_counts": _sorted_counts(counts.get("status", {}), "status"),
+    }
+    for field in POINTS_FIELDS:
+        data["{}_counts".format(field.lower())] = [
+            {field: int(value), "total": total}
+            for value, total in sorted(
+                counts.get(field, {}).items(), key=_points_value, reverse=True
+            )
+        ]
+    data["monthly_counts"] = [
+        {
+            "month": timezone.make_aware(datetime.strptime(month, MONTH_FORMAT)),
+            "total": total,
+        }
+        for month, total in sorted(counts.get("month", {}).items())
+    ]
+    data["justification_law_type_counts"] = get_justification_law_type_counts(counts)
+    return data
+
+
+def _period_start(day, granularity):
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, granularity):
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def count_periods(start, end, granularity="day"):
+    first, last = _period_start(start, granularity), _period_start(end, granularity)
+    if granularity == "month":
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days // (7 if granularity == "week" else 1) + 1
+
+
+def get_date_range_statistics(start, end, granularity="day"):
+    """
+    Documents created from `start` to `end` (dates, both included), summed
+    from the daily counters: totals by user and by status and the series of
+    totals per day, week (from Monday) or month, empty periods included.
+    """
+    counters = DailyDocumentStatistic.objects.filter(
+        day__range=(start, end), total__gt=0
+    )
+
+    user_counts, status_counts = Counter(), Counter()
+    for user_id, status, total in (
+        counters.values("user_id", "status")
+        .annotate(documents=Sum("total"))
+        .values_list("user_id", "status", "documents")
+    ):
+        user_counts[user_id] += total
+        status_counts[status] += total
+    usernames = dict(
+        User.objects.filter(id__in=user_counts).values_list("id", "username")
+    )
+
+    period_counts = Counter()
+    for day, total in (
+        counters.values("day")
+        .annotate(documents=Sum("total"))
+        .values_list("day", "documents")
+    ):
+        period_counts[_period_start(day, granularity)] += total
+    series = []
+    period = _period_start(start, granularity)
+    while period <= end:
+        series.append({"period": period.isoformat(), "total": period_counts[period]})
+        period = _next_period(period, granularity)
+
+    return {
+        "total_documents": sum(user_counts.values()),
+        "user_document_counts": [
+            {"user__username": usernames.get(user_id), "total": total}
+            for user_id, total in sorted(
+                user_counts.items(), key=itemgetter(1), reverse=True
+            )
+        ],
+        "status_counts": _sorted_counts(status_counts, "status"),
+        "granularity": granularity,
+        "series": series,
+    }
@@ -0,0 +1,110 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+
+from .models import CacheVersion
+
+# Changes with every document write, everything computed over all documents
+# (the statistics) depends on it
+DOCUMENTS_VERSION = "version:documents"
+
+# Keys collected by bumping_versions()
+_pending = ContextVar("pending_versions", default=None)
+
+
+def document_version(document_id):
+    """
+    Changes with every write of the document or of its annotations.
+    """
+    return "version:document:{}".format(document_id)
+
+
+def _new_version():
+    # the bump time is kept in the version for Last-Modified; the random part
+    # makes concurrent bumps distinct
+    return "{:.6f}-{}".format(time.time(), uuid.uuid4().hex[:8])
+
+
+def get_versions(keys):
+    """
+    {key: version} of the keys. The versions are kept in the database, so a
+    write by any process, a management command included, is seen by all the
+    server processes. Keys never bumped are started with a new version.
+    """
+    versions = dict(
+        CacheVersion.objects.filter(key__in=keys).values_list("key", "version")
+    )
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(key=key, version=_new_version()) for key in missing],
+            ignore_conflicts=True,
+        )
+        # started by a concurrent request meanwhile
+        versions.update(
+            CacheVersion.objects.filter(key__in=missing).values_list("key", "version")
+        )
+    return versions
+
+
+def version_time(versions):
+    """
+    Time of the latest bump of the versions.
+    """
+    latest = max(float(version.split("-", 1)[0]) for version in versions.values())
+    return datetime.fromtimestamp(latest, tz=dt_timezone.utc)
+
+
+def _write_versions(keys):
+    # in the same order in every transaction, so that they cannot deadlock
+    if keys:
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(key=key, version=_new_version()) for key in sorted(keys)],
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=["version"],
+        )
+
+
+def bump_versions(keys):
+    """
+    Invalidate everything cached under the keys. The new versions are written
+    in the current transaction, so they are seen together with the data, and
+    nothing read before the commit is cached under them. Inside
+    bumping_versions() they are written together.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(keys)
+    else:
+        _write_versions(set(keys))
+
+
+@contextmanager
+def bumping_versions():
+    """
+    Write the versions bumped in the block, including those of the save and
+    delete signals, with one query at its end. Used inside the transaction of
+    the writes touching several rows.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+    token = _pending.set(set())
+    try:
+        yield
+        pending = _pending.get()
+    finally:
+        _pending.reset(token)
+    _write_versions(pending)
+
+
+def bump_document_versions(document_ids):
+    bump_versions([DOCUMENTS_VERSION] + [document_version(pk) for pk in document_ids])
+
+
+def bump_annotation_versions(document_ids):
+    # annotations are not counted in the statistics
+    bump_versions([document_version(pk) for pk in document_ids])
@@ -0,0 +1,53 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def _unauthorized(request, authenticators, error):
+    response = JsonResponse({"detail": error.detail}, status=401)
+    if authenticators:
+        response["WWW-Authenticate"] = authenticators[0].authenticate_header(request)
+    return response
+
+
+def _authenticators():
+    return [
+        authentication()
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+
+
+async def async_authenticate(request, authenticators=None):
+    """
+    The user of an async view request, authenticated with the DRF
+    authentication classes. Raises AuthenticationFailed on invalid credentials.
+    """
+    drf_request = Request(request, authenticators=authenticators or _authenticators())
+    # authentication runs on the first access and may query the users
+    return await sync_to_async(lambda: drf_request.user)()
+
+
+def async_login_required(view):
+    """
+    IsAuthenticated for async views, which DRF cannot serve. The user is
+    authenticated with the DRF authentication classes, so the API tokens work
+    the same way, and an anonymous request gets the same 401 response.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        authenticators = _authenticators()
+        try:
+            user = await async_authenticate(request, authenticators)
+        except exceptions.AuthenticationFailed as error:
+            return _unauthorized(request, authenticators, error)
+        if not user.is_authenticated:
+            return _unauthorized(request, authenticators, exceptions.NotAuthenticated())
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
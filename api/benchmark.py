@@ -0,0 +1,273 @@
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.urls import reverse
+
+from annotator.models import Document
+
+
+def benchmark_endpoints():
+    """
+    {name: url} of the API requests the benchmark runs.
+    The annotation list is read for the first annotated document.
+    """
+    endpoints = {
+        "search": reverse("document-search") + "?page_size=25",
+        "search filtered": reverse("document-search")
+        + "?page_size=25&law_types=BAN,DUTY&npa=УК,ТК&status=CHECKED",
+        "search text": reverse("document-search")
+        + "?page_size=25&search=здоровья&search_type=text",
+        "search keyset": reverse("document-search") + "?page_size=25&cursor=",
+        "statistics": reverse("statistics"),
+        "export_all": reverse("export_all-list"),
+        "export_all stream": reverse("export_all-stream") + "?output=ndjson",
+        "statistics pdf": reverse("generate_statistics_pdf"),
+    }
+    document_id = (
+        Document.objects.filter(annotation__isnull=False)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if document_id is not None:
+        endpoints["annotation list"] = reverse("annotation_list", args=[document_id])
+    return endpoints
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of the values.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting queries. connection.queries cannot be used,
+    it is reset at the start of every request.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _request(client, url):
+    response = client.get(url)
+    # streamed responses are only produced while they are consumed
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return response.status_code, size
+
+
+def benchmark_endpoint(client, url, repeat):
+    """
+    Latency percentiles over `repeat` requests after a warm-up request, and the
+    query count and peak Python memory of a separate profiled request.
+    Memory tracing slows the code down, so it is not used for the timed requests.
+    """
+    _request(client, url)
+
+    tracemalloc.start()
+    try:
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            status_code, size = _request(client, url)
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _request(client, url)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "status": status_code,
+        "bytes": size,
+        "queries": queries.count,
+        "peak_memory_kb": round(peak_memory / 1024),
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+    }
+
+
+# Modules that are expensive to import and only needed by some requests
+HEAVY_MODULES = ("reportlab.platypus", "matplotlib", "PIL.Image")
+
+# Runs in a fresh interpreter: loads the app the way a gunicorn worker does
+# before its first request, then imports the extra modules given as arguments
+_STARTUP_SCRIPT = """
+import json, resource, sys, time
+
+started = time.perf_counter()
+import django
+
+django.setup()
+from django.urls import get_resolver
+
+get_resolver().url_patterns
+for module in sys.argv[2:]:
+    __import__(module)
+print(json.dumps({
+    "import_ms": (time.perf_counter() - started) * 1000,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "loaded": [name for name in json.loads(sys.argv[1]) if name in sys.modules],
+}))
+"""
+
+
+def measure_startup(modules=(), repeat=5):
+    """
+    Median import time and peak resident memory of a worker process loading
+    the project and its URL configuration, plus `modules`. Every run uses a
+    new interpreter, so nothing is cached between them.
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT, json.dumps(HEAVY_MODULES)]
+            + list(modules),
+            cwd=settings.BASE_DIR,
+            env=os.environ.copy(),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return {
+        "import_ms": round(statistics.median(run["import_ms"] for run in runs), 1),
+        "max_rss_kb": statistics.median(run["max_rss_kb"] for run in runs),
+        "loaded": runs[-1]["loaded"],
+    }
+
+
+def _load_client(url, headers, deadline, timings, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=120) as response:
+                while response.read(64 * 1024):
+                    pass
+        except (URLError, OSError):
+            errors.append(1)
+            continue
+        timings.append((time.perf_counter() - started) * 1000)
+
+
+def run_mixed_load(base_url, clients, duration, token=None):
+    """
+    Load a running server with concurrent clients, each requesting its URL in
+    a loop for `duration` seconds. `clients` is {name: (path, client count)}.
+    Returns {name: {"requests", "errors", "rps", "p50_ms", "p95_ms"}}.
+    """
+    headers = {"Authorization": "Bearer {}".format(token)} if token else {}
+    deadline = time.perf_counter() + duration
+    results = {name: ([], []) for name in clients}
+    threads = [
+        threading.Thread(
+            target=_load_client,
+            args=(base_url.rstrip("/") + path, headers, deadline, *results[name]),
+        )
+        for name, (path, count) in clients.items()
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    for name, (timings, errors) in results.items():
+        report[name] = {
+            "requests": len(timings),
+            "errors": len(errors),
+            "rps": round(len(timings) / duration, 1),
+            "p50_ms": round(percentile(timings, 0.5), 1) if timings else None,
+            "p95_ms": round(percentile(timings, 0.95), 1) if timings else None,
+        }
+    return report
+
+
+# Pools are kept per database alias, the benchmark must not reuse the pool of the app
+_BENCHMARK_ALIAS = "connection_benchmark"
+
+
+def connection_modes():
+    """
+    {name: overrides of the default database} of the ways a request can get
+    its database connection.
+    """
+    pool = settings.DATABASES["default"].get("OPTIONS", {}).get("pool") or True
+    return {
+        "new connection": {"CONN_MAX_AGE": 0, "OPTIONS": {}},
+        "persistent": {"CONN_MAX_AGE": 600, "OPTIONS": {}},
+        "pool": {"CONN_MAX_AGE": 0, "OPTIONS": {"pool": pool}},
+    }
+
+
+def _connection_cycles(connections, sql, deadline, timings):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        connection = connections[_BENCHMARK_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            cursor.fetchall()
+        # what the request_finished signal does at the end of a request
+        connection.close_if_unusable_or_obsolete()
+        timings.append((time.perf_counter() - started) * 1000)
+    connections[_BENCHMARK_ALIAS].close()
+
+
+def measure_connection_mode(overrides, threads, duration, sql="SELECT 1"):
+    """
+    Requests per second of `threads` threads running one query per request,
+    with the default database configured with `overrides`.
+    """
+    database = dict(settings.DATABASES["default"], **overrides)
+    # a handler must have a default database, it is left unused
+    connections = ConnectionHandler(
+        {"default": dict(settings.DATABASES["default"]), _BENCHMARK_ALIAS: database}
+    )
+    deadline = time.perf_counter() + duration
+    timings = [[] for _ in range(threads)]
+    workers = [
+        threading.Thread(
+            target=_connection_cycles, args=(connections, sql, deadline, timings[i])
+        )
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if connections[_BENCHMARK_ALIAS].vendor == "postgresql":
+        connections[_BENCHMARK_ALIAS].close_pool()
+
+    timings = [timing for thread_timings in timings for timing in thread_timings]
+    return {
+        "requests": len(timings),
+        "rps": round(len(timings) / duration, 1),
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+    }
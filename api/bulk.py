@@ -0,0 +1,161 @@
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from annotator.bulk import bulk_create_annotations
+from annotator.changes import ANNOTATION, record_changes, recording_changes
+from annotator.models import Annotation, Document
+from annotator.versions import bump_annotation_versions, bumping_versions
+from .serializers import AnnotationSerializer
+
+BULK_MAX_OPERATIONS = 1000
+
+BULK_OPERATIONS = ("create", "update", "delete")
+
+# Annotation fields written by bulk updates
+ANNOTATION_UPDATE_FIELDS = [
+    "document",
+    "start",
+    "end",
+    "orig_text",
+    "comment",
+    "law_type",
+    "law_justification",
+    "json_data",
+    # bulk_update does not apply auto_now
+    "updated_at",
+]
+
+
+class BulkValidationError(Exception):
+    def __init__(self, results):
+        super().__init__("Bulk operations are invalid")
+        self.results = results
+
+
+def _operation_id(operation):
+    if operation.get("op") == "delete":
+        value = operation.get("id")
+    else:
+        value = (operation.get("data") or {}).get("id")
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def _preload_documents(operations):
+    document_ids = set()
+    for operation in operations:
+        document_id = (operation.get("data") or {}).get("document")
+        try:
+            document_ids.add(int(document_id))
+        except (TypeError, ValueError):
+            pass
+    return Document.objects.in_bulk(document_ids)
+
+
+def apply_annotation_operations(operations, queryset):
+    """
+    Validate annotation operations together and apply them in one transaction:
+        {"op": "create", "data": {...}}
+        {"op": "update", "data": {"id": ..., ...}}
+        {"op": "delete", "id": ...}
+    Returns per-item results, raises BulkValidationError (with the per-item results)
+    if any operation is invalid, in which case nothing is applied.
+    """
+    ids = [_operation_id(operation) for operation in operations]
+    create_ids, other_ids = [], []
+    for operation, annotation_id in zip(operations, ids):
+        if annotation_id is not None:
+            if operation.get("op") == "create":
+                create_ids.append(annotation_id)
+            else:
+                other_ids.append(annotation_id)
+
+    # everything the validation needs is loaded with one query per kind
+    existing = {
+        str(pk): annotation for pk, annotation in queryset.in_bulk(other_ids).items()
+    }
+    taken_ids = {
+        str(pk)
+        for pk in Annotation.objects.filter(pk__in=create_ids).values_list(
+            "pk", flat=True
+        )
+    }
+    context = {"documents": _preload_documents(operations)}
+
+    results = []
+    to_create, to_update, to_delete = [], [], []
+    changed_documents = set()
+    seen_ids = set()
+    has_errors = False
+    for index, (operation, annotation_id) in enumerate(zip(operations, ids)):
+        op = operation.get("op")
+        result = {"index": index, "op": op, "id": annotation_id}
+        errors = None
+
+        if op not in BULK_OPERATIONS:
+            errors = {"op": ["Must be one of: {}".format(", ".join(BULK_OPERATIONS))]}
+        elif annotation_id is None:
+            errors = {"id": ["Must be a valid UUID"]}
+        elif annotation_id in seen_ids:
+            errors = {"id": ["Duplicate annotation in the batch"]}
+        elif op == "create":
+            serializer = AnnotationSerializer(
+                data=operation.get("data"), context=context
+            )
+            if annotation_id in taken_ids:
+                errors = {"id": ["Annotation already exists"]}
+            elif serializer.is_valid():
+                annotation = Annotation(**serializer.validated_data)
+                to_create.append(annotation)
+                changed_documents.add(annotation.document_id)
+            else:
+                errors = serializer.errors
+        elif annotation_id not in existing:
+            errors = {"id": ["Annotation not found"]}
+        elif op == "update":
+            annotation = existing[annotation_id]
+            serializer = AnnotationSerializer(
+                annotation, data=operation.get("data"), partial=True, context=context
+            )
+            if serializer.is_valid():
+                # the annotation may be moved to another document
+                changed_documents.add(annotation.document_id)
+                for attr, value in serializer.validated_data.items():
+                    setattr(annotation, attr, value)
+                to_update.append(annotation)
+                changed_documents.add(annotation.document_id)
+            else:
+                errors = serializer.errors
+        else:
+            to_delete.append(annotation_id)
+            changed_documents.add(existing[annotation_id].document_id)
+
+        seen_ids.add(annotation_id)
+        if errors:
+            has_errors = True
+            result.update(status="error", errors=errors)
+        else:
+            result["status"] = {"create": "created", "update": "updated"}.get(
+                op, "deleted"
+            )
+        results.append(result)
+
+    if has_errors:
+        raise BulkValidationError(results)
+
+    now = timezone.now()
+    for annotation in to_update:
+        annotation.updated_at = now
+
+    # the deletions are logged by the delete signals
+    with transaction.atomic(), recording_changes(), bumping_versions():
+        bulk_create_annotations(to_create)
+        Annotation.objects.bulk_update(to_update, ANNOTATION_UPDATE_FIELDS)
+        record_changes(ANNOTATION, [annotation.pk for annotation in to_update])
+        Annotation.objects.filter(pk__in=to_delete).delete()
+        bump_annotation_versions(changed_documents)
+    return results
@@ -0,0 +1,105 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from annotator.versions import get_versions, version_time
+
+# Cached data is replaced by a new version on every write, the timeout only
+# limits how long a stale entry occupies the cache
+DATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def _request_versions(request, version_keys, args, kwargs):
+    # read once per request, the ETag, Last-Modified and the cached data use the same versions
+    if not hasattr(request, "_versions"):
+        request._versions = get_versions(version_keys(*args, **kwargs))
+    return request._versions
+
+
+def versioned(version_keys):
+    """
+    Conditional GET for a view whose response only depends on the data under
+    the versions `version_keys(*args, **kwargs)`. ETag and Last-Modified come
+    from the versions kept in the database, see annotator.versions, so a
+    request with a matching If-None-Match gets 304 Not Modified after a single
+    query. Async views are supported; the versions are then read in a thread.
+    """
+
+    def etag(request, *args, **kwargs):
+        versions = _request_versions(request, version_keys, args, kwargs)
+        payload = "|".join(
+            [request.get_full_path()] + [versions[key] for key in sorted(versions)]
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        return version_time(_request_versions(request, version_keys, args, kwargs))
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(
+            view
+        )
+
+        # the browser must revalidate, otherwise it could guess a freshness
+        # period from Last-Modified and show stale data
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # the ETag and Last-Modified are computed in the event loop
+                await sync_to_async(_request_versions)(
+                    request, version_keys, args, kwargs
+                )
+                response = await conditional_view(request, *args, **kwargs)
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _data_key(request, name):
+    versions = request._versions
+    digest = hashlib.sha1(
+        "|".join("{}={}".format(key, versions[key]) for key in sorted(versions)).encode(
+            "utf-8"
+        )
+    ).hexdigest()
+    return "data:{}:{}".format(name, digest)
+
+
+def cached_data(request, name, compute):
+    """
+    Data of a @versioned view, computed once per version of its data.
+    """
+    key = _data_key(request, name)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, DATA_CACHE_TIMEOUT)
+    return data
+
+
+async def acached_data(request, name, compute):
+    """
+    cached_data() of an async view, `compute` is a coroutine function.
+    """
+    key = _data_key(request, name)
+    data = await cache.aget(key)
+    if data is None:
+        data = await compute()
+        await cache.aset(key, data, DATA_CACHE_TIMEOUT)
+    return data
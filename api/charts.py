@@ -0,0 +1,80 @@
+from functools import lru_cache
+from io import BytesIO
+
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.shapes import Drawing
+from reportlab.lib import colors
+from reportlab.platypus import Image
+
+# Resolution of raster charts; the report is printed at most at A4/letter size
+CHART_DPI = 150
+
+# Share of the drawing height reserved for the rotated category labels
+_LABELS_HEIGHT = 0.25
+
+
+@lru_cache(maxsize=64)
+def _render_bar_chart_png(data, labels, color, figsize, dpi):
+    # matplotlib is only needed for raster charts, which are off by default
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # A standalone Figure does not touch the pyplot global state, so charts
+    # can be rendered from several threads at once
+    figure = Figure(figsize=figsize, layout="tight")
+    FigureCanvasAgg(figure)
+    axes = figure.subplots()
+    axes.bar(labels, data, color=color)
+    axes.tick_params(axis="x", labelrotation=60)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment("right")
+
+    img_buffer = BytesIO()
+    figure.savefig(img_buffer, format="png", dpi=dpi)
+    return img_buffer.getvalue()
+
+
+def render_bar_chart_png(data, labels, color, figsize, dpi=CHART_DPI):
+    """
+    PNG image of a bar chart. Charts are memoized by their input data.
+    """
+    return _render_bar_chart_png(tuple(data), tuple(labels), color, tuple(figsize), dpi)
+
+
+def bar_chart_drawing(data, labels, color, width, height, font_name="Helvetica"):
+    """
+    Vector bar chart, embedded into the PDF as drawing operators.
+    """
+    drawing = Drawing(width, height)
+    chart = VerticalBarChart()
+    chart.x = 0.08 * width
+    chart.y = _LABELS_HEIGHT * height
+    chart.width = 0.9 * width
+    chart.height = (0.95 - _LABELS_HEIGHT) * height
+    # an empty chart still needs one category
+    chart.data = [list(data) or [0]]
+    chart.bars[0].fillColor = colors.toColor(color)
+    chart.bars[0].strokeColor = None
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labels.fontName = font_name
+    chart.valueAxis.labels.fontSize = 7
+    chart.categoryAxis.categoryNames = list(labels) or [""]
+    chart.categoryAxis.labels.angle = 60
+    chart.categoryAxis.labels.boxAnchor = "ne"
+    chart.categoryAxis.labels.fontName = font_name
+    chart.categoryAxis.labels.fontSize = 7
+    drawing.add(chart)
+    return drawing
+
+
+def bar_chart_flowable(
+    data, labels, color, figsize, width, vector=True, font_name="Helvetica"
+):
+    """
+    Bar chart flowable `width` wide, keeping the aspect ratio of `figsize`.
+    """
+    height = width * figsize[1] / figsize[0]
+    if vector:
+        return bar_chart_drawing(data, labels, color, width, height, font_name)
+    png = render_bar_chart_png(data, labels, color, figsize)
+    return Image(BytesIO(png), width=width, height=height)
@@ -0,0 +1,99 @@
+import re
+
+# Stand-in for the classification model: word stems typical for every class.
+# Produces results in the same format as the model API.
+JUSTIFICATION_STEMS = {
+    "AUTH": ["закон", "государств", "орган", "власт", "суд", "полномоч", "прав"],
+    "CARE": ["здоров", "защит", "помощ", "безопасн", "вред", "жизн", "забот"],
+    "LOYAL": ["гражданств", "родин", "отечеств", "семь", "обществ", "служб"],
+    "FAIR": ["равн", "справедлив", "свобод", "возмещ", "компенсац", "добросовест"],
+    "PUR": ["нравствен", "достоинств", "чест", "культур", "морал", "духовн"],
+}
+LAW_TYPE_STEMS = {
+    "DUTY": ["обязан", "должн", "обеспечива"],
+    "ALLOW": ["вправе", "может", "могут", "разреш", "допуска"],
+    "BAN": ["запрещ", "не допуска", "не может", "не вправе"],
+    "DEF": ["понима", "являет", "признает", "означает"],
+    "DEC": ["гарантир", "признают", "основыва"],
+    "GOAL": ["цел", "задач", "направлен"],
+}
+
+# Added to every class, so that texts without matches get a flat distribution
+SMOOTHING = 0.5
+
+_RE_WORD = re.compile(r"\w+")
+
+
+def _match(text, stems_by_class):
+    """
+    {class: [matched words]}: words of the text starting with one of the class stems.
+    Multi-word stems are matched as phrases.
+    """
+    lowered = text.lower()
+    words = _RE_WORD.findall(lowered)
+    matches = {}
+    for class_name, stems in stems_by_class.items():
+        found = []
+        for stem in stems:
+            if " " in stem:
+                if stem in lowered:
+                    found.append(stem)
+                continue
+            # a negated word belongs to the negative phrase ("не может")
+            found.extend(
+                word
+                for previous, word in zip([""] + words, words)
+                if word.startswith(stem) and previous != "не"
+            )
+        matches[class_name] = found
+    return matches
+
+
+def _probabilities(matches):
+    scores = {
+        class_name: len(found) + SMOOTHING for class_name, found in matches.items()
+    }
+    total = sum(scores.values())
+    return {class_name: score / total for class_name, score in scores.items()}
+
+
+def _keywords(text, matches):
+    # keywords are returned as they appear in the text, so that they can be annotated
+    keywords = {}
+    for class_name, found in matches.items():
+        unique = []
+        for word in found:
+            position = text.lower().find(word)
+            original = text[position : position + len(word)]
+            if original not in unique:
+                unique.append(original)
+        if unique:
+            keywords[class_name] = unique
+    return keywords
+
+
+def classify_norm(text):
+    justification_matches = _match(text, JUSTIFICATION_STEMS)
+    law_type_matches = _match(text, LAW_TYPE_STEMS)
+    law_type_probability = _probabilities(law_type_matches)
+    # nothing matched: the norm is of some other type
+    if not any(law_type_matches.values()):
+        law_type_probability = {law_type: 0.0 for law_type in law_type_probability}
+        law_type_probability["OTHER"] = 1.0
+    return {
+        "justification": {
+            "justification_probability": _probabilities(justification_matches),
+            "justification_keywords": _keywords(text, justification_matches),
+        },
+        "law_type": {
+            "law_type_probability": law_type_probability,
+            "law_type_keywords": _keywords(text, law_type_matches),
+        },
+    }
+
+
+def split_norms(text):
+    """
+    Split a legal act into norms: one norm per non-empty paragraph.
+    """
+    return [paragraph.strip() for paragraph in text.splitlines() if paragraph.strip()]
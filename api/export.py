@@ -0,0 +1,149 @@
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework.utils.encoders import JSONEncoder
+
+from annotator.changes import ANNOTATION, DOCUMENT, changes_since
+from annotator.models import Annotation
+from .serializers import (
+    DocumentAndAnnotationSerializer,
+    DocumentSerializer,
+    ExportAnnotationSerializer,
+)
+
+# Number of documents fetched from the server-side cursor (and serialized) at once
+EXPORT_CHUNK_SIZE = 500
+
+EXPORT_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+# Change log entries read by one delta export request
+DELTA_DEFAULT_LIMIT = 1000
+DELTA_MAX_LIMIT = 10000
+
+
+def _dumps(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+
+
+def iter_serialized_chunks(queryset, serializer_class, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield the objects of `queryset` serialized in chunks of `chunk_size`.
+    Objects are read through a server-side cursor, so only one chunk is held
+    in memory.
+    """
+    objects = queryset.order_by("pk").iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            return
+        yield serializer_class(chunk, many=True).data
+
+
+def iter_document_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield serialized documents with their annotations in chunks of `chunk_size`.
+    Annotations of every chunk are fetched with a single query.
+    """
+    return iter_serialized_chunks(
+        queryset.select_related("user").prefetch_related("annotation_set"),
+        DocumentAndAnnotationSerializer,
+        chunk_size,
+    )
+
+
+def stream_json_array(chunks):
+    # Same layout as the regular export: a single JSON array
+    yield "["
+    first = True
+    for chunk in chunks:
+        body = ",".join(_dumps(item) for item in chunk)
+        yield body if first else "," + body
+        first = False
+    yield "]"
+
+
+def stream_json(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    return stream_json_array(iter_document_chunks(queryset, chunk_size))
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    # One document per line
+    for chunk in iter_document_chunks(queryset, chunk_size):
+        yield "".join(_dumps(item) + "\n" for item in chunk)
+
+
+def stream_export(queryset, export_format="json", chunk_size=EXPORT_CHUNK_SIZE):
+    if export_format == "ndjson":
+        chunks = stream_ndjson(queryset, chunk_size)
+    else:
+        chunks = stream_json(queryset, chunk_size)
+    return (chunk.encode("utf-8") for chunk in chunks)
+
+
+async def _aiter_chunks(chunks):
+    # every chunk is produced in the sync thread of the request, which keeps
+    # the server-side cursor on one connection while the event loop is free
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def streaming_content(request, chunks):
+    """
+    Content of a StreamingHttpResponse for the server handling the request.
+    The ASGI server reads a sync iterator into memory before sending it, so
+    it gets an async iterator over the same chunks.
+    """
+    if isinstance(request, ASGIRequest):
+        return _aiter_chunks(chunks)
+    return chunks
+
+
+def delta_export(queryset, cursor, limit=DELTA_DEFAULT_LIMIT):
+    """
+    Documents of `queryset` and their annotations changed after the change log
+    `cursor`, and the ids of those deleted since. Objects that left the
+    exported set count as deleted. Continue from the returned cursor while
+    has_more is set.
+    """
+    changes, next_cursor, has_more = changes_since(cursor, limit)
+    queryset = queryset.prefetch_related(None)
+
+    documents = list(
+        queryset.select_related("user")
+        .filter(
+            pk__in=[int(pk) for pk, deleted in changes[DOCUMENT].items() if not deleted]
+        )
+        .order_by("pk")
+    )
+    annotations = list(
+        Annotation.objects.filter(
+            pk__in=[pk for pk, deleted in changes[ANNOTATION].items() if not deleted],
+            document__in=queryset.values("pk"),
+        ).order_by("pk")
+    )
+
+    found_documents = {str(document.pk) for document in documents}
+    found_annotations = {str(annotation.pk) for annotation in annotations}
+    return {
+        "cursor": next_cursor,
+        "has_more": has_more,
+        "documents": DocumentSerializer(documents, many=True).data,
+        "annotations": ExportAnnotationSerializer(annotations, many=True).data,
+        "deleted": {
+            "documents": sorted(
+                int(pk) for pk in changes[DOCUMENT] if pk not in found_documents
+            ),
+            "annotations": sorted(
+                pk for pk in changes[ANNOTATION] if pk not in found_annotations
+            ),
+        },
+    }
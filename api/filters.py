@@ -0,0 +1,94 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from annotator.models import Document
+
+# Comma-separated filter parameters matched against the document choice codes
+CHOICE_FILTERS = {
+    "law_types": ("law_type", Document.TYPE_CHOICES),
+    "dominant_justifications": (
+        "dominant_justification",
+        Document.JUSTIFICATION_CHOICES,
+    ),
+    "npa": ("NPA", Document.NPA_CHOICES),
+    "status": ("status", Document.STATUS_CHOICES),
+}
+
+
+def choice_codes(values, choices):
+    """
+    Choice codes equal to the values up to case, unknown values are dropped.
+    """
+    codes = {code.lower(): code for code, _ in choices}
+    return [codes[value.lower()] for value in values if value.lower() in codes]
+
+
+def _parse_date(params, name):
+    try:
+        return date.fromisoformat(params[name])
+    except ValueError:
+        raise ValidationError({name: ["Must be a YYYY-MM-DD date"]})
+
+
+def _start_of_day(params, name, days=0):
+    day = _parse_date(params, name)
+    try:
+        return timezone.make_aware(
+            datetime.combine(day + timedelta(days=days), time.min)
+        )
+    except OverflowError:
+        raise ValidationError({name: ["The date is out of range"]})
+
+
+def document_filter(params, prefix=""):
+    """
+    Q object of the document filters in the query parameters `params`:
+    law_types, dominant_justifications, npa and status (comma-separated, any
+    case), from_date and to_date (YYYY-MM-DD, both included) and user (part
+    of the username). `prefix` is the path to the document, e.g. "document__"
+    for annotations. Raises ValidationError on a malformed or out of range
+    date.
+    """
+    q_objects = Q()
+
+    # filter values are matched case-insensitively against the choice codes
+    # up front, so that the filters are indexed IN lookups
+    for name, (field, choices) in CHOICE_FILTERS.items():
+        if params.get(name, ""):
+            codes = choice_codes(params[name].split(","), choices)
+            q_objects &= Q(**{"{}{}__in".format(prefix, field): codes})
+
+    # compared as times, so that the created_at index is used
+    if params.get("from_date", ""):
+        from_time = _start_of_day(params, "from_date")
+        q_objects &= Q(**{prefix + "created_at__gte": from_time})
+    if params.get("to_date", ""):
+        to_time = _start_of_day(params, "to_date", days=1)
+        q_objects &= Q(**{prefix + "created_at__lt": to_time})
+
+    if params.get("user", ""):
+        q_objects &= Q(**{prefix + "user__username__icontains": params["user"]})
+    return q_objects
+
+
+class DocumentFilterMixin:
+    """
+    Viewset mixin filtering the queryset of the listing actions by
+    document_filter() of the query parameters, the filters are applied in SQL.
+    """
+
+    # path from the viewset model to the document
+    document_filter_prefix = ""
+    # a single object is found by its id whatever the query parameters
+    document_filter_actions = ("list", "search", "stream", "changes")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in self.document_filter_actions:
+            return queryset
+        return queryset.filter(
+            document_filter(self.request.query_params, self.document_filter_prefix)
+        )
@@ -0,0 +1,224 @@
+import math
+import time
+
+from django.db import transaction
+from rest_framework import serializers
+
+from annotator.bulk import bulk_create_annotations, bulk_create_documents
+from annotator.models import Annotation, Document, normalize_text
+
+# Points distributed between justifications of a norm, as in manual marking
+JUSTIFICATION_POINTS_TOTAL = 10
+
+JUSTIFICATIONS = [
+    justification
+    for justification, _ in Document.JUSTIFICATION_CHOICES
+    if justification != "UNCHECKED"
+]
+LAW_TYPES = [law_type for law_type, _ in Document.TYPE_CHOICES]
+
+INGEST_MAX_NORMS = 5000
+
+
+def _validate_keys(value, allowed):
+    unknown = set(value) - set(allowed)
+    if unknown:
+        raise serializers.ValidationError(
+            "Unknown keys: {}".format(", ".join(sorted(unknown)))
+        )
+    return value
+
+
+class JustificationResultSerializer(serializers.Serializer):
+    justification_probability = serializers.DictField(
+        child=serializers.FloatField(min_value=0, max_value=1)
+    )
+    justification_keywords = serializers.DictField(
+        child=serializers.ListField(child=serializers.CharField()),
+        required=False,
+        default=dict,
+    )
+
+    def validate_justification_probability(self, value):
+        return _validate_keys(value, JUSTIFICATIONS)
+
+    def validate_justification_keywords(self, value):
+        return _validate_keys(value, JUSTIFICATIONS)
+
+
+class LawTypeResultSerializer(serializers.Serializer):
+    law_type_probability = serializers.DictField(
+        child=serializers.FloatField(min_value=0, max_value=1)
+    )
+    law_type_keywords = serializers.DictField(
+        child=serializers.ListField(child=serializers.CharField()),
+        required=False,
+        default=dict,
+    )
+
+    def validate_law_type_probability(self, value):
+        return _validate_keys(value, LAW_TYPES)
+
+    def validate_law_type_keywords(self, value):
+        return _validate_keys(value, LAW_TYPES)
+
+
+class ClassificationResultsSerializer(serializers.Serializer):
+    justification = JustificationResultSerializer()
+    law_type = LawTypeResultSerializer()
+
+
+class ClassifiedNormSerializer(serializers.Serializer):
+    paragraph = serializers.CharField()
+    results = ClassificationResultsSerializer()
+
+
+class IngestSerializer(serializers.Serializer):
+    """
+    A legal act split into norms, as returned by the classification model.
+    """
+
+    # leaves room for the " - норма N" suffix
+    title = serializers.CharField(max_length=230)
+    NPA = serializers.ChoiceField(choices=Document.NPA_CHOICES)
+    norms = serializers.ListField(
+        child=ClassifiedNormSerializer(), min_length=1, max_length=INGEST_MAX_NORMS
+    )
+
+
+# Encodings legal acts are usually published in
+ACT_ENCODINGS = ["utf-8-sig", "cp1251"]
+
+
+class LegalActImportSerializer(serializers.Serializer):
+    """
+    A whole legal act as a text file, split into norms on the server.
+    """
+
+    NPA = serializers.ChoiceField(choices=Document.NPA_CHOICES)
+    file = serializers.FileField()
+    encoding = serializers.ChoiceField(choices=ACT_ENCODINGS, default="utf-8-sig")
+
+
+def justification_points(probabilities, total=JUSTIFICATION_POINTS_TOTAL):
+    """
+    Distribute `total` points between justifications proportionally to the
+    probabilities, in their order, never exceeding `total`.
+    """
+    points = {}
+    assigned = 0
+    for justification, probability in probabilities.items():
+        value = math.floor(probability * total + 0.5)
+        if assigned + value > total:
+            if total - assigned > 0:
+                points[justification] = total - assigned
+            break
+        points[justification] = value
+        assigned += value
+    return points
+
+
+def dominant_law_type(probabilities):
+    if not probabilities:
+        return "UNCHECKED"
+    return max(probabilities, key=probabilities.get)
+
+
+def keyword_annotation(document, keyword, law_type, law_justification):
+    """
+    Annotation of the first occurrence of `keyword` in the document text,
+    None if the text does not contain it.
+    """
+    start = document.text.find(keyword)
+    if start == -1:
+        return None
+    end = start + len(keyword)
+    # the Recogito annotation is rebuilt from the columns, see annotator.recogito
+    return Annotation(
+        document=document,
+        start=start,
+        end=end,
+        orig_text=keyword,
+        comment="",
+        law_type=law_type,
+        law_justification=law_justification,
+    )
+
+
+def norm_document(user, title, npa, norm):
+    results = norm["results"]
+    points = justification_points(results["justification"]["justification_probability"])
+    return Document(
+        user=user,
+        title=title,
+        text=normalize_text(norm["paragraph"]),
+        NPA=npa,
+        status="GENERATED",
+        law_type=dominant_law_type(results["law_type"]["law_type_probability"]),
+        **{
+            "{}_points".format(justification): value
+            for justification, value in points.items()
+        },
+    )
+
+
+def norm_annotations(document, norm):
+    results = norm["results"]
+    annotations = []
+    justification_keywords = results["justification"]["justification_keywords"]
+    for justification, keywords in justification_keywords.items():
+        for keyword in keywords:
+            annotations.append(
+                keyword_annotation(document, keyword, "UNCHECKED", justification)
+            )
+    law_type_keywords = results["law_type"]["law_type_keywords"]
+    for law_type, keywords in law_type_keywords.items():
+        for keyword in keywords:
+            annotations.append(
+                keyword_annotation(document, keyword, law_type, "UNCHECKED")
+            )
+    return [annotation for annotation in annotations if annotation is not None]
+
+
+def ingest_classified_norms(user, title, npa, norms):
+    """
+    Create the documents and keyword annotations of classified norms
+    in one transaction. Returns per-norm results and the ingestion statistics.
+    """
+    started = time.perf_counter()
+    documents = [
+        norm_document(
+            user,
+            "{} - норма {}".format(title, i + 1) if len(norms) > 1 else title,
+            npa,
+            norm,
+        )
+        for i, norm in enumerate(norms)
+    ]
+
+    with transaction.atomic():
+        bulk_create_documents(documents)
+        annotations = [
+            norm_annotations(document, norm) for document, norm in zip(documents, norms)
+        ]
+        bulk_create_annotations(
+            [annotation for group in annotations for annotation in group]
+        )
+
+    elapsed = time.perf_counter() - started
+    results = [
+        {
+            "id": document.id,
+            "title": document.title,
+            "dominant_justification": document.dominant_justification,
+            "law_type": document.law_type,
+            "annotations": len(group),
+        }
+        for document, group in zip(documents, annotations)
+    ]
+    return results, {
+        "norms": len(documents),
+        "annotations": sum(len(group) for group in annotations),
+        "elapsed": round(elapsed, 3),
+        "norms_per_second": round(len(documents) / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,295 @@
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from rest_framework import serializers
+
+from annotator.models import ClassificationJob, Document
+from .classifier import classify_norm, split_norms
+from .ingest import ingest_classified_norms
+
+logger = logging.getLogger(__name__)
+
+# Throughput assumed until some jobs have been completed
+DEFAULT_SECONDS_PER_NORM = 1.0
+
+# Number of recently completed jobs the throughput is estimated from
+THROUGHPUT_WINDOW = 20
+
+# Queue depth thresholds of the "умеренная" and "высокая" model load
+MODERATE_LOAD_NORMS = 50
+HIGH_LOAD_NORMS = 500
+
+MODEL_NAME = "Keyword Classifier 1.0"
+
+# Jobs listed on the classification page
+STATUS_JOBS_LIMIT = 50
+
+# Progress of a running job is written at most this often
+PROGRESS_UPDATE_SECONDS = 1.0
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ClassificationJobSerializer(serializers.Serializer):
+    """
+    A legal act submitted for classification.
+    """
+
+    # leaves room for the " - норма N" suffix
+    title = serializers.CharField(max_length=230)
+    NPA = serializers.ChoiceField(choices=Document.NPA_CHOICES)
+    text = serializers.CharField()
+
+    def validate_text(self, value):
+        if not split_norms(value):
+            raise serializers.ValidationError("The text contains no norms")
+        return value
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.CLASSIFICATION_WORKERS,
+                thread_name_prefix="classification",
+            )
+            # jobs left by a previous process: queued ones, and running ones
+            # whose worker stopped
+            _executor.submit(_run_queued_jobs)
+        return _executor
+
+
+def start_classification_workers():
+    """
+    Start the background workers of this process, which pick up the jobs left
+    in the queue. Does nothing with CLASSIFICATION_WORKERS = 0. Called when a
+    server worker starts, see gunicorn.conf.py.
+    """
+    if settings.CLASSIFICATION_WORKERS > 0:
+        _get_executor()
+
+
+def create_classification_job(user, title, npa, text):
+    """
+    Queue a legal act for classification. With CLASSIFICATION_WORKERS = 0 jobs are
+    left in the queue for the process_classification_jobs command.
+    """
+    job = ClassificationJob.objects.create(
+        user=user,
+        title=title,
+        NPA=npa,
+        text=text,
+        norms_total=len(split_norms(text)),
+    )
+    if settings.CLASSIFICATION_WORKERS > 0:
+        # the worker must not see the job before it is committed; it takes the
+        # oldest queued job, which is this one unless others are waiting
+        transaction.on_commit(lambda: _get_executor().submit(_run_queued_jobs))
+    return job
+
+
+def _run_queued_jobs():
+    close_old_connections()
+    try:
+        process_queued_jobs()
+    except Exception:
+        logger.exception("Processing the classification queue failed")
+    finally:
+        close_old_connections()
+
+
+def requeue_stale_jobs():
+    """
+    Queue again the running jobs without a heartbeat for more than
+    CLASSIFICATION_JOB_TIMEOUT seconds, whose worker is assumed to have
+    stopped. Returns their number.
+    """
+    reported_before = timezone.now() - timedelta(
+        seconds=settings.CLASSIFICATION_JOB_TIMEOUT
+    )
+    return ClassificationJob.objects.filter(
+        Q(heartbeat_at__lt=reported_before)
+        # running before the heartbeats were recorded
+        | Q(heartbeat_at__isnull=True, started_at__lt=reported_before),
+        status="RUNNING",
+    ).update(
+        status="QUEUED", started_at=None, heartbeat_at=None, worker="", norms_done=0
+    )
+
+
+def process_classification_job(job_id):
+    """
+    Classify the norms of a queued job and persist them.
+    Returns False if the job has been taken by another worker, before it
+    started or while it ran.
+    """
+    # the token tells this worker's writes from those of a worker the job was
+    # queued again for, once this one was assumed to have stopped
+    worker = uuid.uuid4().hex
+    now = timezone.now()
+    claimed = ClassificationJob.objects.filter(pk=job_id, status="QUEUED").update(
+        status="RUNNING", started_at=now, heartbeat_at=now, worker=worker
+    )
+    if not claimed:
+        return False
+    owned = ClassificationJob.objects.filter(pk=job_id, worker=worker)
+
+    job = ClassificationJob.objects.select_related("user").get(pk=job_id)
+    try:
+        norms = []
+        reported_at = time.monotonic()
+        for paragraph in split_norms(job.text):
+            norms.append({"paragraph": paragraph, "results": classify_norm(paragraph)})
+            if time.monotonic() - reported_at >= PROGRESS_UPDATE_SECONDS:
+                owned.update(norms_done=len(norms), heartbeat_at=timezone.now())
+                reported_at = time.monotonic()
+
+        with transaction.atomic():
+            # the job row stays locked until the norms are written, so it
+            # cannot be queued again meanwhile
+            if not owned.filter(status="RUNNING").select_for_update().exists():
+                logger.warning("Classification job %s was queued again", job_id)
+                return False
+            if norms:
+                ingest_classified_norms(job.user, job.title, job.NPA, norms)
+            owned.update(
+                status="DONE", norms_done=len(norms), finished_at=timezone.now()
+            )
+    except Exception as error:
+        owned.update(status="FAILED", error=str(error), finished_at=timezone.now())
+        raise
+    return True
+
+
+def process_queued_jobs():
+    """
+    Process queued jobs in the order they were submitted, after queueing the
+    stale running jobs again. Returns the number of processed jobs.
+    """
+    requeue_stale_jobs()
+    processed = 0
+    while True:
+        job_id = (
+            ClassificationJob.objects.filter(status="QUEUED")
+            .order_by("created_at", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if job_id is None:
+            return processed
+        try:
+            if process_classification_job(job_id):
+                processed += 1
+        except Exception:
+            logger.exception("Classification job %s failed", job_id)
+
+
+def seconds_per_norm():
+    """
+    Average processing time of a norm over the recently completed jobs.
+    """
+    recent = ClassificationJob.objects.filter(
+        status="DONE", norms_total__gt=0, started_at__isnull=False
+    ).order_by("-finished_at")[:THROUGHPUT_WINDOW]
+    norms, seconds = 0, 0.0
+    for started_at, finished_at, norms_total in recent.values_list(
+        "started_at", "finished_at", "norms_total"
+    ):
+        norms += norms_total
+        seconds += (finished_at - started_at).total_seconds()
+    if not norms:
+        return DEFAULT_SECONDS_PER_NORM
+    return seconds / norms
+
+
+def queue_depth():
+    """
+    Number of norms waiting for classification.
+    """
+    remaining = ClassificationJob.objects.filter(
+        status__in=["QUEUED", "RUNNING"]
+    ).aggregate(total=Sum(F("norms_total") - F("norms_done")))["total"]
+    return remaining or 0
+
+
+def model_load(depth):
+    if depth >= HIGH_LOAD_NORMS:
+        return "высокая"
+    if depth >= MODERATE_LOAD_NORMS:
+        return "умеренная"
+    return "низкая"
+
+
+def _minutes(seconds):
+    return max(1, math.ceil(seconds / 60))
+
+
+def get_jobs_status(jobs):
+    """
+    Status rows of the jobs, in the format of the classification page,
+    with the queue depth and the time until the queue is processed.
+    """
+    per_norm = seconds_per_norm()
+    workers = max(1, settings.CLASSIFICATION_WORKERS)
+
+    # norms ahead of every pending job, in the order the queue is processed
+    ahead = {}
+    remaining = 0
+    pending = ClassificationJob.objects.filter(
+        status__in=["QUEUED", "RUNNING"]
+    ).order_by("-status", "created_at", "pk")
+    for pk, norms_total, norms_done in pending.values_list(
+        "pk", "norms_total", "norms_done"
+    ):
+        remaining += norms_total - norms_done
+        ahead[pk] = remaining
+
+    documents = []
+    for job in jobs:
+        if job.pk in ahead:
+            estimated_time = _minutes(ahead[job.pk] * per_norm / workers)
+        elif job.status == "DONE" and job.started_at:
+            estimated_time = _minutes(
+                (job.finished_at - job.started_at).total_seconds()
+            )
+        else:
+            estimated_time = None
+        documents.append(
+            {
+                "id": job.pk,
+                "name": job.title,
+                "timestamp": job.created_at,
+                "status": job.get_status_display(),
+                "norms": "{}/{}".format(job.norms_done, job.norms_total),
+                "norms_done": job.norms_done,
+                "norms_total": job.norms_total,
+                "estimatedTime": estimated_time,
+                "error": job.error,
+            }
+        )
+    return {
+        "documents": documents,
+        "queue_depth": remaining,
+        "eta": _minutes(remaining * per_norm / workers) if remaining else 0,
+    }
+
+
+def get_model_info():
+    depth = queue_depth()
+    return {
+        "modelName": MODEL_NAME,
+        "modelStatus": "Активна",
+        "modelLoad": model_load(depth),
+        "queue_depth": depth,
+    }
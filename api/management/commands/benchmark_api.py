@@ -0,0 +1,92 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.test import APIClient
+
+from annotator.corpus import corpus_users, generate_corpus
+from annotator.models import Annotation, Document
+from api.benchmark import benchmark_endpoint, benchmark_endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the API endpoints through the test client and report latency "
+        "percentiles, query counts and peak memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--documents",
+            type=int,
+            default=0,
+            help="Generate a corpus until the table has at least this many documents",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            dest="endpoints",
+            help="Run only this endpoint, can be repeated",
+        )
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        missing = options["documents"] - Document.objects.count()
+        if missing > 0:
+            self.stdout.write("Generating {} documents...".format(missing))
+            generate_corpus(corpus_users(10), missing, seed=options["seed"])
+
+        endpoints = benchmark_endpoints()
+        if options["endpoints"]:
+            unknown = set(options["endpoints"]) - set(endpoints)
+            if unknown:
+                raise CommandError(
+                    "Unknown endpoints: {}. Available: {}".format(
+                        ", ".join(sorted(unknown)), ", ".join(endpoints)
+                    )
+                )
+            endpoints = {name: endpoints[name] for name in options["endpoints"]}
+
+        # allows the test client host
+        setup_test_environment()
+        client = APIClient()
+        client.force_authenticate(User.objects.get_or_create(username="benchmark")[0])
+
+        report = {
+            "database": connection.vendor,
+            "documents": Document.objects.count(),
+            "annotations": Annotation.objects.count(),
+            "repeat": options["repeat"],
+            "endpoints": {},
+        }
+        self.stdout.write(
+            "{database}: {documents} documents, {annotations} annotations".format(
+                **report
+            )
+        )
+        self.stdout.write(
+            "{:<20} {:>6} {:>10} {:>10} {:>8} {:>12} {:>12}".format(
+                "endpoint",
+                "status",
+                "p50 ms",
+                "p95 ms",
+                "queries",
+                "memory KB",
+                "bytes",
+            )
+        )
+        for name, url in endpoints.items():
+            result = benchmark_endpoint(client, url, options["repeat"])
+            report["endpoints"][name] = result
+            self.stdout.write(
+                "{:<20} {status:>6} {p50_ms:>10} {p95_ms:>10} {queries:>8} "
+                "{peak_memory_kb:>12} {bytes:>12}".format(name, **result)
+            )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, ensure_ascii=False, indent=2)
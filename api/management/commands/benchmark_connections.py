@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmark import connection_modes, measure_connection_mode
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the requests per second of concurrent threads opening a new "
+        "database connection per request, keeping a persistent one and using the pool"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=8,
+            help="Concurrent request threads, as in a worker process",
+        )
+        parser.add_argument("--duration", type=int, default=10, help="Seconds per mode")
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Connection pooling is only available on PostgreSQL")
+
+        report = {}
+        self.stdout.write(
+            "{:<16} {:>9} {:>9} {:>9} {:>9}".format(
+                "mode", "requests", "req/s", "p50 ms", "p95 ms"
+            )
+        )
+        for name, overrides in connection_modes().items():
+            result = measure_connection_mode(
+                overrides, options["threads"], options["duration"]
+            )
+            report[name] = result
+            self.stdout.write(
+                "{:<16} {requests:>9} {rps:>9} {p50_ms:>9} {p95_ms:>9}".format(
+                    name, **result
+                )
+            )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, ensure_ascii=False, indent=2)
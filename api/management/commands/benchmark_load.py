@@ -0,0 +1,78 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.benchmark import benchmark_endpoints, run_mixed_load
+
+# Long requests that used to hold a worker for their whole duration
+SLOW_ENDPOINTS = ["export_all stream", "statistics pdf"]
+# Short reads of the annotation interface
+FAST_ENDPOINTS = ["annotation list", "statistics", "search"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a running server with long exports and report downloads mixed "
+        "with short reads, and report the throughput and latency of each"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://localhost:8000", help="Server to load"
+        )
+        parser.add_argument("--duration", type=int, default=20, help="Seconds")
+        parser.add_argument(
+            "--slow-clients",
+            type=int,
+            default=2,
+            help="Concurrent clients per long endpoint",
+        )
+        parser.add_argument(
+            "--fast-clients",
+            type=int,
+            default=8,
+            help="Concurrent clients per short endpoint",
+        )
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        # the server must use the same database to accept the token
+        user = User.objects.get_or_create(username="benchmark")[0]
+        token = str(RefreshToken.for_user(user).access_token)
+
+        endpoints = benchmark_endpoints()
+        # a forced report is generated anew on every request
+        endpoints["statistics pdf"] += "?force=1"
+        clients = {
+            name: (endpoints[name], options["slow_clients"]) for name in SLOW_ENDPOINTS
+        }
+        clients.update(
+            {
+                name: (endpoints[name], options["fast_clients"])
+                for name in FAST_ENDPOINTS
+                if name in endpoints
+            }
+        )
+
+        report = run_mixed_load(options["url"], clients, options["duration"], token)
+        self.stdout.write(
+            "{:<20} {:>8} {:>7} {:>8} {:>10} {:>10}".format(
+                "endpoint", "requests", "errors", "req/s", "p50 ms", "p95 ms"
+            )
+        )
+        for name, result in report.items():
+            self.stdout.write(
+                "{:<20} {requests:>8} {errors:>7} {rps:>8} {p50_ms!s:>10} "
+                "{p95_ms!s:>10}".format(name, **result)
+            )
+        self.stdout.write(
+            "total: {:.1f} req/s".format(
+                sum(result["rps"] for result in report.values())
+            )
+        )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, ensure_ascii=False, indent=2)
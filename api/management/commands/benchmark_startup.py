@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.benchmark import measure_startup
+
+# What a worker loads before its first request, and what it loads once it
+# generates a statistics report
+STARTUP_SCENARIOS = {
+    "worker": [],
+    "worker + report": ["api.statistics_pdf", "matplotlib.figure"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the import time and peak memory of a fresh worker process, "
+        "with and without the report generation modules"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--json", help="Also write the results to this file")
+
+    def handle(self, *args, **options):
+        report = {}
+        self.stdout.write(
+            "{:<20} {:>10} {:>12}  {}".format(
+                "scenario", "import ms", "max RSS KB", "heavy modules"
+            )
+        )
+        for name, modules in STARTUP_SCENARIOS.items():
+            result = measure_startup(modules, repeat=options["repeat"])
+            report[name] = result
+            self.stdout.write(
+                "{:<20} {import_ms:>10} {max_rss_kb:>12}  {}".format(
+                    name, ", ".join(result["loaded"]) or "-", **result
+                )
+            )
+
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, ensure_ascii=False, indent=2)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from annotator.changes import current_cursor
+from api.snapshots import SNAPSHOT_KINDS, build_snapshot, get_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the gzip-compressed dataset snapshots that are out of date"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind",
+            action="append",
+            dest="kinds",
+            choices=SNAPSHOT_KINDS,
+            help="Write only this snapshot, can be repeated",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Write the snapshots even if they are up to date",
+        )
+
+    def handle(self, *args, **options):
+        cursor = current_cursor()
+        for kind in options["kinds"] or SNAPSHOT_KINDS:
+            snapshot = get_snapshot(kind)
+            if (
+                snapshot is not None
+                and snapshot["cursor"] == cursor
+                and not options["force"]
+            ):
+                self.stdout.write("{}: up to date".format(kind))
+                continue
+            snapshot = build_snapshot(kind, cursor)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    "{kind}: {records} records, {size} bytes, "
+                    "{generation_time} s".format(**snapshot)
+                )
+            )
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.jobs import process_queued_jobs
+
+
+class Command(BaseCommand):
+    help = "Classify the queued legal acts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the queue for new jobs",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between polls with --watch",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_queued_jobs()
+            if processed:
+                self.stdout.write(
+                    self.style.SUCCESS("{} jobs processed".format(processed))
+                )
+            if not options["watch"]:
+                return
+            time.sleep(options["interval"])
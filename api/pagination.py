@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Ways to compute the total number of documents matching a search:
+# exact - COUNT(*), estimate - the query planner estimate, none - skipped
+COUNT_MODES = ("exact", "estimate", "none")
+
+
+class DocumentPagination(PageNumberPagination):
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class DocumentKeysetPagination(BasePagination):
+    """
+    Pagination by the position of the last document of the page: (-created_at, -id).
+    Every page is fetched with an index range scan, so page N costs the same as page 1.
+    """
+
+    page_size = DocumentPagination.page_size
+    page_size_query_param = DocumentPagination.page_size_query_param
+    max_page_size = DocumentPagination.max_page_size
+    cursor_query_param = "cursor"
+    ordering = ("-created_at", "-id")
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def encode_cursor(self, document):
+        position = json.dumps([document.created_at.isoformat(), document.pk])
+        return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, request):
+        """
+        (created_at, id) of the last document of the previous page,
+        None for the first page.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            created_at, pk = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+            return datetime.fromisoformat(created_at), int(pk)
+        except (binascii.Error, TypeError, ValueError, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+
+        # one extra row tells whether there is a next page
+        documents = list(queryset[: page_size + 1])
+        page = documents[:page_size]
+        self.next_cursor = (
+            self.encode_cursor(page[-1]) if len(documents) > page_size else None
+        )
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            {"next": self.get_next_link(), "cursor": self.next_cursor, "results": data}
+        )
+
+
+def get_count_mode(request, default):
+    count_mode = request.query_params.get("count", default)
+    if count_mode not in COUNT_MODES:
+        raise ValidationError(
+            {"count": ["Must be one of: {}".format(", ".join(COUNT_MODES))]}
+        )
+    return count_mode
+
+
+def estimate_count(queryset):
+    """
+    Number of rows the query planner expects the queryset to return.
+    Only Postgres provides the estimate, other databases count the rows.
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
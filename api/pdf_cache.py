@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+# A single worker: reports are generated one at a time, in the background
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="statistics-pdf")
+# fingerprint -> future of the report, reports of obsolete fingerprints waiting
+# for the worker are replaced by the latest one, see schedule_statistics_pdf
+_jobs = {}
+_pending = {}
+_jobs_lock = threading.Lock()
+
+
+def statistics_fingerprint(statistics):
+    """
+    Fingerprint of everything the report depends on: the statistics data
+    and the date printed in the report header.
+    """
+    payload = json.dumps(
+        [timezone.now().strftime("%d.%m.%Y"), statistics],
+        cls=DjangoJSONEncoder,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _cache_dir():
+    return Path(settings.STATISTICS_PDF_CACHE_DIR)
+
+
+def _pdf_path(fingerprint):
+    return _cache_dir() / "statistics_{}.pdf".format(fingerprint)
+
+
+def _meta_path(fingerprint):
+    return _cache_dir() / "statistics_{}.json".format(fingerprint)
+
+
+def get_cached_statistics_pdf(fingerprint):
+    """
+    Metadata of the cached report ({"path", "generated_at", "generation_time"})
+    or None if the report for this fingerprint has not been generated yet.
+    """
+    try:
+        with open(_meta_path(fingerprint), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+    path = _pdf_path(fingerprint)
+    if not path.exists():
+        return None
+    meta["path"] = str(path)
+    return meta
+
+
+def _remove_stale_reports(fingerprint):
+    # temporary files may be written by other workers, they remove their own
+    for path in _cache_dir().glob("statistics_*"):
+        if fingerprint not in path.name and not path.name.endswith(".tmp"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def _temporary_path(path):
+    # unique across threads and processes sharing the cache directory
+    descriptor, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=path.name + ".", suffix=".tmp"
+    )
+    os.close(descriptor)
+    return Path(tmp_path)
+
+
+def _generate_statistics_pdf(fingerprint, statistics, build):
+    _cache_dir().mkdir(parents=True, exist_ok=True)
+    path = _pdf_path(fingerprint)
+    # write to a temporary file first, so a partially written report is never served
+    tmp_path = _temporary_path(path)
+    tmp_meta_path = _temporary_path(_meta_path(fingerprint))
+    try:
+        started = time.perf_counter()
+        build(str(tmp_path), statistics)
+        generation_time = time.perf_counter() - started
+
+        os.replace(tmp_path, path)
+        meta = {
+            "generated_at": timezone.now().isoformat(),
+            "generation_time": round(generation_time, 3),
+        }
+        with open(tmp_meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_meta_path, _meta_path(fingerprint))
+    finally:
+        for leftover in (tmp_path, tmp_meta_path):
+            if leftover.exists():
+                leftover.unlink()
+
+    _remove_stale_reports(fingerprint)
+    meta["path"] = str(path)
+    return meta
+
+
+def _generate_pending_report():
+    with _jobs_lock:
+        request = dict(_pending)
+        _pending.clear()
+    try:
+        return _generate_statistics_pdf(
+            request["fingerprint"], request["statistics"], request["build"]
+        )
+    finally:
+        with _jobs_lock:
+            for fingerprint, job in list(_jobs.items()):
+                if job is request["job"]:
+                    del _jobs[fingerprint]
+
+
+def schedule_statistics_pdf(fingerprint, statistics, build, force=False):
+    """
+    Start generating the report in the background, unless it is already cached
+    or being generated. Returns a future resolving to the report metadata.
+
+    At most one report waits for the worker: a report scheduled meanwhile takes
+    its place, and the waiting requests get the newer report.
+    """
+    with _jobs_lock:
+        job = _jobs.get(fingerprint)
+        if job is not None:
+            return job
+
+        if not force:
+            cached = get_cached_statistics_pdf(fingerprint)
+            if cached is not None:
+                job = Future()
+                job.set_result(cached)
+                return job
+
+        if not _pending:
+            _pending["job"] = _executor.submit(_generate_pending_report)
+        _pending.update(fingerprint=fingerprint, statistics=statistics, build=build)
+        job = _jobs[fingerprint] = _pending["job"]
+        return job
@@ -1,11 +1,40 @@
 from rest_framework import serializers
 
 from annotator.models import Annotation, Document
+from annotator.recogito import RECOGITO_FIELDS, compact_recogito
 from django.contrib.auth.models import User, Permission
+from django.db.models import Q
 
+from ethical_index.metrics import TimedSerializerMixin
 
-class AnnotationSerializer(serializers.ModelSerializer):
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves objects from context[context_key], preloaded for a whole batch,
+    instead of querying the database for every item.
+    """
+
+    def __init__(self, context_key, **kwargs):
+        self.context_key = context_key
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get(self.context_key)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[int(data)]
+        except KeyError:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class AnnotationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     id = serializers.UUIDField()
+    document = PreloadedPrimaryKeyRelatedField(
+        context_key="documents", queryset=Document.objects.all()
+    )
 
     class Meta:
         model = Annotation
@@ -22,8 +51,27 @@ class AnnotationSerializer(serializers.ModelSerializer):
             "created_at",
         ]
 
+    def _value(self, attrs, name):
+        if name in attrs:
+            return attrs[name]
+        if self.instance is not None:
+            return getattr(self.instance, name)
+        return Annotation._meta.get_field(name).get_default()
 
-class ExportAnnotationSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        # only what the columns cannot rebuild of the Recogito annotation is stored
+        if "json_data" in attrs:
+            fields = {name: self._value(attrs, name) for name in RECOGITO_FIELDS}
+            attrs["json_data"] = compact_recogito(fields, attrs["json_data"])
+        return attrs
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data["json_data"] = instance.to_recogito()
+        return data
+
+
+class ExportAnnotationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Annotation
         fields = [
@@ -35,10 +83,11 @@ class ExportAnnotationSerializer(serializers.ModelSerializer):
             "comment",
             "law_type",
             "law_justification",
+            "updated_at",
         ]
 
 
-class ClassifierSerializer(serializers.ModelSerializer):
+class ClassifierSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Document
         fields = [
@@ -54,7 +103,7 @@ class ClassifierSerializer(serializers.ModelSerializer):
         ]
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class DocumentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     username = serializers.CharField(source="user.username", read_only=True)
 
@@ -63,7 +112,9 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class DocumentAndAnnotationSerializer(serializers.ModelSerializer):
+class DocumentAndAnnotationSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     id = serializers.IntegerField(read_only=True)
     username = serializers.CharField(source="user.username", read_only=True)
     annotations = serializers.SerializerMethodField()
@@ -75,12 +126,13 @@ class DocumentAndAnnotationSerializer(serializers.ModelSerializer):
     def get_annotations(self, obj):
         """
         Fetch annotations for a given document.
+        Uses the prefetched annotations when the queryset provides them.
         """
-        annotations = Annotation.objects.filter(document=obj)
+        annotations = obj.annotation_set.all()
         return ExportAnnotationSerializer(annotations, many=True).data
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     permissions = serializers.SerializerMethodField()
 
     class Meta:
@@ -88,13 +140,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "permissions", "is_staff", "is_superuser"]
 
     def get_permissions(self, obj):
-        # get all user permissions
-        user_permissions = obj.user_permissions.all()
-
-        # get all permissions of the groups the user belongs to
-        group_permissions = Permission.objects.filter(group__user=obj)
-
-        # combine both QuerySets
-        all_permissions = user_permissions | group_permissions
+        # direct user permissions and permissions of the user's groups in one query
+        all_permissions = Permission.objects.filter(
+            Q(user=obj) | Q(group__user=obj)
+        ).distinct()
 
         return list(all_permissions.values_list("codename", flat=True))
@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+
+from annotator.changes import current_cursor
+from annotator.models import Annotation, Document
+from .export import iter_document_chunks, iter_serialized_chunks, stream_json_array
+from .serializers import DocumentSerializer, ExportAnnotationSerializer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KINDS = ("documents", "annotations", "all")
+
+SNAPSHOT_COMPRESS_LEVEL = 6
+
+# A single worker: snapshots are written one at a time, in the background
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dataset-snapshot")
+# kind -> future of the snapshot being written or waiting for the worker
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _snapshot_chunks(kind):
+    # the same data as /api/documents/, /api/export_annotations/ and /api/export_all/
+    if kind == "documents":
+        return iter_serialized_chunks(
+            Document.objects.select_related("user"), DocumentSerializer
+        )
+    if kind == "annotations":
+        return iter_serialized_chunks(
+            Annotation.objects.exclude(document__status="generated"),
+            ExportAnnotationSerializer,
+        )
+    return iter_document_chunks(Document.objects.exclude(status="generated"))
+
+
+def _snapshot_dir():
+    return Path(settings.DATASET_SNAPSHOT_DIR)
+
+
+def _file_name(kind, cursor):
+    return "{}_{}.json.gz".format(kind, cursor)
+
+
+def _meta_path(kind, cursor):
+    return _snapshot_dir() / "{}_{}.meta.json".format(kind, cursor)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as snapshot_file:
+        for block in iter(lambda: snapshot_file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_snapshot(kind):
+    """
+    Metadata of the latest snapshot of `kind` ({"kind", "cursor", "created_at",
+    "records", "size", "sha256", "generation_time", "file_name", "path"}),
+    or None if none has been written.
+    """
+    snapshots = []
+    for meta_path in _snapshot_dir().glob("{}_*.meta.json".format(kind)):
+        try:
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            continue
+        if meta.get("kind") == kind:
+            snapshots.append(meta)
+    if not snapshots:
+        return None
+
+    meta = max(snapshots, key=lambda snapshot: snapshot["cursor"])
+    meta["file_name"] = _file_name(kind, meta["cursor"])
+    meta["path"] = str(_snapshot_dir() / meta["file_name"])
+    if not os.path.exists(meta["path"]):
+        return None
+    return meta
+
+
+def _remove_old_snapshots(kind, cursor):
+    # a file being sent keeps its data until it is closed
+    current = {_file_name(kind, cursor), _meta_path(kind, cursor).name}
+    for path in _snapshot_dir().glob("{}_*".format(kind)):
+        if path.name not in current and not path.name.endswith(".tmp"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def build_snapshot(kind, cursor=None):
+    """
+    Write the gzip-compressed JSON export of `kind` and its metadata, and
+    remove the older snapshots of `kind`. `cursor` is the change log cursor
+    the data is at least as recent as, it is taken before the data is read.
+    """
+    if cursor is None:
+        cursor = current_cursor()
+    _snapshot_dir().mkdir(parents=True, exist_ok=True)
+    path = _snapshot_dir() / _file_name(kind, cursor)
+    # write to a temporary file first, so a partially written snapshot is never
+    # served; the name is unique across the processes sharing the directory
+    descriptor, tmp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=path.name + ".", suffix=".tmp"
+    )
+    os.close(descriptor)
+    tmp_path = Path(tmp_path)
+
+    started = time.perf_counter()
+    records = 0
+
+    def counted(chunks):
+        nonlocal records
+        for chunk in chunks:
+            records += len(chunk)
+            yield chunk
+
+    try:
+        # mtime=0: the same data gives the same file and checksum
+        with gzip.GzipFile(
+            tmp_path, "wb", compresslevel=SNAPSHOT_COMPRESS_LEVEL, mtime=0
+        ) as output:
+            for text in stream_json_array(counted(_snapshot_chunks(kind))):
+                output.write(text.encode("utf-8"))
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    meta = {
+        "kind": kind,
+        "cursor": cursor,
+        "created_at": timezone.now().isoformat(),
+        "records": records,
+        "size": path.stat().st_size,
+        "sha256": _file_sha256(path),
+        "generation_time": round(time.perf_counter() - started, 3),
+    }
+    meta_path = _meta_path(kind, cursor)
+    descriptor, tmp_meta_path = tempfile.mkstemp(
+        dir=meta_path.parent, prefix=meta_path.name + ".", suffix=".tmp"
+    )
+    with open(descriptor, "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_meta_path, meta_path)
+
+    _remove_old_snapshots(kind, cursor)
+    return get_snapshot(kind)
+
+
+def _run_build_snapshot(kind):
+    close_old_connections()
+    try:
+        # the cursor is read when the build starts, not when it was requested
+        return build_snapshot(kind)
+    except Exception:
+        logger.exception("Snapshot %s failed", kind)
+        raise
+    finally:
+        close_old_connections()
+        with _jobs_lock:
+            _jobs.pop(kind, None)
+
+
+def schedule_snapshot(kind):
+    """
+    Start writing the snapshot of `kind` in the background, unless it is being
+    written or waiting for the worker: at most one build per kind is queued,
+    changes made meanwhile are picked up by the next one. With
+    DATASET_SNAPSHOT_WORKERS = 0 snapshots are only written by the
+    build_snapshots command. Returns a future resolving to the snapshot
+    metadata, or None.
+    """
+    if settings.DATASET_SNAPSHOT_WORKERS <= 0:
+        return None
+    with _jobs_lock:
+        job = _jobs.get(kind)
+        if job is None:
+            job = _jobs[kind] = _executor.submit(_run_build_snapshot, kind)
+        return job
+
+
+def snapshot_response(snapshot):
+    """
+    Download of a snapshot file. With DATASET_SNAPSHOT_ACCEL_REDIRECT set the
+    file is sent by nginx (X-Accel-Redirect), otherwise by the server with sendfile.
+    """
+    prefix = settings.DATASET_SNAPSHOT_ACCEL_REDIRECT
+    if prefix:
+        response = HttpResponse(content_type="application/gzip")
+        response["X-Accel-Redirect"] = prefix + snapshot["file_name"]
+    else:
+        response = FileResponse(
+            open(snapshot["path"], "rb"), content_type="application/gzip"
+        )
+    response["Content-Disposition"] = 'attachment; filename="dataset_{}"'.format(
+        snapshot["file_name"]
+    )
+    response["X-Snapshot-Cursor"] = str(snapshot["cursor"])
+    response["X-Snapshot-SHA256"] = snapshot["sha256"]
+    return response
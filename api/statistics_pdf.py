@@ -0,0 +1,430 @@
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.colors import Color
+from reportlab.lib.colors import HexColor
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus import (
+    SimpleDocTemplate,
+    Table,
+    TableStyle,
+    Paragraph,
+    Spacer,
+    PageBreak,
+)
+
+from app_config.npa import NPA
+from .charts import bar_chart_flowable
+
+_fonts_lock = threading.Lock()
+_fonts_registered = False
+
+
+def register_fonts():
+    """
+    Register the report fonts with reportlab, once per process.
+    """
+    global _fonts_registered
+    with _fonts_lock:
+        if _fonts_registered:
+            return
+        pdfmetrics.registerFont(TTFont("Roboto", "fonts/Roboto-Regular.ttf"))
+        pdfmetrics.registerFont(TTFont("Roboto-Bold", "fonts/Roboto-Bold.ttf"))
+        _fonts_registered = True
+
+
+label_mapping = {
+    "UNCHECKED": "не проверено",
+    "ALLOW": "Дозволение",
+    "DUTY": "Обязанность",
+    "BAN": "Запрет",
+    "DEF": "Дефиниция",
+    "DEC": "Декларация",
+    "GOAL": "Цель",
+    "OTHER": "Иное",
+    "AUTH": "Авторитет",
+    "CARE": "Забота",
+    "LOYAL": "Лояльность",
+    "FAIR": "Справедлив.",
+    "PUR": "Чистота",
+    "NON": "Нет окраски",
+}
+
+
+def bar_chart(data, labels, color, figsize, width):
+    readable_labels = [label_mapping.get(label, label) for label in labels]
+    return bar_chart_flowable(
+        data,
+        readable_labels,
+        color,
+        figsize,
+        width,
+        vector=settings.STATISTICS_PDF_VECTOR_CHARTS,
+        font_name="Roboto",
+    )
+
+
+def create_justification_law_type_table(data):
+    # header
+    header = ["Моральное основание"] + [
+        label_mapping[type_key] for type_key in next(iter(data.values()))
+    ]
+
+    # data rows
+    table_rows = [header]
+    for justification, types in data.items():
+        row = [label_mapping[justification]] + [types[type_key] for type_key in types]
+        table_rows.append(row)
+
+    return table_rows
+
+
+def build_statistics_pdf(output, statistics):
+    """
+    Lay out the statistics report into `output` (a path or a file-like object).
+    `statistics` is the data of the statistics page, see get_document_statistics.
+    """
+    register_fonts()
+
+    # Create a SimpleDocTemplate object
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=letter,
+        topMargin=1,
+        leftMargin=10,
+        rightMargin=10,
+        bottomMargin=10,
+    )
+
+    # Set up styles
+    styles = getSampleStyleSheet()
+
+    custom_dark_blue = Color(0, 0, 0.3)
+    law_type_color = HexColor("#82ca9d")
+    justification_color = HexColor("#8884d8")
+
+    white_font_style = ParagraphStyle(
+        "WhiteFont", parent=styles["Normal"], fontSize=10, textColor=colors.whitesmoke
+    )
+    heading_style = ParagraphStyle(
+        "HeadingStyle",
+        parent=white_font_style,
+        alignment=TA_LEFT,
+        fontName="Roboto-Bold",
+    )
+    date_style = ParagraphStyle(
+        "DateStyle", parent=white_font_style, alignment=TA_RIGHT, fontName="Roboto-Bold"
+    )
+
+    # Heading and date
+    heading_text = "<para leftIndent=10>Статистика инструмента для сбора датасета Индекса Этичности</para>"
+    date_text = "<para rightIndent=10>{}</para>".format(
+        timezone.now().strftime("%d.%m.%Y")
+    )
+    heading = Paragraph(heading_text, heading_style)
+    date = Paragraph(date_text, date_style)
+
+    # Table to align heading and date on a blue background
+    header_content = [[heading, date]]
+    header_table = Table(
+        header_content, colWidths=[7 * inch, 1 * inch], rowHeights=[0.3 * inch]
+    )
+    header_table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, -1), custom_dark_blue),
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 0),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+                ("TOPPADDING", (0, 0), (-1, -1), 0),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+            ]
+        )
+    )
+
+    # Create elements list for Platypus
+    elements = [header_table]
+
+    status_names = {
+        "MARKED": "Размечено, не проверено",
+        "CHECKED": "Проверено",
+        "UNMARKED": "Не размечено",
+        "GENERATED": "Сгенерировано",
+    }
+
+    # Fetch status counts data and apply the mapping
+    status_counts = statistics["status_counts"]
+    # Calculate the total number of documents
+    total_documents = sum(item["total"] for item in status_counts)
+    labels = ["Всего документов"] + [status_names[st["status"]] for st in status_counts]
+    values = [str(total_documents)] + [str(st["total"]) for st in status_counts]
+    # Create a table for the rectangle
+    rectangle_data = [labels, values]
+    rectangle_table = Table(
+        rectangle_data, colWidths=[8 * inch / len(labels)] * len(labels)
+    )
+    rectangle_table.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, -1), HexColor("#F8F8F8")),
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("TOPPADDING", (0, 0), (-1, -1), 5),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+            ]
+        )
+    )
+
+    # Add the rectangle table to elements list
+    elements = [
+        header_table,
+        Spacer(1, 0.2 * inch),
+        rectangle_table,
+        Spacer(1, 0.2 * inch),
+    ]
+
+    # Create table data for justification counts
+    # Mapping for justification names
+
+    # Mapping for law type names
+    law_type_names = {
+        "UNCHECKED": "не проверено",
+        "ALLOW": "Дозволение",
+        "DUTY": "Обязанность",
+        "BAN": "Запрет",
+        "DEF": "Дефиниция",
+        "DEC": "Декларация",
+        "GOAL": "Цель",
+        "OTHER": "Иное",
+    }
+
+    # Fetch law type counts data and apply the mapping
+    law_type_counts = statistics["law_type_counts"]
+    law_type_data = [
+        [law_type_names.get(law_type["law_type"], "Other"), law_type["total"]]
+        for law_type in law_type_counts
+    ]
+
+    justification_names = {
+        "UNCHECKED": "не проверено",
+        "AUTH": "Авторитет",
+        "CARE": "Забота",
+        "LOYAL": "Лояльность",
+        "FAIR": "Справедливость",
+        "PUR": "Чистота",
+        "NON": "Нет этической окраски",
+    }
+
+    # Fetch justification counts data and apply the mapping
+    justification_counts = statistics["justification_counts"]
+    justification_data = [
+        [
+            justification_names.get(justification["dominant_justification"], "Other"),
+            justification["total"],
+        ]
+        for justification in justification_counts
+    ]
+
+    # Create a table for justifications
+
+    justification_table = Table(justification_data, colWidths=[2 * inch, 1 * inch])
+    justification_table.setStyle(
+        TableStyle(
+            [
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+                ("BACKGROUND", (0, 0), (-1, -1), justification_color),
+            ]
+        )
+    )
+
+    law_type_table = Table(law_type_data, colWidths=[2 * inch, 1 * inch])
+    law_type_table.setStyle(
+        TableStyle(
+            [
+                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+                ("BACKGROUND", (0, 0), (-1, -1), law_type_color),
+            ]
+        )
+    )
+
+    # Graphs
+    justification_graph_data = [item["total"] for item in justification_counts]
+    justification_graph_labels = [
+        item["dominant_justification"] for item in justification_counts
+    ]
+    max_image_width = 3.9 * inch
+    justification_image = bar_chart(
+        justification_graph_data,
+        justification_graph_labels,
+        "#8884d8",
+        (6, 4),
+        max_image_width,
+    )
+
+    law_type_graph_data = [item["total"] for item in law_type_counts]
+    law_type_graph_labels = [item["law_type"] for item in law_type_counts]
+    law_type_image = bar_chart(
+        law_type_graph_data, law_type_graph_labels, "#82ca9d", (6, 4), max_image_width
+    )
+
+    heading_style = ParagraphStyle("HeadingStyle", fontName="Roboto-Bold")
+    justification_title = Paragraph("Профиль нормы", heading_style)
+    law_type_title = Paragraph("Тип нормы", heading_style)
+    # Adjustments for the layout table to position tables closer to corners and add a larger gap
+    layout_table_data = [
+        [justification_title, "", law_type_title],
+        [justification_table, "", law_type_table],
+    ]
+    # Increase the width of the gap and adjust the table widths
+    layout_table = Table(
+        layout_table_data, colWidths=[3 * inch, 1 * inch, 3 * inch]
+    )  # Adjust widths as needed
+    layout_table.setStyle(
+        TableStyle(
+            [
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                (
+                    "BACKGROUND",
+                    (1, 0),
+                    (1, 0),
+                    colors.white,
+                ),  # Optional: background color for the gap
+            ]
+        )
+    )
+
+    # Add the layout table to elements list
+    elements.append(layout_table)
+
+    layout_table_data_graphs = [[justification_image, "", law_type_image]]
+
+    layout_table_graphs = Table(
+        layout_table_data_graphs, colWidths=[3.9 * inch, 0.18 * inch, 3.9 * inch]
+    )
+    layout_table_graphs.setStyle(
+        TableStyle(
+            [
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ("BACKGROUND", (1, 0), (1, 0), colors.white),
+            ]
+        )
+    )
+
+    elements.append(layout_table_graphs)
+
+    centered_title_style = ParagraphStyle(
+        "CenteredTitle",
+        parent=styles["Normal"],
+        alignment=TA_CENTER,
+        fontSize=12,
+        spaceAfter=6,
+        fontName="Roboto-Bold",
+    )
+
+    monthly_counts = statistics["monthly_counts"]
+
+    # Prepare data for the monthly upload graph
+    months = [month["month"].strftime("%Y-%m") for month in monthly_counts]
+    counts = [month["total"] for month in monthly_counts]
+
+    # Generate the monthly upload graph
+    monthly_upload_graph = bar_chart(counts, months, "darkorange", (10, 6), 6 * inch)
+    month_graph_title = Paragraph("Статистика по месяцам", centered_title_style)
+    elements.extend(
+        [
+            month_graph_title,  # Title for the NPA table
+            Spacer(1, 0.1 * inch),  # Space between title and table
+            monthly_upload_graph,  # The NPA table
+            PageBreak(),
+        ]
+    )
+
+    # Mapping for NPA type names
+    npa_names = dict(NPA)
+
+    npa_title = Paragraph("Статистика по НПА", centered_title_style)
+    # Fetch NPA counts data and apply the mapping
+    npa_counts = statistics["npa_counts"]
+    npa_data = [
+        [npa_names.get(npa["NPA"], "Other"), npa["total"]] for npa in npa_counts
+    ]
+
+    # Create a table for NPA types
+    npa_table = Table(
+        npa_data, colWidths=[7.3 * inch, 0.7 * inch]
+    )  # Adjust column widths as needed
+    npa_table.setStyle(
+        TableStyle(
+            [
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+            ]
+        )
+    )
+
+    # Add the NPA table to elements list
+    # Assume elements already contains other components like rectangles, other tables, etc.
+    elements.extend(
+        [
+            npa_title,  # Title for the NPA table
+            Spacer(1, 0.1 * inch),  # Space between title and table
+            npa_table,  # The NPA table
+            Spacer(1, 0.1 * inch),  # Space between table and next title
+        ]
+    )
+
+    # Create a table for justification_law_type
+    justification_law_type_title = Paragraph(
+        "Таблица сопоставления типов норм и обоснований", centered_title_style
+    )
+
+    justification_law_type_table_data = create_justification_law_type_table(
+        statistics["justification_law_type_counts"]
+    )
+
+    justification_law_type_table = Table(justification_law_type_table_data)
+
+    justification_law_type_table.setStyle(
+        TableStyle(
+            [
+                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
+                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
+                ("GRID", (0, 0), (-1, -1), 1, colors.black),
+                ("BACKGROUND", (0, 0), (0, -1), colors.lightblue),
+                ("BACKGROUND", (0, 0), (-1, 0), colors.orange),
+            ]
+        )
+    )
+    elements.extend(
+        [
+            justification_law_type_title,
+            Spacer(1, 0.1 * inch),
+            justification_law_type_table,
+        ]
+    )
+
+    # Build the PDF
+    doc.build(elements)
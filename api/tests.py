@@ -1,3 +1,1529 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from unittest import addModuleCleanup
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.signals import pre_save
+from django.test import (
+    AsyncClient,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from annotator.models import (
+    Annotation,
+    Change,
+    ClassificationJob,
+    Document,
+    DocumentStatistic,
+)
+from annotator.anchoring import text_edits
+from annotator.changes import current_cursor
+from annotator.corpus import corpus_users, generate_corpus
+from annotator.legal_acts import segment_act
+from annotator.recogito import RAW_KEY, compact_recogito, recogito_annotation
+from annotator.search import build_prefix_tsquery
+from annotator.statistics import find_statistics_drift, get_document_statistics
+from ethical_index.metrics import RequestMetrics, registry
+from .benchmark import benchmark_endpoint, measure_startup
+from .classifier import classify_norm
+from .export import iter_document_chunks, stream_export
+from .filters import document_filter
+from .jobs import process_classification_job, process_queued_jobs
+from .pdf_cache import schedule_statistics_pdf, statistics_fingerprint
+from . import pdf_cache, snapshots
+from .snapshots import build_snapshot
+from .views import DocumentAndAnnotationViewset
+
+
+def wait_for_pdf_reports():
+    # the reports are generated one at a time, so this job runs after them
+    pdf_cache._executor.submit(lambda: None).result(30)
+
+
+def use_temporary_pdf_cache(add_cleanup):
+    # statistics PDF reports are written to a temporary directory, removed
+    # by `add_cleanup` once the reports in progress are done
+    directory = tempfile.mkdtemp()
+    pdf_cache_dir = override_settings(STATISTICS_PDF_CACHE_DIR=directory)
+    pdf_cache_dir.enable()
+    add_cleanup(shutil.rmtree, directory, ignore_errors=True)
+    add_cleanup(pdf_cache_dir.disable)
+    add_cleanup(wait_for_pdf_reports)
+
+
+def setUpModule():
+    # the statistics requests of any test may prepare a PDF report
+    use_temporary_pdf_cache(addModuleCleanup)
+
+
+def create_documents(user, count, annotations_per_document=2):
+    documents = []
+    for i in range(count):
+        document = Document.objects.create(
+            user=user, title="ч. {} ст. 1".format(i + 1), text="Текст нормы"
+        )
+        for _ in range(annotations_per_document):
+            Annotation.objects.create(
+                document=document, start=0, end=5, orig_text="Текст", json_data={}
+            )
+        documents.append(document)
+    return documents
+
+
+class QueryCountTests(TestCase):
+    """
+    Each list endpoint must cost a constant number of queries regardless of page size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        group = Group.objects.create(name="annotators")
+        group.permissions.add(Permission.objects.get(codename="can_mark_as_marked"))
+        cls.user.groups.add(group)
+        cls.user.user_permissions.add(
+            Permission.objects.get(codename="can_mark_as_checked")
+        )
+        # documents of several users, so that username lookups would show up
+        for i in range(5):
+            user = User.objects.create_user("user{}".format(i), password="password")
+            create_documents(user, 4)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_document_list(self):
+        # COUNT + page
+        self.assertQueries(2, reverse("document-list") + "?page_size=20")
+
+    def test_document_search(self):
+        # paginator COUNT, reused for total_documents + page
+        self.assertQueries(2, reverse("document-search") + "?page_size=20")
+
+    def test_keyset_pages(self):
+        url = reverse("document-search") + "?page_size=3&cursor="
+        seen = []
+        while url:
+            # a page is one query, whichever page it is
+            response = self.assertQueries(1, url)
+            self.assertIsNone(response.json()["total_documents"])
+            seen.extend(document["id"] for document in response.json()["results"])
+            url = response.json()["next"]
+        expected = Document.objects.order_by("-created_at", "-id").values_list(
+            "id", flat=True
+        )
+        self.assertEqual(seen, list(expected))
+
+    def test_keyset_document_list_with_count(self):
+        response = self.assertQueries(
+            2, reverse("document-search") + "?page_size=5&cursor=&count=exact"
+        )
+        self.assertEqual(response.json()["total_documents"], 20)
+        self.assertEqual(len(response.json()["results"]), 5)
+        self.assertQueries(1, reverse("document-list") + "?cursor=")
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("document-list") + "?cursor=abc")
+        self.assertEqual(response.status_code, 404)
+
+    def test_export_all(self):
+        # documents with users + annotations of all documents
+        response = self.assertQueries(2, reverse("export_all-list"))
+        self.assertEqual(len(response.json()), 20)
+        self.assertEqual(len(response.json()[0]["annotations"]), 2)
+
+    def test_annotation_lists(self):
+        self.assertQueries(1, reverse("annotation-list"))
+        self.assertQueries(1, reverse("export_annotation-list"))
+
+    def test_annotation_list_of_document(self):
+        document = Document.objects.first()
+        # versions + document + annotations
+        self.assertQueries(3, reverse("annotation_list", args=[document.id]))
+
+    def test_me(self):
+        response = self.assertQueries(1, reverse("me"))
+        self.assertCountEqual(
+            response.json()["permissions"],
+            ["can_mark_as_marked", "can_mark_as_checked"],
+        )
+
+
+class StreamExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(3):
+            user = User.objects.create_user("user{}".format(i), password="password")
+            create_documents(user, 2)
+
+    def setUp(self):
+        self.queryset = DocumentAndAnnotationViewset.queryset.all()
+
+    def test_stream_matches_list_export(self):
+        documents = APIClient().get(reverse("export_all-list")).json()
+        documents.sort(key=lambda document: document["id"])
+
+        content = b"".join(stream_export(self.queryset, "json", chunk_size=4))
+        self.assertEqual(json.loads(content), documents)
+        content = b"".join(stream_export(self.queryset, "ndjson", chunk_size=4))
+        lines = content.decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], documents)
+
+    def test_chunk_boundaries(self):
+        for chunk_size, sizes in ((4, [4, 2]), (6, [6]), (10, [6])):
+            chunks = list(iter_document_chunks(self.queryset, chunk_size))
+            self.assertEqual([len(chunk) for chunk in chunks], sizes)
+            self.assertEqual(len(chunks[-1][-1]["annotations"]), 2)
+
+        empty = self.queryset.none()
+        self.assertEqual(list(iter_document_chunks(empty)), [])
+        self.assertEqual(b"".join(stream_export(empty, "json")), b"[]")
+        self.assertEqual(b"".join(stream_export(empty, "ndjson")), b"")
+
+    def test_queries_per_chunk(self):
+        # the documents query + the annotations of every chunk
+        for chunk_size, chunks in ((2, 3), (3, 2), (6, 1)):
+            with self.assertNumQueries(1 + chunks):
+                b"".join(stream_export(self.queryset, "json", chunk_size))
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        Document.objects.create(
+            user=cls.user,
+            title="ч. 1 ст. 5",
+            text="Не допускается обработка персональных данных",
+        )
+        Document.objects.create(
+            user=cls.user, title="ч. 2 ст. 5", text="Обработка данных допускается"
+        )
+
+    def search(self, **params):
+        response = APIClient().get(reverse("document-search"), params)
+        self.assertEqual(response.status_code, 200)
+        return [document["title"] for document in response.json()["results"]]
+
+    def test_prefix_tsquery(self):
+        self.assertEqual(
+            build_prefix_tsquery("обработка персональн!"),
+            "обработка:* & персональн:*",
+        )
+        self.assertIsNone(build_prefix_tsquery("?!"))
+
+    def test_text_search(self):
+        self.assertEqual(
+            self.search(search="персональных", search_type="text"), ["ч. 1 ст. 5"]
+        )
+        self.assertEqual(len(self.search(search="допускается", search_type="text")), 2)
+
+    def test_text_search_with_filters(self):
+        self.assertEqual(
+            self.search(search="данных", search_type="text", user="nobody"), []
+        )
+
+    def test_choice_filters_ignore_case(self):
+        Document.objects.filter(title="ч. 1 ст. 5").update(law_type="BAN", NPA="ОПД")
+        self.assertEqual(self.search(law_types="ban,duty"), ["ч. 1 ст. 5"])
+        self.assertEqual(self.search(npa="опд"), ["ч. 1 ст. 5"])
+        self.assertEqual(self.search(law_types="unknown"), [])
+
+    def test_malformed_date(self):
+        response = APIClient().get(
+            reverse("document-search"), {"to_date": "31.12.2024"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("to_date", response.json())
+        response = APIClient().get(reverse("document-list"), {"to_date": "9999-12-31"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("to_date", response.json())
+
+    def test_retrieve_is_not_filtered(self):
+        document = Document.objects.get(title="ч. 1 ст. 5")
+        response = APIClient().get(
+            reverse("document-detail", kwargs={"pk": document.pk}),
+            {"to_date": "2000-01-01"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_exports_are_filtered(self):
+        other = User.objects.create_user("reviewer", password="password")
+        document = create_documents(other, 1)[0]
+        Document.objects.filter(pk=document.pk).update(status="CHECKED", NPA="ОПД")
+        params = {"status": "checked", "npa": "опд", "user": "review"}
+        self.assertEqual(
+            document_filter(params, "document__"),
+            Q(document__NPA__in=["ОПД"])
+            & Q(document__status__in=["CHECKED"])
+            & Q(document__user__username__icontains="review"),
+        )
+
+        client = APIClient()
+        response = client.get(reverse("export_all-list"), params)
+        self.assertEqual([item["id"] for item in response.json()], [document.pk])
+        response = client.get(reverse("export_annotation-list"), params)
+        self.assertEqual(len(response.json()), 2)
+        response = client.get(reverse("export_all-stream"), {"to_date": "2000-01-01"})
+        self.assertEqual(b"".join(response.streaming_content), b"[]")
+        response = client.get(reverse("document-list"), params)
+        self.assertEqual(response.json()["count"], 1)
+
+
+class StatisticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.other_user = User.objects.create_user("checker", password="password")
+        cls.documents = create_documents(cls.user, 3, annotations_per_document=0)
+        create_documents(cls.other_user, 2, annotations_per_document=0)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_statistics(self):
+        response = self.client.get(reverse("statistics"))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counters_follow_document_writes(self):
+        document = Document.objects.get(pk=self.documents[0].pk)
+        document.status = "MARKED"
+        document.CARE_points = 3
+        document.save()
+        Document.objects.filter(pk=self.documents[1].pk).delete()
+        # a cascade delete of all documents of a user
+        self.other_user.delete()
+
+        self.assertEqual(find_statistics_drift(), {})
+        statistics = self.get_statistics()
+        self.assertEqual(
+            statistics["user_document_counts"],
+            [{"user__username": "annotator", "total": 2}],
+        )
+        self.assertCountEqual(
+            statistics["status_counts"],
+            [{"status": "MARKED", "total": 1}, {"status": "UNMARKED", "total": 1}],
+        )
+        self.assertEqual(
+            statistics["care_points_counts"],
+            [{"CARE_points": 3, "total": 1}, {"CARE_points": 0, "total": 1}],
+        )
+        self.assertEqual(
+            statistics["justification_law_type_counts"]["CARE"]["UNCHECKED"], 1
+        )
+
+    def test_statistics_read_cost_does_not_depend_on_documents(self):
+        # versions + counters + usernames
+        with self.assertNumQueries(3):
+            self.get_statistics()
+
+    def test_date_range_statistics(self):
+        today = timezone.localdate()
+        document = Document.objects.get(pk=self.documents[0].pk)
+        document.status = "CHECKED"
+        document.save()
+
+        url = reverse("date_range_statistics")
+        params = {
+            "start_date": (today - timedelta(days=2)).isoformat(),
+            "end_date": today.isoformat(),
+        }
+        # daily counters by user and status, usernames, daily counters by day
+        with self.assertNumQueries(3):
+            response = self.client.get(url, params)
+        data = response.json()
+        self.assertEqual(data["total_documents"], 5)
+        self.assertEqual(
+            data["user_document_counts"],
+            [
+                {"user__username": "annotator", "total": 3},
+                {"user__username": "checker", "total": 2},
+            ],
+        )
+        self.assertEqual(
+            data["status_counts"],
+            [{"status": "UNMARKED", "total": 4}, {"status": "CHECKED", "total": 1}],
+        )
+        self.assertEqual([item["total"] for item in data["series"]], [0, 0, 5])
+
+        data = self.client.get(url, dict(params, granularity="month")).json()
+        self.assertEqual(
+            data["series"][-1],
+            {"period": today.replace(day=1).isoformat(), "total": 5},
+        )
+
+        params["end_date"] = "2000-01-01"
+        self.assertEqual(self.client.get(url, params).status_code, 400)
+        params["granularity"] = "year"
+        self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_rebuild_statistics_command(self):
+        DocumentStatistic.objects.filter(dimension="status").update(total=42)
+        out = StringIO()
+        call_command("rebuild_statistics", "--check", stdout=out)
+        self.assertIn("status=UNMARKED: stored 42, actual 5", out.getvalue())
+        self.assertNotEqual(find_statistics_drift(), {})
+
+        call_command("rebuild_statistics", stdout=StringIO())
+        self.assertEqual(find_statistics_drift(), {})
+
+
+class StatisticsPdfTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        create_documents(cls.user, 3, annotations_per_document=0)
+
+    def setUp(self):
+        use_temporary_pdf_cache(self.addCleanup)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **params):
+        response = self.client.get(reverse("generate_statistics_pdf"), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        return response
+
+    def test_report_is_cached_until_data_changes(self):
+        self.assertEqual(self.download()["X-Cache"], "MISS")
+        response = self.download()
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertIn("X-Generation-Time", response)
+
+        self.assertEqual(self.download(force="1")["X-Cache"], "MISS")
+
+        create_documents(self.user, 1, annotations_per_document=0)
+        self.assertEqual(self.download()["X-Cache"], "MISS")
+
+    def test_report_is_prepared_for_signed_in_users(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get(reverse("statistics")).status_code, 200)
+        wait_for_pdf_reports()
+        self.assertEqual(os.listdir(settings.STATISTICS_PDF_CACHE_DIR), [])
+        response = anonymous.get(reverse("generate_statistics_pdf"))
+        self.assertEqual(response.status_code, 401)
+
+        cache.clear()
+        self.client.get(reverse("statistics"))
+        wait_for_pdf_reports()
+        self.assertEqual(self.download()["X-Cache"], "HIT")
+
+    def test_removed_report_is_being_generated(self):
+        fingerprint = statistics_fingerprint(get_document_statistics())
+        # the report of newer statistics removed this one since it was looked up
+        job = Future()
+        job.set_result(
+            {
+                "path": os.path.join(settings.STATISTICS_PDF_CACHE_DIR, "removed.pdf"),
+                "generated_at": timezone.now().isoformat(),
+                "generation_time": 0,
+            }
+        )
+        pdf_cache._jobs[fingerprint] = job
+        self.addCleanup(pdf_cache._jobs.pop, fingerprint, None)
+
+        response = self.client.get(reverse("generate_statistics_pdf"), {"force": "1"})
+        self.assertEqual(response.status_code, 202)
+
+    @override_settings(STATISTICS_PDF_VECTOR_CHARTS=False)
+    def test_report_with_raster_charts(self):
+        response = self.client.get(reverse("generate_statistics_pdf"), {"force": "1"})
+        self.assertEqual(response["X-Cache"], "MISS")
+        # the charts are embedded as PNG images instead of drawing operators
+        self.assertIn(b"/Subtype /Image", b"".join(response.streaming_content))
+
+    def test_obsolete_reports_are_not_generated(self):
+        started, release = threading.Event(), threading.Event()
+        built = []
+
+        def build(path, statistics):
+            started.set()
+            release.wait(5)
+            built.append(statistics)
+            with open(path, "wb") as output:
+                output.write(b"%PDF")
+
+        running = schedule_statistics_pdf("a" * 32, 1, build)
+        started.wait(5)
+        # written by another worker meanwhile
+        foreign = tempfile.NamedTemporaryFile(
+            dir=settings.STATISTICS_PDF_CACHE_DIR, prefix="statistics_", suffix=".tmp"
+        )
+        obsolete = schedule_statistics_pdf("b" * 32, 2, build)
+        latest = schedule_statistics_pdf("c" * 32, 3, build)
+        self.assertIs(obsolete, latest)
+        release.set()
+
+        self.assertIn("a" * 32, running.result(5)["path"])
+        self.assertIn("c" * 32, latest.result(5)["path"])
+        self.assertEqual(built, [1, 3])
+        self.assertTrue(os.path.exists(foreign.name))
+        foreign.close()
+
+    def test_worker_startup_does_not_load_report_modules(self):
+        self.assertEqual(measure_startup(repeat=1)["loaded"], [])
+
+
+class BulkAnnotationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.document = create_documents(cls.user, 1)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def annotation_data(self, **kwargs):
+        data = {
+            "id": str(uuid.uuid4()),
+            "document": self.document.id,
+            "start": 0,
+            "end": 5,
+            "orig_text": "Текст",
+            "law_type": "DUTY",
+            "law_justification": "UNCHECKED",
+            "json_data": {},
+        }
+        data.update(kwargs)
+        return data
+
+    def bulk(self, operations):
+        return self.client.post(
+            reverse("annotation-bulk"), {"operations": operations}, format="json"
+        )
+
+    def test_bulk_operations(self):
+        updated, deleted = self.document.annotation_set.all()
+        operations = [
+            {"op": "create", "data": self.annotation_data()} for _ in range(10)
+        ]
+        operations.append(
+            {"op": "update", "data": {"id": str(updated.id), "comment": "Проверено"}}
+        )
+        operations.append({"op": "delete", "id": str(deleted.id)})
+
+        # existing annotations, taken ids, documents, then the transaction
+        # (the delete reads the rows for the post_delete signal, the versions
+        # are bumped with one query, the change log is written with one query
+        # once committed)
+        with self.assertNumQueries(11), self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk(operations)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            ["created"] * 10 + ["updated", "deleted"],
+        )
+        self.assertEqual(self.document.annotation_set.count(), 11)
+        updated.refresh_from_db()
+        self.assertEqual(updated.comment, "Проверено")
+
+    def test_invalid_operation_rejects_the_batch(self):
+        response = self.bulk(
+            [
+                {"op": "create", "data": self.annotation_data()},
+                {"op": "create", "data": self.annotation_data(document=0)},
+                {"op": "delete", "id": str(uuid.uuid4())},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["status"] for result in results], ["created", "error", "error"]
+        )
+        self.assertIn("document", results[1]["errors"])
+        self.assertEqual(self.document.annotation_set.count(), 2)
+
+
+def recogito_payload(annotation_id, comment=None):
+    # as sent by the frontend, see frontend/src/DocumentDetail/useRecogito.jsx
+    body = [
+        {"purpose": "classifying", "value": {"type": "BAN", "justification": "CARE"}}
+    ]
+    if comment:
+        body.insert(
+            0, {"type": "TextualBody", "value": comment, "purpose": "commenting"}
+        )
+    return {
+        "@context": "http://www.w3.org/ns/anno.jsonld",
+        "id": annotation_id,
+        "type": "Annotation",
+        "body": body,
+        "target": {
+            "selector": [
+                {"type": "TextQuoteSelector", "exact": "Текст"},
+                {"type": "TextPositionSelector", "start": 0, "end": 5},
+            ]
+        },
+    }
+
+
+class RecogitoStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.document = create_documents(cls.user, 1, annotations_per_document=0)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, payload, comment=None):
+        response = self.client.post(
+            reverse("annotation-list"),
+            {
+                "id": payload["id"],
+                "document": self.document.id,
+                "start": 0,
+                "end": 5,
+                "orig_text": "Текст",
+                "comment": comment,
+                "law_type": "BAN",
+                "law_justification": "CARE",
+                "json_data": payload,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["json_data"], payload)
+        return Annotation.objects.get(pk=payload["id"])
+
+    def test_annotation_is_stored_in_the_columns(self):
+        payload = recogito_payload(str(uuid.uuid4()), comment="Комментарий")
+        annotation = self.create(payload, comment="Комментарий")
+        self.assertEqual(annotation.json_data, {})
+
+        response = self.client.get(reverse("annotation_list", args=[self.document.id]))
+        self.assertEqual(response.json(), [payload])
+
+    def test_extra_parts_are_kept(self):
+        payload = recogito_payload(str(uuid.uuid4()))
+        payload["body"][0]["creator"] = {"id": "annotator"}
+        annotation = self.create(payload)
+        self.assertEqual(
+            annotation.json_data["body"],
+            [{"purpose": "classifying", "creator": {"id": "annotator"}}],
+        )
+        self.assertEqual(annotation.to_recogito(), payload)
+
+    def test_payloads_are_rebuilt_exactly(self):
+        payload = recogito_payload(str(uuid.uuid4()))
+        fields = {
+            "id": payload["id"],
+            "start": 0,
+            "end": 5,
+            # the columns disagree with the quote selector, which is kept
+            "orig_text": "Другой",
+            "comment": None,
+            "law_type": "BAN",
+            "law_justification": "CARE",
+        }
+        compact = compact_recogito(fields, payload)
+        self.assertEqual(
+            compact["target"]["selector"][0],
+            {"type": "TextQuoteSelector", "exact": "Текст"},
+        )
+        self.assertEqual(recogito_annotation(dict(fields, json_data=compact)), payload)
+
+        # a payload the columns would complete is stored whole
+        del payload["@context"]
+        self.assertEqual(compact_recogito(fields, payload), {RAW_KEY: payload})
+
+    def test_compact_existing_annotations(self):
+        annotation_id = uuid.uuid4()
+        payload = recogito_payload(str(annotation_id))
+        Annotation.objects.create(
+            id=annotation_id,
+            document=self.document,
+            start=0,
+            end=5,
+            orig_text="Текст",
+            law_type="BAN",
+            law_justification="CARE",
+            json_data=payload,
+        )
+        call_command("compact_annotations", stdout=StringIO())
+        annotation = Annotation.objects.get(pk=annotation_id)
+        self.assertEqual(annotation.json_data, {})
+        self.assertEqual(annotation.to_recogito(), payload)
+
+
+class IngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def norm(self, paragraph):
+        return {
+            "paragraph": paragraph,
+            "results": {
+                "justification": {
+                    "justification_probability": {
+                        "AUTH": 0.304,
+                        "CARE": 0.126,
+                        "FAIR": 0.041,
+                        "LOYAL": 0.046,
+                        "PUR": 0.483,
+                    },
+                    "justification_keywords": {
+                        "AUTH": ["законом", "преступлением"],
+                        "CARE": ["отсутствует"],
+                    },
+                },
+                "law_type": {
+                    "law_type_probability": {"BAN": 0.2, "GOAL": 0.17, "OTHER": 0.49},
+                    "law_type_keywords": {"GOAL": ["цели"]},
+                },
+            },
+        }
+
+    def ingest(self, norms_count):
+        paragraph = (
+            "Не является преступлением причинение вреда охраняемым уголовным\r\n"
+            "законом интересам при обоснованном риске для достижения цели"
+        )
+        return self.client.post(
+            reverse("document-ingest"),
+            {
+                "title": "ст. 41 УК",
+                "NPA": "УК",
+                "norms": [self.norm(paragraph) for _ in range(norms_count)],
+            },
+            format="json",
+        )
+
+    def test_ingest(self):
+        response = self.ingest(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["norms"], 2)
+        self.assertEqual(response.json()["annotations"], 6)
+
+        document = Document.objects.get(title="ст. 41 УК - норма 2")
+        self.assertEqual(document.user, self.user)
+        self.assertEqual(document.status, "GENERATED")
+        self.assertEqual(document.law_type, "OTHER")
+        self.assertEqual(
+            (document.AUTH_points, document.CARE_points, document.PUR_points),
+            (3, 1, 5),
+        )
+        self.assertEqual(document.dominant_justification, "PUR")
+        # offsets point into the normalized text
+        for annotation in document.annotation_set.all():
+            self.assertEqual(
+                document.text[annotation.start : annotation.end], annotation.orig_text
+            )
+        self.assertEqual(find_statistics_drift(), {})
+
+    def test_ingest_cost_does_not_depend_on_norms_count(self):
+        with CaptureQueriesContext(connection) as small:
+            self.ingest(2)
+        with CaptureQueriesContext(connection) as large:
+            self.ingest(20)
+        self.assertEqual(len(small), len(large))
+
+    def test_invalid_payload(self):
+        response = self.client.post(
+            reverse("document-ingest"),
+            {"title": "ст. 1", "NPA": "UNKNOWN", "norms": []},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"NPA", "norms"})
+
+
+class DocumentSaveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.document = create_documents(cls.user, 1)[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_classifier_update_does_not_read_the_text(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                reverse("classifier-detail", args=[self.document.id]),
+                {"CARE_points": 4},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        document_queries = [
+            query["sql"] for query in queries if '"annotator_document"' in query["sql"]
+        ]
+        # SELECT without the text, SELECT of the counted values (see
+        # annotator.signals) and UPDATE of the changed columns only
+        self.assertEqual(len(document_queries), 3)
+        for query in document_queries:
+            self.assertNotIn('"text"', query)
+        self.assertIn('"CARE_points"', document_queries[2])
+        self.assertIn('"dominant_justification"', document_queries[2])
+        self.assertEqual(self.document.annotation_set.count(), 2)
+
+    def test_statistics_are_counted_from_the_stored_row(self):
+        # both loaded before either is saved, as by two concurrent requests
+        first = Document.objects.get(pk=self.document.pk)
+        second = Document.objects.get(pk=self.document.pk)
+        for document in (first, second):
+            document.status = "GENERATED"
+            document.save()
+        self.assertEqual(find_statistics_drift(), {})
+
+    def test_unchanged_document_is_not_written(self):
+        document = Document.objects.get(pk=self.document.pk)
+        with self.assertNumQueries(0):
+            document.save()
+
+    def test_text_change_reanchors_annotations(self):
+        document = Document.objects.get(pk=self.document.pk)
+        document.text = "  Текст нормы права  "
+        document.save()
+        self.assertEqual(document.annotation_set.count(), 2)
+        kept = Annotation.objects.create(
+            document=document,
+            start=6,
+            end=11,
+            orig_text="нормы",
+            comment="Норма",
+            law_type="BAN",
+            law_justification="CARE",
+        )
+        payload = recogito_payload(str(kept.id), comment="Норма")
+        payload["creator"] = {"name": "annotator"}
+        payload["target"]["selector"] = [
+            {"type": "TextQuoteSelector", "exact": "нормы"},
+            {"type": "TextPositionSelector", "start": 6, "end": 11},
+        ]
+        kept.json_data = compact_recogito(kept.recogito_fields(), payload)
+        kept.save()
+        cursor = current_cursor()
+
+        document.text = "Новый текст нормы права"
+        # annotations ending after the unchanged start are read once, the
+        # shifted ones updated with one query, the overlapping ones deleted,
+        # the versions bumped with one query
+        with self.assertNumQueries(8), self.captureOnCommitCallbacks(execute=True):
+            document.save()
+
+        # "Текст" at the start overlapped the edit
+        self.assertEqual(list(document.annotation_set.all()), [kept])
+        kept.refresh_from_db()
+        self.assertEqual((kept.start, kept.end), (12, 17))
+        self.assertEqual(document.text[kept.start : kept.end], kept.orig_text)
+        payload["target"]["selector"][1].update(start=12, end=17)
+        self.assertEqual(kept.to_recogito(), payload)
+        self.assertEqual(
+            Change.objects.filter(pk__gt=cursor, kind="annotation").count(), 3
+        )
+
+    def test_text_edits(self):
+        old = "Статья 1. Работник обязан соблюдать дисциплину труда."
+        new = "Статья 1. Каждый работник обязан строго соблюдать дисциплину."
+        blocks = text_edits(old, new)
+        for start, end, shift in blocks:
+            self.assertEqual(old[start:end], new[start + shift : end + shift])
+        covered = "".join(old[start:end] for start, end, _ in blocks)
+        self.assertIn("обязан", covered)
+        self.assertIn("соблюдать дисциплину", covered)
+        self.assertEqual(text_edits(old, old), [(0, len(old), 0)])
+
+
+class DocumentTransactionTests(TransactionTestCase):
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_concurrent_saves_keep_statistics(self):
+        document = create_documents(User.objects.create_user("annotator"), 1)[0]
+        loaded = threading.Barrier(2)
+        errors = []
+
+        def classify(points):
+            try:
+                instance = Document.objects.get(pk=document.pk)
+                loaded.wait(5)
+                instance.status = "GENERATED"
+                instance.CARE_points = points
+                instance.save()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=classify, args=(i,)) for i in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(errors, [])
+        # the counters agree with those rebuilt by rebuild_statistics
+        self.assertEqual(find_statistics_drift(), {})
+
+    def test_failed_text_change_keeps_annotations(self):
+        def fail(**kwargs):
+            raise RuntimeError("write failed")
+
+        document = create_documents(User.objects.create_user("annotator"), 1)[0]
+        pre_save.connect(fail, sender=Document)
+        self.addCleanup(pre_save.disconnect, fail, sender=Document)
+        document.text = "Новый текст нормы"
+        # outside of any transaction, as in a request
+        with self.assertRaises(RuntimeError):
+            document.save()
+        self.assertEqual(
+            list(document.annotation_set.values_list("start", "end")), [(0, 5)] * 2
+        )
+
+
+@override_settings(CLASSIFICATION_WORKERS=0)
+class ClassificationJobTests(TestCase):
+    text = (
+        "Работодатель обязан обеспечить безопасные условия труда.\n"
+        "\n"
+        "Работник вправе требовать защиты своих прав в суде.\n"
+        "Не допускается дискриминация в сфере труда."
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def classify(self, title="ТК РФ ст. 22"):
+        return self.client.post(
+            reverse("document-classify"),
+            {"title": title, "NPA": "ТК", "text": self.text},
+            format="json",
+        )
+
+    def test_classify_norm(self):
+        results = classify_norm("Работодатель обязан обеспечить безопасные условия.")
+        law_type = results["law_type"]
+        self.assertEqual(law_type["law_type_keywords"], {"DUTY": ["обязан"]})
+        self.assertEqual(
+            max(
+                law_type["law_type_probability"],
+                key=law_type["law_type_probability"].get,
+            ),
+            "DUTY",
+        )
+        self.assertEqual(
+            results["justification"]["justification_keywords"],
+            {"CARE": ["безопасные"]},
+        )
+
+    def test_job_is_queued_and_processed(self):
+        response = self.classify()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["status"], "В очереди")
+        self.assertEqual(response.json()["norms"], "0/3")
+        self.classify("ТК РФ ст. 3")
+
+        response = self.client.get(reverse("document-classification-status"))
+        self.assertEqual(response.json()["queue_depth"], 6)
+        # the second job waits for the first one
+        first, second = reversed(response.json()["documents"])
+        self.assertLessEqual(first["estimatedTime"], second["estimatedTime"])
+        self.assertEqual(
+            self.client.get(reverse("model_info")).json()["modelLoad"], "низкая"
+        )
+
+        self.assertEqual(process_queued_jobs(), 2)
+        response = self.client.get(reverse("document-classification-status"))
+        self.assertEqual(response.json()["queue_depth"], 0)
+        for job in response.json()["documents"]:
+            self.assertEqual(job["status"], "Выполнено")
+            self.assertEqual(job["norms"], "3/3")
+
+        document = Document.objects.get(title="ТК РФ ст. 22 - норма 3")
+        self.assertEqual(document.status, "GENERATED")
+        self.assertEqual(document.law_type, "BAN")
+        self.assertEqual(Document.objects.count(), 6)
+        self.assertEqual(find_statistics_drift(), {})
+
+    def test_stale_running_job_is_requeued(self):
+        self.classify()
+        ClassificationJob.objects.update(status="RUNNING", norms_done=2)
+        # still running in another worker
+        self.assertEqual(process_queued_jobs(), 0)
+
+        ClassificationJob.objects.update(
+            heartbeat_at=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(process_queued_jobs(), 1)
+        job = ClassificationJob.objects.get()
+        self.assertEqual((job.status, job.norms_done), ("DONE", 3))
+
+    def test_requeued_job_is_not_ingested_twice(self):
+        self.classify()
+        job = ClassificationJob.objects.get()
+
+        def requeue_while_running(execute, sql, params, many, context):
+            # queued again and taken by another worker before the ownership check
+            if '."worker" = ' in sql and sql.startswith("SELECT"):
+                ClassificationJob.objects.update(worker="other")
+            return execute(sql, params, many, context)
+
+        with self.assertLogs("api.jobs", "WARNING"):
+            with connection.execute_wrapper(requeue_while_running):
+                self.assertFalse(process_classification_job(job.pk))
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(ClassificationJob.objects.get().status, "RUNNING")
+
+    def test_empty_text_is_rejected(self):
+        response = self.client.post(
+            reverse("document-classify"),
+            {"title": "ст. 1", "NPA": "ТК", "text": "\n \n"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ClassificationJob.objects.exists())
+
+
+class CorpusTests(TestCase):
+    def generate(self, seed):
+        generate_corpus(corpus_users(3), 40, seed=seed, batch_size=15)
+        return list(
+            Document.objects.order_by("pk").values_list(
+                "title", "text", "NPA", "status", "law_type", "created_at"
+            )
+        )
+
+    def test_corpus_is_reproducible(self):
+        first = self.generate(seed=7)
+        Document.objects.all().delete()
+        self.assertEqual(self.generate(seed=7), first)
+        self.assertEqual(find_statistics_drift(), {})
+        for annotation in Annotation.objects.select_related("document"):
+            text = annotation.document.text
+            self.assertEqual(
+                text[annotation.start : annotation.end], annotation.orig_text
+            )
+
+    def test_benchmark_endpoint(self):
+        self.generate(seed=0)
+        client = APIClient()
+        client.force_authenticate(User.objects.get(username="corpus0"))
+        result = benchmark_endpoint(client, reverse("document-search"), repeat=3)
+        self.assertEqual(result["status"], 200)
+        self.assertEqual(result["queries"], 2)
+        self.assertLessEqual(result["p50_ms"], result["p95_ms"])
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        create_documents(cls.user, 3)
+
+    def setUp(self):
+        registry.reset()
+
+    def read_metrics(self):
+        self.client.force_login(
+            User.objects.get_or_create(username="admin", is_staff=True)[0]
+        )
+        response = self.client.get(reverse("metrics"))
+        self.client.logout()
+        return response.content.decode()
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    def test_sampled_request(self):
+        response = self.client.get(reverse("document-list"))
+        timings = response["Server-Timing"]
+        self.assertIn("total;dur=", timings)
+        self.assertIn("db;dur=", timings)
+        self.assertIn('desc="2 queries, 0 duplicate"', timings)
+        self.assertIn("serializer;dur=", timings)
+
+        metrics = self.read_metrics()
+        self.assertIn(
+            'http_requests_total{view="api/documents/$",method="GET",status="200"} 1',
+            metrics,
+        )
+        self.assertIn('db_queries_total{view="api/documents/$"} 2', metrics)
+        self.assertIn(
+            'http_request_duration_seconds_count{view="api/documents/$"} 1', metrics
+        )
+
+    def test_duplicate_queries(self):
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics):
+            for document_id in [1, 1, 2]:
+                Document.objects.filter(pk=document_id).first()
+        self.assertEqual((metrics.queries, metrics.duplicate_queries), (3, 1))
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_request(self):
+        response = self.client.get(reverse("document-list"))
+        self.assertNotIn("db;", response["Server-Timing"])
+        metrics = self.read_metrics()
+        self.assertNotIn("db_queries_total{", metrics)
+
+    def test_streaming_request_is_timed_until_closed(self):
+        response = self.client.get(reverse("export_all-stream"))
+        self.assertNotIn("export_all/stream", self.read_metrics())
+        b"".join(response.streaming_content)
+        response.close()
+        self.assertIn(
+            'http_requests_total{view="api/export_all/stream/$",method="GET",'
+            'status="200"} 1',
+            self.read_metrics(),
+        )
+
+    def test_metrics_are_not_public(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        response = self.client.get(
+            reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.document = create_documents(cls.user, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertNotModified(self, url, queries=1):
+        etag = self.client.get(url)["ETag"]
+        # the versions only
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_not_modified(self):
+        self.assertNotModified(reverse("npa_list"), queries=0)
+        self.assertNotModified(reverse("statistics"))
+        self.assertNotModified(reverse("document-detail", args=[self.document.id]))
+        self.assertNotModified(reverse("annotation_list", args=[self.document.id]))
+
+    def test_annotation_write_invalidates_the_document(self):
+        url = reverse("annotation_list", args=[self.document.id])
+        etag = self.assertNotModified(url)
+        statistics_etag = self.assertNotModified(reverse("statistics"))
+
+        annotation = self.document.annotation_set.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            annotation.delete()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        # annotations are not part of the statistics
+        response = self.client.get(
+            reverse("statistics"), HTTP_IF_NONE_MATCH=statistics_etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_versions_are_shared_by_the_processes(self):
+        url = reverse("statistics")
+        etag = self.assertNotModified(url)
+        # another worker process, with a cache of its own
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # written by a management command
+        DocumentStatistic.objects.update(total=0)
+        call_command("rebuild_statistics", stdout=StringIO())
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_document_write_invalidates_the_statistics(self):
+        url = reverse("statistics")
+        etag = self.assertNotModified(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_documents(self.user, 1, annotations_per_document=0)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status_counts"][0]["total"], 2)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+
+class AsgiTests(TestCase):
+    """
+    Requests through the ASGI handler, as served by the uvicorn workers.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        cls.document = create_documents(cls.user, 2)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = AsyncClient()
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    async def test_async_views(self):
+        response = await self.client.get(
+            reverse("annotation_list", args=[self.document.id])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        # the queries of the async view are counted in the request metrics
+        self.assertIn('desc="3 queries, 0 duplicate"', response["Server-Timing"])
+
+        response = await self.client.get(
+            reverse("statistics"), headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = await self.client.get(
+            reverse("statistics"), headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_statistics_pdf_requires_authentication(self):
+        url = reverse("generate_statistics_pdf")
+        response = await self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+
+        token = RefreshToken.for_user(self.user).access_token
+        response = await self.client.get(
+            url, headers={"Authorization": "Bearer {}".format(token)}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    async def test_export_is_streamed(self):
+        response = await self.client.get(
+            reverse("export_all-stream") + "?output=ndjson"
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(b"".join(lines).count(b"\n"), 2)
+
+
+# the change log is written once the transactions commit
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ChangeExportTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("annotator", password="password")
+        self.documents = create_documents(self.user, 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def changes(self, **params):
+        response = self.client.get(reverse("export_all-changes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_cursor(self):
+        cursor = self.changes()["cursor"]
+        self.assertEqual(cursor, current_cursor())
+
+        edited, removed, untouched = self.documents
+        edited.title = "Новое название"
+        edited.save()
+        annotation = edited.annotation_set.first()
+        annotation.comment = "Проверено"
+        annotation.save()
+        removed_annotations = [
+            str(pk) for pk in removed.annotation_set.values_list("pk", flat=True)
+        ]
+        removed_id = removed.id
+        removed.delete()
+        created = Document.objects.create(user=self.user, title="Новая", text="Текст")
+
+        data = self.changes(since=cursor)
+        self.assertFalse(data["has_more"])
+        self.assertGreater(data["cursor"], cursor)
+        self.assertEqual(
+            [document["id"] for document in data["documents"]], [edited.id, created.id]
+        )
+        self.assertEqual(data["documents"][0]["title"], "Новое название")
+        self.assertEqual(
+            [item["id"] for item in data["annotations"]], [str(annotation.id)]
+        )
+        self.assertEqual(data["deleted"]["documents"], [removed_id])
+        self.assertEqual(data["deleted"]["annotations"], sorted(removed_annotations))
+
+        # nothing changed since the returned cursor
+        data = self.changes(since=data["cursor"])
+        self.assertEqual(data["documents"] + data["annotations"], [])
+
+    def test_bulk_writes_are_logged(self):
+        cursor = current_cursor()
+        annotation = self.documents[0].annotation_set.first()
+        response = self.client.post(
+            reverse("annotation-bulk"),
+            {
+                "operations": [
+                    {"op": "update", "data": {"id": str(annotation.id), "comment": "!"}}
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        data = self.changes(since=cursor)
+        self.assertEqual(data["annotations"][0]["id"], str(annotation.id))
+        annotation.refresh_from_db()
+        self.assertEqual(
+            data["annotations"][0]["updated_at"][:19],
+            annotation.updated_at.isoformat()[:19],
+        )
+
+    def test_pages_follow_the_cursor(self):
+        cursor = current_cursor()
+        for document in self.documents:
+            document.title += "!"
+            document.save()
+
+        ids = []
+        while True:
+            data = self.changes(since=cursor, limit=2)
+            ids += [document["id"] for document in data["documents"]]
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                break
+        self.assertEqual(ids, [document.id for document in self.documents])
+
+    def test_long_transaction_is_not_skipped(self):
+        with transaction.atomic():
+            self.documents[0].title += "!"
+            self.documents[0].save()
+            # taken by another client while the transaction is open
+            cursor = current_cursor()
+        data = self.changes(since=cursor)
+        self.assertEqual(
+            [document["id"] for document in data["documents"]], [self.documents[0].id]
+        )
+
+    def test_since_time(self):
+        data = self.changes(since="2000-01-01T00:00:00Z")
+        self.assertEqual(len(data["documents"]), 3)
+        self.assertEqual(len(data["annotations"]), 6)
+
+        for params in [{"since": "вчера"}, {"since": "1", "limit": "0"}]:
+            response = self.client.get(reverse("export_all-changes"), params)
+            self.assertEqual(response.status_code, 400)
+
+
+LEGAL_ACT = """ГРАЖДАНСКИЙ КОДЕКС РОССИЙСКОЙ ФЕДЕРАЦИИ
+
+ЧАСТЬ ПЕРВАЯ
+
+Раздел I. ОБЩИЕ ПОЛОЖЕНИЯ
+
+Глава 1. ГРАЖДАНСКОЕ ЗАКОНОДАТЕЛЬСТВО
+
+Статья 1. Основные начала гражданского законодательства
+1. Гражданское законодательство основывается на признании равенства участников.
+2. Граждане приобретают и осуществляют свои гражданские права своей волей.
+Гражданские права могут быть ограничены на основании федерального закона.
+(в ред. Федерального закона от 30.12.2012 N 302-ФЗ)
+(за исключением случаев, предусмотренных федеральным законом)
+(абзац утратил силу. - Федеральный закон от 30.12.2012 N 302-ФЗ)
+Статья 2. Отношения, регулируемые гражданским законодательством
+Гражданское законодательство определяет:
+1) правовое положение участников гражданского оборота;
+2) основания возникновения права собственности.
+Статья 3. Утратила силу.
+Глава 2. ВОЗНИКНОВЕНИЕ ГРАЖДАНСКИХ ПРАВ
+
+Статья 8.1. Государственная регистрация прав на имущество
+1. Права на имущество подлежат государственной регистрации.
+"""
+
+
+class LegalActImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+
+    def test_segment_act(self):
+        norms = list(segment_act(LEGAL_ACT.splitlines()))
+        self.assertEqual(
+            [title for title, _ in norms],
+            ["ч. 1 ст. 1", "ч. 2 ст. 1", "ст. 2", "ч. 1 ст. 8.1"],
+        )
+        self.assertEqual(
+            norms[1][1],
+            "Граждане приобретают и осуществляют свои гражданские права своей волей.\n"
+            "Гражданские права могут быть ограничены на основании федерального закона.\n"
+            "(за исключением случаев, предусмотренных федеральным законом)",
+        )
+        self.assertTrue(
+            norms[2][1].endswith("2) основания возникновения права собственности.")
+        )
+
+    def test_import_act(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            reverse("document-import-act"),
+            {
+                "NPA": "ГК_1_2",
+                "encoding": "cp1251",
+                "file": SimpleUploadedFile("gk.txt", LEGAL_ACT.encode("cp1251")),
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["norms"], 4)
+        document = Document.objects.get(title="ч. 1 ст. 8.1")
+        self.assertEqual(document.NPA, "ГК_1_2")
+        self.assertEqual(
+            document.text, "Права на имущество подлежат государственной регистрации."
+        )
+
+        response = client.post(
+            reverse("document-import-act"),
+            {
+                "NPA": "ГК_1_2",
+                "file": SimpleUploadedFile("gk.txt", LEGAL_ACT.encode("cp1251")),
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Document.objects.count(), 4)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", encoding="utf-8") as act:
+            act.write(LEGAL_ACT)
+            act.flush()
+            call_command(
+                "import_legal_act",
+                act.name,
+                npa="ГК_1_2",
+                user="annotator",
+                batch_size=3,
+                stdout=StringIO(),
+            )
+        self.assertEqual(
+            DocumentStatistic.objects.get(dimension="NPA", value="ГК_1_2").total, 4
+        )
+
+
+@override_settings(DATASET_SNAPSHOT_WORKERS=0, DATASET_SNAPSHOT_ACCEL_REDIRECT="")
+class SnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("annotator", password="password")
+        create_documents(cls.user, 3)
+
+    def setUp(self):
+        # change log cursors are reused once a test is rolled back
+        directory = override_settings(DATASET_SNAPSHOT_DIR=tempfile.mkdtemp())
+        directory.enable()
+        self.addCleanup(directory.disable)
+
+    def test_snapshot_is_written_once_requested(self):
+        url = reverse("snapshot", kwargs={"kind": "all"})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(self.client.get(reverse("snapshot_list")).json()["all"])
+
+        call_command("build_snapshots", kind=["all"], stdout=StringIO())
+        info = self.client.get(reverse("snapshot_list")).json()["all"]
+        self.assertTrue(info["fresh"])
+        self.assertEqual(info["records"], 3)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = b"".join(response.streaming_content)
+        self.assertEqual(hashlib.sha256(content).hexdigest(), info["sha256"])
+        self.assertEqual(response["X-Snapshot-SHA256"], info["sha256"])
+        documents = json.loads(gzip.decompress(content))
+        self.assertEqual(len(documents), 3)
+        self.assertEqual(len(documents[0]["annotations"]), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_documents(self.user, 1)
+        self.assertFalse(
+            self.client.get(reverse("snapshot_list")).json()["all"]["fresh"]
+        )
+        # the previous snapshot is served until the new one is written
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(DATASET_SNAPSHOT_ACCEL_REDIRECT="/protected/snapshots/")
+    def test_snapshot_is_sent_by_nginx(self):
+        snapshot = build_snapshot("annotations")
+        self.assertEqual(snapshot["records"], 6)
+        response = self.client.get(reverse("snapshot", kwargs={"kind": "annotations"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            "/protected/snapshots/" + snapshot["file_name"],
+        )
+        self.assertEqual(response.content, b"")
+
+    @override_settings(DATASET_SNAPSHOT_WORKERS=1)
+    def test_one_build_per_kind_is_queued(self):
+        release = threading.Event()
+        busy = snapshots._executor.submit(release.wait, 5)
+        for kind in ("all", "documents"):
+            self.addCleanup(snapshots._jobs.pop, kind, None)
+
+        job = snapshots.schedule_snapshot("all")
+        self.assertIs(snapshots.schedule_snapshot("all"), job)
+        other = snapshots.schedule_snapshot("documents")
+        self.assertIsNot(other, job)
+        # still waiting for the worker, so they are not run
+        self.assertTrue(job.cancel() and other.cancel())
+        release.set()
+        busy.result(5)
+
+    def test_removed_snapshot_is_being_generated(self):
+        snapshot = build_snapshot("documents")
+        os.remove(snapshot["path"])
+        response = self.client.get(reverse("snapshot", kwargs={"kind": "documents"}))
+        self.assertEqual(response.status_code, 202)
+
+    def test_unknown_snapshot(self):
+        response = self.client.get(reverse("snapshot", kwargs={"kind": "users"}))
+        self.assertEqual(response.status_code, 404)
@@ -15,7 +15,11 @@ from .views import (
     document_statistics,
     date_range_statistics,
     generate_statistics_pdf,
+    metrics,
+    model_info,
     npa_list,
+    snapshot_download,
+    snapshot_list,
 )
 
 router = DefaultRouter()
@@ -35,8 +39,12 @@ urlpatterns = [
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("login/", login, name="login"),
     path("me/", me, name="me"),
+    path("snapshots/", snapshot_list, name="snapshot_list"),
+    path("snapshots/<str:kind>/", snapshot_download, name="snapshot"),
     path("", include(router.urls)),
     path("annotations_list/<int:document_id>", annotation_list, name="annotation_list"),
+    path("model-info", model_info, name="model_info"),
+    path("metrics", metrics, name="metrics"),
     path("statistics", document_statistics, name="statistics"),
     path("date_range_statistics/", date_range_statistics, name="date_range_statistics"),
     path(
@@ -1,43 +1,91 @@
-from datetime import datetime, timedelta
-from io import BytesIO
+import asyncio
+import codecs
+import hashlib
+import json
+from datetime import date
 
-import matplotlib
-import matplotlib.pyplot as plt
-from PIL import Image as PILImage
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
-from django.db.models import Count
 from django.db.models import Q
-from django.db.models.functions import TruncMonth
-from django.http import JsonResponse, HttpResponse
-from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from reportlab.lib import colors
-from reportlab.lib.colors import Color
-from reportlab.lib.colors import HexColor
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.platypus import Image
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer,
-    PageBreak,
+from django.conf import settings
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
 )
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_safe
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from annotator.models import Annotation, Document
+from annotator.changes import current_cursor, cursor_at
+from annotator.legal_acts import import_legal_act
+from annotator.models import Annotation, ClassificationJob, Document
+from annotator.recogito import RECOGITO_FIELDS, recogito_annotation
+from annotator.search import search_documents
+from annotator.statistics import (
+    GRANULARITIES,
+    count_periods,
+    get_date_range_statistics,
+    get_document_statistics,
+)
+from annotator.versions import DOCUMENTS_VERSION, document_version
 from app_config.npa import NPA
+from ethical_index.metrics import registry
+from .authentication import async_authenticate, async_login_required
+from .bulk import (
+    BULK_MAX_OPERATIONS,
+    BulkValidationError,
+    apply_annotation_operations,
+)
+from .caching import acached_data, cached_data, versioned
+from .export import (
+    DELTA_DEFAULT_LIMIT,
+    DELTA_MAX_LIMIT,
+    EXPORT_FORMATS,
+    delta_export,
+    stream_export,
+    streaming_content,
+)
+from .filters import DocumentFilterMixin
+from .ingest import (
+    IngestSerializer,
+    LegalActImportSerializer,
+    ingest_classified_norms,
+)
+from .jobs import (
+    STATUS_JOBS_LIMIT,
+    ClassificationJobSerializer,
+    create_classification_job,
+    get_jobs_status,
+    get_model_info,
+)
+from .pagination import (
+    DocumentKeysetPagination,
+    DocumentPagination,
+    estimate_count,
+    get_count_mode,
+)
+from .pdf_cache import (
+    get_cached_statistics_pdf,
+    schedule_statistics_pdf,
+    statistics_fingerprint,
+)
+from .snapshots import (
+    SNAPSHOT_KINDS,
+    get_snapshot,
+    schedule_snapshot,
+    snapshot_response,
+)
 from .serializers import (
     AnnotationSerializer,
     ExportAnnotationSerializer,
@@ -47,13 +95,15 @@ from .serializers import (
 )
 from .serializers import UserSerializer
 
-matplotlib.use("Agg")  # Set the backend to Agg
-pdfmetrics.registerFont(TTFont("Roboto", "fonts/Roboto-Regular.ttf"))
-pdfmetrics.registerFont(TTFont("Roboto-Bold", "fonts/Roboto-Bold.ttf"))
+# Longest series of date_range_statistics, ten years of days
+DATE_RANGE_MAX_PERIODS = 3660
+# the list is static, it only changes with a deployment
+NPA_ETAG = hashlib.sha1(json.dumps(NPA).encode("utf-8")).hexdigest()
 
 
 @api_view(["GET"])
 @permission_classes([permissions.AllowAny])
+@condition(etag_func=lambda request: NPA_ETAG)
 def npa_list(request):
     return JsonResponse({"npa": NPA})
 
@@ -91,36 +141,209 @@ class AnnotationViewSet(viewsets.ModelViewSet):
     serializer_class = AnnotationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Create, update and delete annotations in one transaction.
+        Body: {"operations": [{"op": "create" | "update" | "delete", ...}, ...]}
+        """
+        operations = request.data.get("operations")
+        if not isinstance(operations, list) or not all(
+            isinstance(operation, dict) for operation in operations
+        ):
+            return Response(
+                {"message": "operations must be a list of objects"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(operations) > BULK_MAX_OPERATIONS:
+            return Response(
+                {
+                    "message": "Too many operations, the limit is {}".format(
+                        BULK_MAX_OPERATIONS
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            results = apply_annotation_operations(operations, self.get_queryset())
+        except BulkValidationError as error:
+            return Response(
+                {"results": error.results}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"results": results})
+
 
-class ExportAnnotationViewSet(viewsets.ModelViewSet):
+class ExportAnnotationViewSet(DocumentFilterMixin, viewsets.ModelViewSet):
     queryset = Annotation.objects.exclude(document__status='generated')
     serializer_class = ExportAnnotationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    document_filter_prefix = "document__"
 
 
-class DocumentAndAnnotationViewset(viewsets.ModelViewSet):
-    queryset = Document.objects.exclude(status='generated')
+class DocumentAndAnnotationViewset(DocumentFilterMixin, viewsets.ModelViewSet):
+    queryset = (
+        Document.objects.exclude(status='generated')
+        .select_related("user")
+        .prefetch_related("annotation_set")
+    )
     serializer_class = DocumentAndAnnotationSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @action(detail=False, methods=["get"])
+    def stream(self, request):
+        # ?output=json (default) streams a JSON array, ?output=ndjson - one document per line
+        export_format = request.GET.get("output", "json")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"message": "Invalid output format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = StreamingHttpResponse(
+            streaming_content(
+                request._request, stream_export(self.get_queryset(), export_format)
+            ),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = 'attachment; filename="export_all.{}"'.format(
+            export_format
+        )
+        return response
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        # ?since=<cursor or ISO 8601 time>&limit=<change log entries>; without
+        # `since` only the current cursor is returned, to be taken before a full export
+        since = request.GET.get("since", "")
+        if not since:
+            return Response({"cursor": current_cursor()})
+
+        if since.isdigit():
+            cursor = int(since)
+        else:
+            try:
+                moment = parse_datetime(since)
+            except ValueError:
+                moment = None
+            if moment is None:
+                return Response(
+                    {"message": "since must be a cursor or an ISO 8601 time"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            cursor = cursor_at(moment)
+
+        try:
+            limit = int(request.GET.get("limit", DELTA_DEFAULT_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= DELTA_MAX_LIMIT:
+            return Response(
+                {"message": "limit must be between 1 and {}".format(DELTA_MAX_LIMIT)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(delta_export(self.get_queryset(), cursor, limit))
+
+
+def _latest_snapshot(kind, cursor):
+    snapshot = get_snapshot(kind)
+    if snapshot is None or snapshot["cursor"] != cursor:
+        # rebuilt in the background, the previous snapshot is served meanwhile
+        schedule_snapshot(kind)
+    return snapshot
+
+
+def _snapshot_info(request, snapshot, cursor):
+    if snapshot is None:
+        return None
+    kind = snapshot["kind"]
+    return {
+        "kind": kind,
+        "cursor": snapshot["cursor"],
+        "fresh": snapshot["cursor"] == cursor,
+        "created_at": snapshot["created_at"],
+        "records": snapshot["records"],
+        "size": snapshot["size"],
+        "sha256": snapshot["sha256"],
+        "url": request.build_absolute_uri(reverse("snapshot", kwargs={"kind": kind})),
+    }
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticatedOrReadOnly])
-def annotation_list(request, document_id):
-    document = get_object_or_404(Document, id=document_id)
-    annotations = Annotation.objects.filter(document=document)
-    response = [annotation.json_data for annotation in annotations]
-    return JsonResponse(response, safe=False)
+def snapshot_list(request):
+    """
+    Metadata of the gzip-compressed dataset snapshots. `fresh` is false while
+    a snapshot with the latest changes is being written.
+    """
+    cursor = current_cursor()
+    return Response(
+        {
+            kind: _snapshot_info(request, _latest_snapshot(kind, cursor), cursor)
+            for kind in SNAPSHOT_KINDS
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def snapshot_download(request, kind):
+    """
+    The latest snapshot of documents, annotations or all (documents with their
+    annotations), a gzip-compressed JSON array sent by nginx, see api.snapshots.
+    """
+    if kind not in SNAPSHOT_KINDS:
+        return Response(
+            {
+                "message": "Unknown snapshot, use one of: {}".format(
+                    ", ".join(SNAPSHOT_KINDS)
+                )
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    snapshot = _latest_snapshot(kind, current_cursor())
+    if snapshot is not None:
+        try:
+            return snapshot_response(snapshot)
+        except FileNotFoundError:
+            # removed by a newer snapshot since the metadata was read
+            pass
+    return Response(
+        {"message": "The snapshot is being generated, try again later"},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Retry-After": "5"},
+    )
+
+
+# readable without authentication, so it is a plain async view
+@require_safe
+@versioned(lambda document_id: [document_version(document_id)])
+async def annotation_list(request, document_id):
+    async def annotations():
+        document = await aget_object_or_404(Document, id=document_id)
+        # the Recogito annotations are rebuilt from the columns, see annotator.recogito
+        return [
+            recogito_annotation(fields)
+            async for fields in Annotation.objects.filter(document=document).values(
+                *RECOGITO_FIELDS, "json_data"
+            )
+        ]
+
+    return JsonResponse(
+        await acached_data(request, "annotation_list", annotations),
+        safe=False,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
 
 
 @api_view(["PATCH"])
 @permission_classes([IsAuthenticated])
 def change_document_status(request, document_id):
-    document = get_object_or_404(Document, id=document_id)
+    document = get_object_or_404(Document.objects.defer("text"), id=document_id)
 
     new_status = request.data.get("status")
-    print("NEW STATUS:", new_status)
     if new_status == "UNMARKED":
         if document.status == "MARKED":
             if request.user.has_perm("annotator.can_mark_as_marked"):
@@ -147,7 +370,6 @@ def change_document_status(request, document_id):
 
     # Get the permission corresponding to the new status
     status_permission = status_permission_map.get(new_status)
-    # print(status_permission)
 
     # If the status is not valid, return an error
     if status_permission is None:
@@ -169,7 +391,8 @@ def change_document_status(request, document_id):
 
 
 class ClassifierViewSet(viewsets.ModelViewSet):
-    queryset = Document.objects.all()
+    # classifiers do not need the (potentially large) text
+    queryset = Document.objects.defer("text")
     serializer_class = ClassifierSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
@@ -182,56 +405,126 @@ class ClassifierViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class DocumentPagination(PageNumberPagination):
-    page_size = 25
-    page_size_query_param = "page_size"
-    max_page_size = 100
-
-
-class DocumentViewSet(viewsets.ModelViewSet):
-    queryset = Document.objects.all()
+class DocumentViewSet(DocumentFilterMixin, viewsets.ModelViewSet):
+    queryset = Document.objects.select_related("user")
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = DocumentPagination
 
-    @action(detail=False, methods=["get"])
-    def search(self, request):
-        search_query = request.GET.get("search", "")
-        search_type = request.GET.get("search_type", "title")
+    @property
+    def paginator(self):
+        # ?cursor= switches to keyset pagination, an empty cursor is the first page
+        if not hasattr(self, "_paginator"):
+            if DocumentKeysetPagination.cursor_query_param in self.request.query_params:
+                self._paginator = DocumentKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
-        law_types = (
-            request.GET.get("law_types", "").split(",")
-            if request.GET.get("law_types", "")
-            else []
-        )
-        npa_values = (
-            request.GET.get("npa", "").split(",") if request.GET.get("npa", "") else []
+    @method_decorator(versioned(lambda pk: [document_version(pk)]))
+    def retrieve(self, request, *args, **kwargs):
+        data = cached_data(
+            request, "document", lambda: self.get_serializer(self.get_object()).data
         )
-        from_date = request.GET.get("from_date", None)
-        to_date = request.GET.get("to_date", None)
-        dominant_justifications = (
-            request.GET.get("dominant_justifications", "").split(",")
-            if request.GET.get("dominant_justifications", "")
-            else []
+        return Response(data)
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def ingest(self, request):
+        """
+        Create all norms of a legal act classified by the model in one request.
+        """
+        serializer = IngestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        documents, stats = ingest_classified_norms(
+            request.user,
+            serializer.validated_data["title"],
+            serializer.validated_data["NPA"],
+            serializer.validated_data["norms"],
         )
-        doc_status = (
-            request.GET.get("status", "").split(",")
-            if request.GET.get("status", "")
-            else []
+        return Response(
+            {"documents": documents, **stats}, status=status.HTTP_201_CREATED
         )
 
-        user = request.GET.get("user", "")
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import_act",
+        permission_classes=[IsAuthenticated],
+    )
+    def import_act(self, request):
+        """
+        Create the norms of a whole legal act uploaded as a text file, one
+        document per article part. The file is read line by line.
+        """
+        serializer = LegalActImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        encoding = serializer.validated_data["encoding"]
+        try:
+            stats = import_legal_act(
+                request.user,
+                serializer.validated_data["NPA"],
+                codecs.iterdecode(serializer.validated_data["file"], encoding),
+            )
+        except UnicodeDecodeError:
+            return Response(
+                {"file": ["The file is not in the {} encoding".format(encoding)]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not stats["norms"]:
+            return Response(
+                {"file": ["No articles found"]}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(stats, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post"], permission_classes=[IsAuthenticated])
+    def classify(self, request):
+        """
+        Queue a legal act for classification, its norms are created by a worker.
+        """
+        serializer = ClassificationJobSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        job = create_classification_job(
+            request.user,
+            serializer.validated_data["title"],
+            serializer.validated_data["NPA"],
+            serializer.validated_data["text"],
+        )
+        data = get_jobs_status([job])
+        return Response(
+            {**data["documents"][0], "queue_depth": data["queue_depth"]},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-        q_objects = Q()
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path="status",
+        permission_classes=[IsAuthenticated],
+    )
+    def classification_status(self, request):
+        jobs = ClassificationJob.objects.filter(user=request.user).order_by(
+            "-created_at"
+        )[:STATUS_JOBS_LIMIT]
+        return Response(get_jobs_status(jobs))
 
-        is_query_valid = True
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        search_query = request.GET.get("search", "")
+        search_type = request.GET.get("search_type", "title")
 
+        # the document filters (law_types, npa, status, ...) are applied by
+        # get_queryset, see api.filters
         q_objects = Q()
 
-        if search_query:
-            if search_type == "text":
-                q_objects |= Q(text__icontains=search_query)
-            elif search_type == "id":
+        # text search is done with the full text index after the other filters
+        if search_query and search_type != "text":
+            if search_type == "id":
                 try:
                     q_objects |= Q(id=int(search_query))
                 except ValueError:
@@ -241,51 +534,13 @@ class DocumentViewSet(viewsets.ModelViewSet):
             else:
                 q_objects |= Q(title__icontains=search_query)
 
-        if law_types:
-            law_types_q_objects = Q()
-            for law_type in law_types:
-                law_types_q_objects |= Q(law_type__iexact=law_type)
-            q_objects &= law_types_q_objects
-
-        if dominant_justifications:
-            dominant_justifications_q_objects = Q()
-            for dominant_justification in dominant_justifications:
-                dominant_justifications_q_objects |= Q(
-                    dominant_justification__iexact=dominant_justification
-                )
-            q_objects &= dominant_justifications_q_objects
-
-        if npa_values:
-            npa_q_objects = Q()
-            for npa in npa_values:
-                npa_q_objects |= Q(NPA__iexact=npa)
-            q_objects &= npa_q_objects
-
-        if doc_status:
-            status_q_objects = Q()
-            for state in doc_status:
-                status_q_objects |= Q(status__iexact=state)
-            q_objects &= status_q_objects
-
-        if from_date or to_date:
-            from_date = (
-                from_date if from_date else "2000-01-01"
-            )
-            if to_date:
-                to_date = (
-                    datetime.strptime(to_date, "%Y-%m-%d") + timedelta(days=1)
-                ).isoformat()
-            else:
-                to_date = datetime.now().isoformat()
-            q_objects &= Q(created_at__range=(from_date, to_date))  # For date range
-
-        if user:
-            q_objects &= Q(user__username__icontains=user)  # For username
-
-        documents = Document.objects.filter(q_objects).order_by("-created_at")
+        documents = self.get_queryset().filter(q_objects).order_by("-created_at")
+        if search_query and search_type == "text":
+            documents = search_documents(documents, search_query)
 
-        # Count the total number of documents matching the filters
-        total_documents = documents.count()
+        # Keyset pages do not need the total, so it is only counted on request
+        keyset = isinstance(self.paginator, DocumentKeysetPagination)
+        count_mode = get_count_mode(request, "none" if keyset else "exact")
 
         # Use pagination to paginate the results
         page = self.paginate_queryset(documents)
@@ -294,9 +549,19 @@ class DocumentViewSet(viewsets.ModelViewSet):
 
             # Manually add total_documents to the paginated response
             paginated_response = self.get_paginated_response(serializer.data)
+            if not keyset:
+                # already counted by the paginator
+                total_documents = self.paginator.page.paginator.count
+            elif count_mode == "exact":
+                total_documents = documents.count()
+            elif count_mode == "estimate":
+                total_documents = estimate_count(documents)
+            else:
+                total_documents = None
             paginated_response.data["total_documents"] = total_documents
             return paginated_response
 
+        total_documents = documents.count()
         serializer = self.get_serializer(documents, many=True)
 
         # Add the total_documents to the response
@@ -305,579 +570,143 @@ class DocumentViewSet(viewsets.ModelViewSet):
         )
 
 
-@action(detail=False, methods=["get"])
-@permission_classes([IsAuthenticated])
-def document_statistics(request):
-    # Count of Documents by User
-    user_document_counts = (
-        Document.objects.values("user__username")
-        .annotate(total=Count("id"))
-        .order_by("-total")
+def metrics(request):
+    """
+    Request metrics of this process in the Prometheus text format, for the
+    METRICS_TOKEN bearer token or a staff user.
+    """
+    authorized = settings.METRICS_TOKEN and request.headers.get(
+        "Authorization"
+    ) == "Bearer {}".format(settings.METRICS_TOKEN)
+    if not authorized and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
-    # Documents Count by Justification Type
-    justification_counts = (
-        Document.objects.values("dominant_justification")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
 
-    # Documents Count by Law Type
-    law_type_counts = (
-        Document.objects.values("law_type")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-
-    # Documents Count by NPA (НПА)
-    npa_counts = (
-        Document.objects.values("NPA").annotate(total=Count("id")).order_by("-total")
-    )
-
-    # Documents Count by Status
-    status_counts = (
-        Document.objects.values("status").annotate(total=Count("id")).order_by("-total")
-    )
-
-    # Count of Documents for each points value for each justification type
-    auth_points_counts = (
-        Document.objects.values("AUTH_points")
-        .annotate(total=Count("id"))
-        .order_by("-AUTH_points")
-    )
-    care_points_counts = (
-        Document.objects.values("CARE_points")
-        .annotate(total=Count("id"))
-        .order_by("-CARE_points")
-    )
-    loyal_points_counts = (
-        Document.objects.values("LOYAL_points")
-        .annotate(total=Count("id"))
-        .order_by("-LOYAL_points")
-    )
-    fair_points_counts = (
-        Document.objects.values("FAIR_points")
-        .annotate(total=Count("id"))
-        .order_by("-FAIR_points")
-    )
-    pur_points_counts = (
-        Document.objects.values("PUR_points")
-        .annotate(total=Count("id"))
-        .order_by("-PUR_points")
-    )
-    non_points_counts = (
-        Document.objects.values("NON_points")
-        .annotate(total=Count("id"))
-        .order_by("-NON_points")
-    )
-
-    # Time Series Data (Document submissions over time)
-    monthly_counts = (
-        Document.objects.annotate(month=TruncMonth("created_at"))
-        .values("month")
-        .annotate(total=Count("id"))
-        .order_by("month")
-    )
-
-    justification_law_type_counts = get_justification_law_type()
-
-    # Combine all data into a single response
-    data = {
-        "user_document_counts": list(user_document_counts),
-        "justification_counts": list(justification_counts),
-        "law_type_counts": list(law_type_counts),
-        "npa_counts": list(npa_counts),
-        "status_counts": list(status_counts),
-        "auth_points_counts": list(auth_points_counts),
-        "care_points_counts": list(care_points_counts),
-        "loyal_points_counts": list(loyal_points_counts),
-        "fair_points_counts": list(fair_points_counts),
-        "pur_points_counts": list(pur_points_counts),
-        "non_points_counts": list(non_points_counts),
-        "monthly_counts": list(monthly_counts),
-        "justification_law_type_counts": justification_law_type_counts,
-    }
-
-    return JsonResponse(data)
-
-
-def get_justification_law_type():
-    queryset = (
-        Document.objects.values("dominant_justification", "law_type")
-        .annotate(count=Count("id"))
-        .order_by("dominant_justification", "law_type")
-    )
-    justification_law_type_counts = {
-        j: {t: 0 for t, _ in Document.TYPE_CHOICES}
-        for j, _ in Document.JUSTIFICATION_CHOICES
-    }
-    for entry in queryset:
-        justification = entry["dominant_justification"]
-        law_type = entry["law_type"]
-        count = entry["count"]
-        justification_law_type_counts[justification][law_type] = count
-    return justification_law_type_counts
+@api_view(["GET"])
+def model_info(request):
+    return Response(get_model_info())
 
 
 @action(detail=False, methods=["get"])
 @permission_classes([IsAuthenticated])
-def date_range_statistics(request):
-    start_date = request.GET.get("start_date")
-    end_date = request.GET.get("end_date")
-
-    # Convert string dates to datetime objects
-    start_date = datetime.strptime(start_date, "%Y-%m-%d")
-    end_date = datetime.strptime(end_date, "%Y-%m-%d")
-    end_date = end_date + timedelta(days=1)
-
-    # Filter documents within the date range
-    documents_in_range = Document.objects.filter(
-        created_at__range=(start_date, end_date)
-    )
-
-    # Aggregate data
-    total_documents = documents_in_range.count()
-    user_document_counts = (
-        documents_in_range.values("user__username")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-
-    data = {
-        "total_documents": total_documents,
-        "user_document_counts": list(user_document_counts),
-    }
-
+@versioned(lambda: [DOCUMENTS_VERSION])
+async def document_statistics(request):
+    # counters are maintained on document writes, see annotator.statistics
+    data = await acached_data(
+        request, "statistics", sync_to_async(get_document_statistics)
+    )
+    # the statistics are public, but only a signed in user may download the
+    # PDF report next, so it is prepared in the background for them only
+    try:
+        user = await async_authenticate(request)
+    except AuthenticationFailed:
+        user = None
+    if user is not None and user.is_authenticated:
+        await sync_to_async(schedule_statistics_pdf)(
+            statistics_fingerprint(data), data, build_statistics_pdf
+        )
     return JsonResponse(data)
 
 
-label_mapping = {
-    "UNCHECKED": "не проверено",
-    "ALLOW": "Дозволение",
-    "DUTY": "Обязанность",
-    "BAN": "Запрет",
-    "DEF": "Дефиниция",
-    "DEC": "Декларация",
-    "GOAL": "Цель",
-    "OTHER": "Иное",
-    "AUTH": "Авторитет",
-    "CARE": "Забота",
-    "LOYAL": "Лояльность",
-    "FAIR": "Справедлив.",
-    "PUR": "Чистота",
-    "NON": "Нет окраски",
-}
-
-
-def resize_image(image_path_or_buffer, max_width):
-    if isinstance(image_path_or_buffer, BytesIO):
-        pil_image = PILImage.open(image_path_or_buffer)
-    else:
-        pil_image = PILImage.open(image_path_or_buffer)
-
-    original_width, original_height = pil_image.size
-    aspect_ratio = original_height / original_width
-    new_height = max_width * aspect_ratio
-
-    return Image(image_path_or_buffer, width=max_width, height=new_height)
-
-
-def generate_bar_chart_image(data, labels, color, figsize):
-    readable_labels = [label_mapping.get(label, label) for label in labels]
-
-    # Increased figure size and resolution
-    plt.figure(figsize=(figsize[0], figsize[1]))  # Increase figure size
-    plt.bar(readable_labels, data, color=color)
-    plt.xticks(rotation=60, ha="right")  # Adjust font size
-    plt.tight_layout()
-
-    # Save the plot with higher resolution
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format="png", dpi=300)  # Increase resolution with dpi
-    img_buffer.seek(0)
-    plt.close()
-
-    return img_buffer
-
-
-def create_justification_law_type_table():
-    data = get_justification_law_type()
-    # header
-    header = ["Моральное основание"] + [
-        label_mapping[type_key] for type_key in next(iter(data.values()))
-    ]
-
-    # data rows
-    table_rows = [header]
-    for justification, types in data.items():
-        row = [label_mapping[justification]] + [types[type_key] for type_key in types]
-        table_rows.append(row)
-
-    return table_rows
-
-
-@api_view(["GET"])
+@action(detail=False, methods=["get"])
 @permission_classes([IsAuthenticated])
-def generate_statistics_pdf(request):
-    response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="statistics.pdf"'
-
-    # Fetch the justification data
-    justification_counts = (
-        Document.objects.values("dominant_justification")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-
-    # Create a SimpleDocTemplate object
-    doc = SimpleDocTemplate(
-        response,
-        pagesize=letter,
-        topMargin=1,
-        leftMargin=10,
-        rightMargin=10,
-        bottomMargin=10,
-    )
-
-    # Set up styles
-    styles = getSampleStyleSheet()
-
-    custom_dark_blue = Color(0, 0, 0.3)
-    law_type_color = HexColor("#82ca9d")
-    justification_color = HexColor("#8884d8")
-
-    white_font_style = ParagraphStyle(
-        "WhiteFont", parent=styles["Normal"], fontSize=10, textColor=colors.whitesmoke
-    )
-    heading_style = ParagraphStyle(
-        "HeadingStyle",
-        parent=white_font_style,
-        alignment=TA_LEFT,
-        fontName="Roboto-Bold",
-    )
-    date_style = ParagraphStyle(
-        "DateStyle", parent=white_font_style, alignment=TA_RIGHT, fontName="Roboto-Bold"
-    )
-
-    # Heading and date
-    heading_text = "<para leftIndent=10>Статистика инструмента для сбора датасета Индекса Этичности</para>"
-    date_text = "<para rightIndent=10>{}</para>".format(
-        timezone.now().strftime("%d.%m.%Y")
-    )
-    heading = Paragraph(heading_text, heading_style)
-    date = Paragraph(date_text, date_style)
-
-    # Table to align heading and date on a blue background
-    header_content = [[heading, date]]
-    header_table = Table(
-        header_content, colWidths=[7 * inch, 1 * inch], rowHeights=[0.3 * inch]
-    )
-    header_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, -1), custom_dark_blue),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("LEFTPADDING", (0, 0), (-1, -1), 0),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
-                ("TOPPADDING", (0, 0), (-1, -1), 0),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
-            ]
-        )
-    )
-
-    # Create elements list for Platypus
-    elements = [header_table]
-
-    status_names = {
-        "MARKED": "Размечено, не проверено",
-        "CHECKED": "Проверено",
-        "UNMARKED": "Не размечено",
-        "GENERATED": "Сгенерировано",
-    }
-
-    # Fetch status counts data and apply the mapping
-    status_counts = (
-        Document.objects.values("status").annotate(total=Count("id")).order_by("-total")
-    )
-    # Calculate the total number of documents
-    total_documents = sum(item["total"] for item in status_counts)
-    labels = ["Всего документов"] + [status_names[st["status"]] for st in status_counts]
-    values = [str(total_documents)] + [str(st["total"]) for st in status_counts]
-    # Create a table for the rectangle
-    rectangle_data = [labels, values]
-    rectangle_table = Table(rectangle_data, colWidths=[2 * inch] * 4)
-    rectangle_table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, -1), HexColor("#F8F8F8")),
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("TOPPADDING", (0, 0), (-1, -1), 5),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
-            ]
+def date_range_statistics(request):
+    """
+    Documents created from start_date to end_date (YYYY-MM-DD, both included),
+    with the series of totals per ?granularity=day (default), week or month.
+    """
+    try:
+        start_date = date.fromisoformat(request.GET.get("start_date", ""))
+        end_date = date.fromisoformat(request.GET.get("end_date", ""))
+    except ValueError:
+        return JsonResponse(
+            {"message": "start_date and end_date must be YYYY-MM-DD dates"}, status=400
         )
-    )
-
-    # Add the rectangle table to elements list
-    elements = [
-        header_table,
-        Spacer(1, 0.2 * inch),
-        rectangle_table,
-        Spacer(1, 0.2 * inch),
-    ]
-
-    # Create table data for justification counts
-    # Mapping for justification names
-
-    # Mapping for law type names
-    law_type_names = {
-        "UNCHECKED": "не проверено",
-        "ALLOW": "Дозволение",
-        "DUTY": "Обязанность",
-        "BAN": "Запрет",
-        "DEF": "Дефиниция",
-        "DEC": "Декларация",
-        "GOAL": "Цель",
-        "OTHER": "Иное",
-    }
-
-    # Fetch law type counts data and apply the mapping
-    law_type_counts = (
-        Document.objects.values("law_type")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    law_type_data = [
-        [law_type_names.get(law_type["law_type"], "Other"), law_type["total"]]
-        for law_type in law_type_counts
-    ]
-
-    justification_names = {
-        "UNCHECKED": "не проверено",
-        "AUTH": "Авторитет",
-        "CARE": "Забота",
-        "LOYAL": "Лояльность",
-        "FAIR": "Справедливость",
-        "PUR": "Чистота",
-        "NON": "Нет этической окраски",
-    }
-
-    # Fetch justification counts data and apply the mapping
-    justification_counts = (
-        Document.objects.values("dominant_justification")
-        .annotate(total=Count("id"))
-        .order_by("-total")
-    )
-    justification_data = [
-        [
-            justification_names.get(justification["dominant_justification"], "Other"),
-            justification["total"],
-        ]
-        for justification in justification_counts
-    ]
-
-    # Create a table for justifications
-
-    justification_table = Table(justification_data, colWidths=[2 * inch, 1 * inch])
-    justification_table.setStyle(
-        TableStyle(
-            [
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                ("BACKGROUND", (0, 0), (-1, -1), justification_color),
-            ]
+    granularity = request.GET.get("granularity", "day")
+    if granularity not in GRANULARITIES:
+        return JsonResponse(
+            {
+                "message": "granularity must be one of: {}".format(
+                    ", ".join(GRANULARITIES)
+                )
+            },
+            status=400,
         )
-    )
-
-    law_type_table = Table(law_type_data, colWidths=[2 * inch, 1 * inch])
-    law_type_table.setStyle(
-        TableStyle(
-            [
-                ("ALIGN", (0, 0), (-1, -1), "LEFT"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                ("BACKGROUND", (0, 0), (-1, -1), law_type_color),
-            ]
+    if start_date > end_date:
+        return JsonResponse(
+            {"message": "start_date must not be after end_date"}, status=400
         )
-    )
-
-    # Graphs
-    justification_graph_data = [item["total"] for item in justification_counts]
-    justification_graph_labels = [
-        item["dominant_justification"] for item in justification_counts
-    ]
-    justification_img = generate_bar_chart_image(
-        justification_graph_data, justification_graph_labels, "#8884d8", (6, 4)
-    )
-
-    law_type_graph_data = [item["total"] for item in law_type_counts]
-    law_type_graph_labels = [item["law_type"] for item in law_type_counts]
-    law_type_img = generate_bar_chart_image(
-        law_type_graph_data, law_type_graph_labels, "#82ca9d", (6, 4)
-    )
-
-    heading_style = ParagraphStyle("HeadingStyle", fontName="Roboto-Bold")
-    justification_title = Paragraph("Профиль нормы", heading_style)
-    law_type_title = Paragraph("Тип нормы", heading_style)
-    # Adjustments for the layout table to position tables closer to corners and add a larger gap
-    layout_table_data = [
-        [justification_title, "", law_type_title],
-        [justification_table, "", law_type_table],
-    ]
-    # Increase the width of the gap and adjust the table widths
-    layout_table = Table(
-        layout_table_data, colWidths=[3 * inch, 1 * inch, 3 * inch]
-    )  # Adjust widths as needed
-    layout_table.setStyle(
-        TableStyle(
-            [
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                (
-                    "BACKGROUND",
-                    (1, 0),
-                    (1, 0),
-                    colors.white,
-                ),  # Optional: background color for the gap
-            ]
+    if count_periods(start_date, end_date, granularity) > DATE_RANGE_MAX_PERIODS:
+        return JsonResponse(
+            {"message": "The range is too long, use a coarser granularity"},
+            status=400,
         )
-    )
-
-    # Add the layout table to elements list
-    elements.append(layout_table)
-
-    max_image_width = 3.9 * inch
 
-    # Resize images while maintaining aspect ratio
-    justification_image = resize_image(justification_img, max_image_width)
-    law_type_image = resize_image(law_type_img, max_image_width)
+    # summed from the daily counters, see annotator.statistics
+    return JsonResponse(get_date_range_statistics(start_date, end_date, granularity))
 
-    layout_table_data_graphs = [[justification_image, "", law_type_image]]
 
-    layout_table_graphs = Table(
-        layout_table_data_graphs, colWidths=[3.9 * inch, 0.18 * inch, 3.9 * inch]
-    )
-    layout_table_graphs.setStyle(
-        TableStyle(
-            [
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("BACKGROUND", (1, 0), (1, 0), colors.white),
-            ]
-        )
-    )
+def build_statistics_pdf(output, statistics):
+    # reportlab and matplotlib take most of the import time and memory of the
+    # views, they are only loaded once a report is generated
+    from .statistics_pdf import build_statistics_pdf
 
-    elements.append(layout_table_graphs)
+    return build_statistics_pdf(output, statistics)
 
-    centered_title_style = ParagraphStyle(
-        "CenteredTitle",
-        parent=styles["Normal"],
-        alignment=TA_CENTER,
-        fontSize=12,
-        spaceAfter=6,
-        fontName="Roboto-Bold",
-    )
 
-    monthly_counts = (
-        Document.objects.annotate(month=TruncMonth("created_at"))
-        .values("month")
-        .annotate(total=Count("id"))
-        .order_by("month")
+def _statistics_pdf_pending():
+    return JsonResponse(
+        {"message": "The report is being generated, try again later"},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Retry-After": "5"},
     )
 
-    # Prepare data for the monthly upload graph
-    months = [month["month"].strftime("%Y-%m") for month in monthly_counts]
-    counts = [month["total"] for month in monthly_counts]
-
-    # Generate the monthly upload graph image
-    monthly_upload_img = generate_bar_chart_image(counts, months, "darkorange", (10, 6))
-    monthly_upload_graph = resize_image(monthly_upload_img, 6 * inch)
-    month_graph_title = Paragraph("Статистика по месяцам", centered_title_style)
-    elements.extend(
-        [
-            month_graph_title,  # Title for the NPA table
-            Spacer(1, 0.1 * inch),  # Space between title and table
-            monthly_upload_graph,  # The NPA table
-            PageBreak(),
-        ]
-    )
 
-    # Mapping for NPA type names
-    npa_names = NPA
+@require_safe
+@async_login_required
+async def generate_statistics_pdf(request):
+    """
+    Serve the statistics report from the cache, generating it if the data changed.
+    ?force=1 regenerates the report even if it is cached.
+    """
+    statistics = await sync_to_async(get_document_statistics)()
+    fingerprint = statistics_fingerprint(statistics)
+    force = request.GET.get("force") == "1"
 
-    npa_title = Paragraph("Статистика по НПА", centered_title_style)
-    # Fetch NPA counts data and apply the mapping
-    npa_counts = (
-        Document.objects.values("NPA").annotate(total=Count("id")).order_by("-total")
+    report = (
+        None if force else await sync_to_async(get_cached_statistics_pdf)(fingerprint)
     )
-    npa_data = [
-        [npa_names.get(npa["NPA"], "Other"), npa["total"]] for npa in npa_counts
-    ]
-
-    # Create a table for NPA types
-    npa_table = Table(
-        npa_data, colWidths=[7.3 * inch, 0.7 * inch]
-    )  # Adjust column widths as needed
-    npa_table.setStyle(
-        TableStyle(
-            [
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-            ]
+    cache_status = "HIT"
+    if report is None:
+        cache_status = "MISS"
+        job = await sync_to_async(schedule_statistics_pdf)(
+            fingerprint, statistics, build_statistics_pdf, force=force
         )
-    )
-
-    # Add the NPA table to elements list
-    # Assume elements already contains other components like rectangles, other tables, etc.
-    elements.extend(
-        [
-            npa_title,  # Title for the NPA table
-            Spacer(1, 0.1 * inch),  # Space between title and table
-            npa_table,  # The NPA table
-            Spacer(1, 0.1 * inch),  # Space between table and next title
-        ]
-    )
-
-    # Create a table for justification_law_type
-    justification_law_type_title = Paragraph(
-        "Таблица сопоставления типов норм и обоснований", centered_title_style
-    )
-
-    justification_law_type_table_data = create_justification_law_type_table()
-
-    justification_law_type_table = Table(justification_law_type_table_data)
-
-    justification_law_type_table.setStyle(
-        TableStyle(
-            [
-                ("ALIGN", (0, 0), (-1, -1), "CENTER"),
-                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
-                ("FONTNAME", (0, 0), (-1, -1), "Roboto"),
-                ("TEXTCOLOR", (0, 0), (-1, -1), colors.black),
-                ("GRID", (0, 0), (-1, -1), 1, colors.black),
-                ("BACKGROUND", (0, 0), (0, -1), colors.lightblue),
-                ("BACKGROUND", (0, 0), (-1, 0), colors.orange),
-            ]
-        )
-    )
-    elements.extend(
-        [
-            justification_law_type_title,
-            Spacer(1, 0.1 * inch),
-            justification_law_type_table,
-        ]
-    )
-
-    # Build the PDF
-    doc.build(elements)
-
+        try:
+            # the report is built in the pdf_cache thread, no thread waits for it;
+            # the job is shared with other requests and must not be cancelled
+            report = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job)),
+                settings.STATISTICS_PDF_WAIT_TIMEOUT,
+            )
+        except TimeoutError:
+            return _statistics_pdf_pending()
+
+    try:
+        report_file = open(report["path"], "rb")
+    except FileNotFoundError:
+        # removed by the report of newer statistics since it was looked up
+        return _statistics_pdf_pending()
+    response = FileResponse(
+        report_file,
+        content_type="application/pdf",
+        as_attachment=True,
+        filename="statistics.pdf",
+    )
+    response["X-Cache"] = cache_status
+    response["X-Generated-At"] = report["generated_at"]
+    response["X-Generation-Time"] = str(report["generation_time"])
     return response
@@ -0,0 +1,228 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metrics of the request being handled, set only for sampled requests
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Query and serializer timings of one sampled request.
+    """
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.queries = 0
+        self.serializer_time = 0.0
+        self._statements = set()
+        self.duplicate_queries = 0
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection execute wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            statement = (sql, repr(params))
+            if statement in self._statements:
+                self.duplicate_queries += 1
+            else:
+                self._statements.add(statement)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection. Database connections are
+    per thread and the queries of an async view run in a worker thread, so the
+    metrics are found through the context of the request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created receiver, the wrappers outlive reconnections
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def stop_request_metrics(token):
+    _current.reset(token)
+
+
+@contextmanager
+def serializer_timer():
+    """
+    Add the time spent in the block to the serializer time of the request.
+    Nested serializers are only counted once.
+    """
+    metrics = _current.get()
+    if metrics is None or metrics._serializer_depth:
+        yield
+        return
+    metrics._serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - started
+        metrics._serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    """
+    Counts the representation time of a serializer in the request metrics.
+    """
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class MetricsRegistry:
+    """
+    Per-view aggregates of the handled requests, kept in the process memory.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.duration_sum = defaultdict(float)
+            self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self.sampled = defaultdict(int)
+            self.db_time = defaultdict(float)
+            self.queries = defaultdict(int)
+            self.duplicate_queries = defaultdict(int)
+            self.serializer_time = defaultdict(float)
+
+    def record(self, view, method, status, duration, metrics=None):
+        with self._lock:
+            self.requests[view, method, status] += 1
+            self.duration_sum[view] += duration
+            buckets = self.duration_buckets[view]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+            if metrics is not None:
+                self.sampled[view] += 1
+                self.db_time[view] += metrics.db_time
+                self.queries[view] += metrics.queries
+                self.duplicate_queries[view] += metrics.duplicate_queries
+                self.serializer_time[view] += metrics.serializer_time
+
+    def render(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for suffix, labels, value in samples:
+                label_text = ",".join(
+                    '{}="{}"'.format(key, _escape(str(label)))
+                    for key, label in labels.items()
+                )
+                lines.append("{}{}{{{}}} {}".format(name, suffix, label_text, value))
+
+        with self._lock:
+            metric(
+                "http_requests_total",
+                "counter",
+                "Handled requests.",
+                [
+                    ("", {"view": view, "method": method, "status": status}, total)
+                    for (view, method, status), total in sorted(self.requests.items())
+                ],
+            )
+
+            counts = defaultdict(int)
+            for (view, _, _), total in self.requests.items():
+                counts[view] += total
+            samples = []
+            for view in sorted(counts):
+                for bound, total in zip(DURATION_BUCKETS, self.duration_buckets[view]):
+                    samples.append(("_bucket", {"view": view, "le": bound}, total))
+                samples.append(("_bucket", {"view": view, "le": "+Inf"}, counts[view]))
+                samples.append(
+                    ("_sum", {"view": view}, "{:.6f}".format(self.duration_sum[view]))
+                )
+                samples.append(("_count", {"view": view}, counts[view]))
+            metric(
+                "http_request_duration_seconds",
+                "histogram",
+                "Request wall time.",
+                samples,
+            )
+
+            for name, help_text, values in [
+                (
+                    "http_sampled_requests_total",
+                    "Requests with query and serializer instrumentation.",
+                    self.sampled,
+                ),
+                (
+                    "db_query_duration_seconds_total",
+                    "Time spent in SQL queries by sampled requests.",
+                    self.db_time,
+                ),
+                (
+                    "db_queries_total",
+                    "SQL queries issued by sampled requests.",
+                    self.queries,
+                ),
+                (
+                    "db_duplicate_queries_total",
+                    "Repeated identical SQL queries within sampled requests.",
+                    self.duplicate_queries,
+                ),
+                (
+                    "serializer_duration_seconds_total",
+                    "Time spent in serializers by sampled requests.",
+                    self.serializer_time,
+                ),
+            ]:
+                metric(
+                    name,
+                    "counter",
+                    help_text,
+                    [
+                        ("", {"view": view}, _format_value(value))
+                        for view, value in sorted(values.items())
+                    ],
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return "{:.6f}".format(value)
+    return str(value)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
@@ -1,12 +1,118 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.utils import translation
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import registry, start_request_metrics, stop_request_metrics
+
+
+class ForceDefaultLanguageMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        translation.activate("ru")
+
+    def process_response(self, request, response):
+        translation.deactivate()
+        return response
+
 
+class RequestMetricsMiddleware:
+    """
+    Records the wall time of every request and, for a sampled share of them
+    (REQUEST_METRICS_SAMPLE_RATE), the SQL time, query count, duplicate queries
+    and serializer time. Reported in the Server-Timing header and in /metrics.
+
+    A streaming response produces its body while it is sent, so it is recorded
+    when it is closed; its Server-Timing header only covers the time until the
+    response started.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-class ForceDefaultLanguageMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # keeps the async views of the ASGI server async, see MiddlewareMixin
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        translation.activate("ru")
-        response = self.get_response(request)
-        translation.deactivate()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        metrics, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(token)
+        self.finish(request, response, started, metrics)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        metrics, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(token)
+        self.finish(request, response, started, metrics)
         return response
+
+    def start(self):
+        # the queries are recorded by ethical_index.metrics.record_query
+        if random.random() < settings.REQUEST_METRICS_SAMPLE_RATE:
+            return start_request_metrics()
+        return None, None
+
+    def stop(self, token):
+        if token is not None:
+            stop_request_metrics(token)
+
+    def finish(self, request, response, started, metrics):
+        match = request.resolver_match
+        # the route pattern keeps the number of label values bounded
+        view = match.route if match is not None else "unresolved"
+
+        def record():
+            registry.record(
+                view,
+                request.method,
+                response.status_code,
+                time.perf_counter() - started,
+                metrics,
+            )
+
+        if response.streaming:
+            # the server closes the response once the body has been sent,
+            # also when a file is sent with wsgi.file_wrapper
+            close = response.close
+            closed = []
+
+            def close_and_record():
+                try:
+                    close()
+                finally:
+                    # servers may close a response more than once
+                    if not closed:
+                        closed.append(True)
+                        record()
+
+            response.close = close_and_record
+        else:
+            record()
+        self.add_server_timing(response, time.perf_counter() - started, metrics)
+
+    def add_server_timing(self, response, duration, metrics):
+        timings = ["total;dur={:.1f}".format(duration * 1000)]
+        if metrics is not None:
+            timings.append(
+                'db;dur={:.1f};desc="{} queries, {} duplicate"'.format(
+                    metrics.db_time * 1000, metrics.queries, metrics.duplicate_queries
+                )
+            )
+            timings.append(
+                "serializer;dur={:.1f}".format(metrics.serializer_time * 1000)
+            )
+        response["Server-Timing"] = ", ".join(timings)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
+
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -67,6 +68,7 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
 }
 MIDDLEWARE = [
+    "ethical_index.middleware.RequestMetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -116,6 +118,25 @@ DATABASES = {
         "PORT": os.environ.get("DB_PORT", "5432"),
     }
 }
+if os.environ.get("DB_POOL", "1") == "1":
+    # Connections are pooled per worker process; the pool of a worker must cover
+    # its request threads, the classification workers and the report thread.
+    # GUNICORN_WORKERS * DB_POOL_MAX_SIZE must stay under max_connections of PostgreSQL
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 12)),
+            # seconds a request waits for a free connection before failing
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", 600)),
+            "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", 3600)),
+        }
+    }
+else:
+    # a persistent connection per thread instead
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("CONN_MAX_AGE", 60))
+# pooled and persistent connections are checked before they are handed out
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -159,6 +180,56 @@ else:
 
 APPEND_SLASH = True
 
+# Generated statistics reports, keyed by a fingerprint of the statistics data
+STATISTICS_PDF_CACHE_DIR = os.environ.get(
+    "STATISTICS_PDF_CACHE_DIR", BASE_DIR / "cache" / "statistics_pdf"
+)
+# How long a download waits for the report before answering 202 Accepted
+STATISTICS_PDF_WAIT_TIMEOUT = int(os.environ.get("STATISTICS_PDF_WAIT_TIMEOUT", 60))
+# Draw the report charts as vector graphics instead of embedding PNG images
+STATISTICS_PDF_VECTOR_CHARTS = (
+    os.environ.get("STATISTICS_PDF_VECTOR_CHARTS", "1") == "1"
+)
+# Gzip-compressed dataset exports, see api.snapshots
+DATASET_SNAPSHOT_DIR = os.environ.get(
+    "DATASET_SNAPSHOT_DIR", BASE_DIR / "cache" / "snapshots"
+)
+# Background threads writing snapshots; with 0 they are only written by the
+# build_snapshots management command
+DATASET_SNAPSHOT_WORKERS = int(os.environ.get("DATASET_SNAPSHOT_WORKERS", 1))
+# Internal nginx location the snapshot files are sent from, see nginx/default.conf;
+# if empty, the files are sent by the application server
+DATASET_SNAPSHOT_ACCEL_REDIRECT = os.environ.get(
+    "DATASET_SNAPSHOT_ACCEL_REDIRECT", "/protected/snapshots/" if PROD else ""
+)
+# Cached responses, stored under the versions kept in the database (see
+# annotator.versions), so a per-process cache is never stale; a shared backend
+# (e.g. django.core.cache.backends.filebased.FileBasedCache) lets several
+# worker processes reuse each other's responses
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "ethical-index"),
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+# Background threads classifying submitted legal acts; with 0 the jobs are
+# processed by the process_classification_jobs management command
+CLASSIFICATION_WORKERS = int(os.environ.get("CLASSIFICATION_WORKERS", 2))
+# Seconds without a heartbeat after which a running classification job is
+# considered abandoned by a stopped worker and queued again
+CLASSIFICATION_JOB_TIMEOUT = int(os.environ.get("CLASSIFICATION_JOB_TIMEOUT", 600))
+# Share of requests instrumented with query and serializer timings, see
+# ethical_index.middleware.RequestMetricsMiddleware
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get("REQUEST_METRICS_SAMPLE_RATE", 0.05))
+# Age of the change log entries a delta export waits for, so that transactions
+# committing after a change was numbered are not skipped, see annotator.changes
+CHANGES_SETTLE_SECONDS = int(os.environ.get("CHANGES_SETTLE_SECONDS", 5))
+# Bearer token of /api/metrics; without it only staff users can read the metrics
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -6,27 +6,55 @@ import {
   MenuItem,
   MenuList,
   Spinner,
+  useToast,
 } from "@chakra-ui/react";
 import { ChevronDownIcon } from "@chakra-ui/icons";
 import { BASE_URL } from "./apiRequest.jsx";
 
-function useAsyncClickHandler(url, fileName) {
+const SNAPSHOT_POLL_INTERVAL = 5000;
+// Five minutes: the snapshot may not be written at all, e.g. when the
+// background workers are disabled or the build fails
+const SNAPSHOT_POLL_ATTEMPTS = 60;
+
+// The dataset is downloaded from a snapshot file written by the server,
+// the browser saves it without parsing it
+function useSnapshotDownload(kind, fileName) {
   const [isLoading, setLoading] = useState(false);
+  const toast = useToast();
 
   const handleClick = async () => {
     setLoading(true);
     try {
-      const response = await fetch(url);
-      const data = await response.json();
-      const blob = new Blob([JSON.stringify(data, null, 2)], {
-        type: "application/json",
-      });
+      // the first request for a kind without a snapshot starts writing it
+      let snapshot = null;
+      for (let attempt = 0; !snapshot; attempt++) {
+        if (attempt >= SNAPSHOT_POLL_ATTEMPTS) {
+          throw new Error("Выгрузка еще не готова, попробуйте позже.");
+        }
+        if (attempt > 0) {
+          await new Promise((resolve) =>
+            setTimeout(resolve, SNAPSHOT_POLL_INTERVAL)
+          );
+        }
+        const response = await fetch(`${BASE_URL}/snapshots/`);
+        if (!response.ok) {
+          throw new Error("Не удалось получить список выгрузок.");
+        }
+        snapshot = (await response.json())[kind];
+      }
       const link = document.createElement("a");
-      link.href = URL.createObjectURL(blob);
+      link.href = `${BASE_URL}/snapshots/${kind}/`;
       link.download = fileName;
       link.click();
     } catch (err) {
       console.error(err);
+      toast({
+        title: "Ошибка скачивания",
+        description: err.message,
+        status: "error",
+        duration: 5000,
+        isClosable: true,
+      });
     } finally {
       setLoading(false);
     }
@@ -37,25 +65,25 @@ function useAsyncClickHandler(url, fileName) {
 
 function ExportMenu() {
   const [handleDownloadDocumentsClick, isDownloadDocumentsLoading] =
-    useAsyncClickHandler(
-      `${BASE_URL}/documents/`,
+    useSnapshotDownload(
+      "documents",
       `documents_${new Date(Date.now()).toLocaleDateString("en-US", {
         year: "numeric",
         month: "numeric",
         day: "numeric",
-      })}.json`
+      })}.json.gz`
     );
   const [handleDownloadAnnotationsClick, isDownloadAnnotationsLoading] =
-    useAsyncClickHandler(
-      `${BASE_URL}/export_annotations/`,
+    useSnapshotDownload(
+      "annotations",
       `annotations_${new Date(Date.now()).toLocaleDateString("en-US", {
         year: "numeric",
         month: "numeric",
         day: "numeric",
-      })}.json`
+      })}.json.gz`
     );
-  const [handleDownloadAllClick, isDownloadAllLoading] = useAsyncClickHandler(
-    `${BASE_URL}/export_all/`,
+  const [handleDownloadAllClick, isDownloadAllLoading] = useSnapshotDownload(
+    "all",
     `documents_with_annotations_${new Date(Date.now()).toLocaleDateString(
       "en-US",
       {
@@ -63,7 +91,7 @@ function ExportMenu() {
         month: "numeric",
         day: "numeric",
       }
-    )}.json`
+    )}.json.gz`
   );
 
   function isAuthenticated() {
@@ -0,0 +1,25 @@
+# gunicorn reads this file from the working directory, see the Dockerfile
+import os
+
+bind = "0.0.0.0:8000"
+# Processes may share the cached responses, see CACHES in ethical_index/settings.py
+workers = int(os.environ.get("GUNICORN_WORKERS", 1))
+
+# SERVER_MODE=asgi serves the ASGI application with uvicorn workers: async views
+# wait for the database and the report generation without holding a thread.
+# The default WSGI mode serves every request in one of `threads` threads, so a
+# long export does not hold up the short requests.
+if os.environ.get("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "ethical_index.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "ethical_index.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def post_worker_init(worker):
+    # resume the classification jobs left in the queue by a stopped server
+    from api.jobs import start_classification_workers
+
+    start_classification_workers()